@@ -1,5 +1,4 @@
 from __future__ import print_function
-import sys
 import os
 
 # get version info
@@ -8,18 +7,10 @@ __version__ = release_version
 __logo__ = logo
 
 # check environmental variable
+# keep the import of mintpy quiet and free of side effects on sys.path,
+# as it is done for every single script call.
 mintpy_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(1, mintpy_path)
-sys.path.insert(1, os.path.join(mintpy_path, 'defaults'))
-sys.path.insert(1, os.path.join(mintpy_path, 'objects'))
-sys.path.insert(1, os.path.join(mintpy_path, 'simulation'))
-sys.path.insert(1, os.path.join(mintpy_path, 'utils'))
-
-try:
-    os.environ['MINTPY_HOME']
-except KeyError:
-    print('Using default MintPy Path: %s' % (mintpy_path))
-    os.environ['MINTPY_HOME'] = mintpy_path
+os.environ.setdefault('MINTPY_HOME', mintpy_path)
 
 module_dependency_graph = """# level N depends on level N-1, N-2, ..., 0
 /mintpy
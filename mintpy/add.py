@@ -10,7 +10,7 @@ import os
 import sys
 import argparse
 import numpy as np
-from mintpy.utils import readfile, writefile
+from mintpy.utils import readfile, blockwise
 
 
 ################################################################################
@@ -29,6 +29,10 @@ def create_parser():
 
     parser.add_argument('file', nargs='+', help='files (2 or more) to be added')
     parser.add_argument('-o', '--output', dest='outfile', help='output file name')
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     return parser
 
 
@@ -52,10 +56,20 @@ def add_matrix(data1, data2):
     return data
 
 
-def add_file(fnames, out_file=None):
+def add_block(data_list, block):
+    """Sum kernel for blockwise.process_file()"""
+    data = data_list[0]
+    for d in data_list[1:]:
+        data = add_matrix(data, d)
+    return data
+
+
+def add_file(fnames, out_file=None, max_memory=2, num_worker=1):
     """Generate sum of all input files
     Parameters: fnames : list of str, path/name of input files to be added
                 out_file : str, optional, path/name of output file
+                max_memory : float, maximum memory in GB for each block
+                num_worker : int, number of parallel processes
     Returns:    out_file : str, path/name of output file
     Example:    'mask_all.h5' = add_file(['mask_1.h5','mask_2.h5','mask_3.h5'], 'mask_all.h5')
     """
@@ -67,26 +81,15 @@ def add_file(fnames, out_file=None):
             out_file += '_plus_' + os.path.splitext(os.path.basename(fnames[i]))[0]
         out_file += ext
 
-    dsDict = {}
-    dsNames = readfile.get_dataset_list(fnames[0])
-    for dsName in dsNames:
-        # ignore dsName if input file has single dataset
-        if len(dsNames) == 1:
-            dsName2read = None
-        else:
-            dsName2read = dsName
-
-        print('adding {} ...'.format(dsName))
-        data = readfile.read(fnames[0], datasetName=dsName2read)[0]
-        for i in range(1, len(fnames)):
-            d = readfile.read(fnames[i], datasetName=dsName2read)[0]
-            data = add_matrix(data, d)
-        dsDict[dsName] = data
-
-    # output
+    # add block by block, the only dataset is used for files with single dataset
     atr = readfile.read_attribute(fnames[0])
     print('use metadata from the 1st file: {}'.format(fnames[0]))
-    writefile.write(dsDict, out_file=out_file, metadata=atr, ref_file=fnames[0])
+    blockwise.process_file(fnames, out_file,
+                           func=add_block,
+                           metadata=atr,
+                           ref_file=fnames[0],
+                           max_memory=max_memory,
+                           num_worker=num_worker)
     return out_file
 
 
@@ -95,7 +98,9 @@ def main(iargs=None):
     inps = cmd_line_parse(iargs)
     print('input files to be added: ({})\n{}'.format(len(inps.file), inps.file))
 
-    inps.outfile = add_file(inps.file, inps.outfile)
+    inps.outfile = add_file(inps.file, inps.outfile,
+                            max_memory=inps.max_memory,
+                            num_worker=inps.num_worker)
 
     print('Done.')
     return inps.outfile
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+
+
+import os
+import argparse
+from mintpy.utils import writefile
+
+
+###########################################################################################
+EXAMPLE = """Example:
+  add_overview.py  timeseries.h5
+  add_overview.py  ifgramStack.h5  -d unwrapPhase coherence
+  add_overview.py  velocity.h5     -f 4 16
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Add multi-resolution overviews to HDF5 file for fast display',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+
+    parser.add_argument('file', type=str, help='HDF5 file of interest')
+    parser.add_argument('-d', '--dset', dest='dset', type=str, nargs='*',
+                        help='dataset(s) to add overviews for. Default: all 2D/3D datasets.')
+    parser.add_argument('-f', '--factor', dest='factor', type=int, nargs='*',
+                        help='downsampling factor(s) of overviews.\n'
+                             'Default: 2, 4, 8, ... until the overview is smaller than 64 pixels.')
+    return parser
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+    if os.path.splitext(inps.file)[1] not in ['.h5', '.he5']:
+        raise ValueError('input file is not HDF5: {}'.format(inps.file))
+    return inps
+
+
+###########################################################################################
+def main(iargs=None):
+    inps = cmd_line_parse(iargs)
+    writefile.write_overview(inps.file,
+                             factors=inps.factor,
+                             datasetNames=inps.dset,
+                             print_msg=True)
+    print('Done.')
+    return inps.file
+
+
+###########################################################################################
+if __name__ == '__main__':
+    main()
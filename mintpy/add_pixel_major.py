@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+
+
+import os
+import argparse
+from mintpy.utils import writefile
+
+
+###########################################################################################
+EXAMPLE = """Example:
+  add_pixel_major.py  timeseries.h5
+  add_pixel_major.py  ifgramStack.h5  -d unwrapPhase coherence
+  add_pixel_major.py  timeseries_ECMWF_demErr.h5  --tile-size 32
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Add pixel-major (time-contiguous) companion of 3D datasets\n'
+                                                 'to HDF5 file for fast point time-series reading',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+
+    parser.add_argument('file', type=str, help='HDF5 file of interest')
+    parser.add_argument('-d', '--dset', dest='dset', type=str, nargs='*',
+                        help='3D dataset(s) to add the companion for. Default: all 3D datasets.')
+    parser.add_argument('--tile-size', dest='tile_size', type=int, default=16,
+                        help='chunk size in space of the companion dataset (default: %(default)s).')
+    return parser
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+    if os.path.splitext(inps.file)[1] not in ['.h5', '.he5']:
+        raise ValueError('input file is not HDF5: {}'.format(inps.file))
+    return inps
+
+
+###########################################################################################
+def main(iargs=None):
+    inps = cmd_line_parse(iargs)
+    writefile.write_pixel_major(inps.file,
+                                datasetNames=inps.dset,
+                                tile_size=inps.tile_size,
+                                print_msg=True)
+    print('Done.')
+    return inps.file
+
+
+###########################################################################################
+if __name__ == '__main__':
+    main()
@@ -7,8 +7,9 @@
 
 import os
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.utils import resample
-from mintpy.utils import readfile, writefile
+from mintpy.utils import readfile, writefile, blockwise
 from mintpy.utils import ptime
 
 def createParser():
@@ -22,6 +23,9 @@ def createParser():
     parser.add_argument('-w', '--workdir', dest='workdir', type=str, default='./', help='Specify directory to deposit all outputs. Default is local directory where script is launched.')
     parser.add_argument('-nb', '--nboot', dest='bootCount', type=int, default=400, help='Number of bootstrap runs (default: 400)')
     parser.add_argument('-o', '--output', dest='outfile', type=str, default='bootVel.h5', help='Name of output file (default: bootVel.h5)')
+    parser.add_argument('--seed', dest='seed', type=int, help='Seed of the random resampling, for reproducible results (default: None)')
+    parser.add_argument('--memory', dest='maxMemory', type=float, default=2, help='Max memory in GB for each block of time-series (default: 2)')
+    parser.add_argument('--num-worker', dest='numWorker', type=int, default=1, help='Number of parallel processes (default: 1)')
 
     return parser
 
@@ -29,50 +33,114 @@ def cmdLineParse(iargs = None):
     parser = createParser()
     return parser.parse_args(args=iargs)
 
-def bootstrap(timeseriesFile,bootCount):
-    ts_data, atr = readfile.read(timeseriesFile)
+def get_boot_weight(dateList, bootCount, seed=None):
+    '''
+        Resample the dates with replacement for all bootstrap runs at once, and convert the velocity row of
+        pinv(A) of each run into the weight of the original dates, with duplicated dates summed up, so that
+        the velocities of all runs are: np.dot(bootWeight, tsData) in size of (bootCount, numPixel)
+    '''
+    rng = np.random.RandomState(seed)
+    sampleNo = len(dateList)
+    bootWeight = np.zeros((bootCount, sampleNo), dtype=np.float64)
+    for i in range(bootCount):
+        bootIdx = np.sort(resample(np.arange(sampleNo), replace=True, n_samples=sampleNo, random_state=rng))
+        bootSamples = [dateList[j] for j in bootIdx]
+        A = readfile.timeseries.get_design_matrix4average_velocity(bootSamples)
+        bootWeight[i] = np.bincount(bootIdx, weights=np.linalg.pinv(A)[0], minlength=sampleNo)
+    return bootWeight
+
+def bootstrap_patch(timeseriesFile, box, bootWeight, scale=1.):
+    '''
+        Mean and standard deviation of the bootstrap velocities of one box, accumulated online over
+        batches of runs (Welford, 1962; Chan et al., 1979), to keep one batch of velocities in memory.
+    '''
+    ts_data = readfile.read(timeseriesFile, box=box)[0]
+    if scale != 1.:
+        ts_data *= scale
+    numDate = ts_data.shape[0]
+    ts_data = ts_data.reshape(numDate, -1)
+
+    # batch of runs no larger than the number of dates, within the block memory of blockwise.get_block_list()
+    bootCount = bootWeight.shape[0]
+    batchSize = max(1, numDate)
+    num = 0
+    velMean = np.zeros(ts_data.shape[1], dtype=np.float64)
+    velM2 = np.zeros(ts_data.shape[1], dtype=np.float64)
+    for i0 in range(0, bootCount, batchSize):
+        vel = np.dot(bootWeight[i0:i0+batchSize], ts_data)
+        numBatch = vel.shape[0]
+        batchMean = vel.mean(axis=0)
+        vel -= batchMean
+        batchM2 = np.sum(vel**2, axis=0)
+
+        # combine the statistics of the batch with the previous ones
+        delta = batchMean - velMean
+        numTotal = num + numBatch
+        velMean += delta * (numBatch / numTotal)
+        velM2 += batchM2 + delta**2 * (num * numBatch / numTotal)
+        num = numTotal
+
+    shape = (box[3] - box[1], box[2] - box[0])
+    velStd = np.sqrt(velM2 / num)
+    return velMean.reshape(shape), velStd.reshape(shape)
+
+def bootstrap(timeseriesFile, bootCount, seed=None, maxMemory=2, numWorker=1):
+    atr = readfile.read_attribute(timeseriesFile)
     tsData = readfile.timeseries(timeseriesFile)
-    if atr['UNIT'] == 'mm':
-        ts_data *= 1./1000.
+    scale = 1./1000. if atr['UNIT'] == 'mm' else 1.
 
     length, width = int(atr['LENGTH']), int(atr['WIDTH'])
     dateList = tsData.get_date_list()
     sampleNo = len(dateList)
-    vel = np.zeros((bootCount,(length*width)))
-    prog_bar = ptime.progressBar(maxValue=bootCount,prefix='Calculating ')
-    for i in range(bootCount):
-        bootSamples = list(np.sort(resample(dateList, replace=True, n_samples=sampleNo)))
-        # dropList = [x for x in dateList if x not in bootSamples]
-
-        prog_bar.update(i+1, suffix='Running boot number: '+str(i+1))
-        bootList = []
-        for k in bootSamples:
-            bootList.append(dateList.index(k))
-        numDate = len(bootList)
-        ts_data_sub = ts_data[bootList, :, :].reshape(numDate, -1)
-
-        A = tsData.get_design_matrix4average_velocity(bootSamples)
-        X = np.dot(np.linalg.pinv(A), ts_data_sub)
-        vel[i] = np.array(X[0, :], dtype='float32')
 
+    # resampled dates and their pseudo-inverses, generated once for all blocks
+    bootWeight = get_boot_weight(dateList, bootCount, seed=seed)
+
+    # stream the time-series in blocks of rows, with runs of each block done in batches
+    # memory per block: time-series in float32 + one batch of velocities in float64
+    block_list = blockwise.get_block_list((sampleNo, length, width), num_file=2, split_z=False,
+                                          max_memory=maxMemory, num_worker=numWorker)
+    box_list = [(0, y0, width, y1) for (z0, z1, y0, y1) in block_list]
+    num_box = len(box_list)
+
+    velMean = np.zeros((length, width), dtype=np.float64)
+    velStd = np.zeros((length, width), dtype=np.float64)
+    pool = ProcessPoolExecutor(max_workers=numWorker) if numWorker > 1 else None
+    map_func = pool.map if pool else map
+    prog_bar = ptime.progressBar(maxValue=num_box, prefix='Calculating ')
+    try:
+        results = map_func(bootstrap_patch,
+                           [timeseriesFile] * num_box,
+                           box_list,
+                           [bootWeight] * num_box,
+                           [scale] * num_box)
+        for i, (box, (boxMean, boxStd)) in enumerate(zip(box_list, results)):
+            velMean[box[1]:box[3], :] = boxMean
+            velStd[box[1]:box[3], :] = boxStd
+            prog_bar.update(i+1, suffix='{} boot runs of block {}/{}'.format(bootCount, i+1, num_box))
+    finally:
+        if pool:
+            pool.shutdown()
     prog_bar.close()
     print('Finished resampling and velocity calculation')
-    velMean = vel.mean(axis=0).reshape(length,width)
-    velStd = vel.std(axis=0).reshape(length,width)
     print('Calculated mean and standard deviation of bootstrap estimations')
 
     atr['FILE_TYPE'] = 'velocity'
     atr['UNIT'] = 'm/year'
-    atr['START_DATE'] = bootSamples[0]
-    atr['END_DATE'] = bootSamples[-1]
-    atr['DATE12'] = '{}_{}'.format(bootSamples[0], bootSamples[-1])
+    atr['START_DATE'] = dateList[0]
+    atr['END_DATE'] = dateList[-1]
+    atr['DATE12'] = '{}_{}'.format(dateList[0], dateList[-1])
 
     return velMean, velStd, atr
 
 def main(iargs=None):
     inps = cmdLineParse(iargs)
 
-    velMean, velStd, atr = bootstrap(inps.timeseriesFile,inps.bootCount)
+    velMean, velStd, atr = bootstrap(inps.timeseriesFile,
+                                     inps.bootCount,
+                                     seed=inps.seed,
+                                     maxMemory=inps.maxMemory,
+                                     numWorker=inps.numWorker)
 
     # write to HDF5 file
     dsDict = dict()
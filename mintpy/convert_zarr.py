@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+
+
+import os
+import argparse
+from mintpy.objects import is_zarr_file
+from mintpy.utils import writefile
+
+
+###########################################################################################
+EXAMPLE = """Example:
+  convert_zarr.py  timeseries.h5                             #output timeseries.zarr
+  convert_zarr.py  inputs/ifgramStack.h5  -o inputs/ifgramStack.zarr
+  convert_zarr.py  timeseries.zarr  -o timeseries.h5  --comp lzf
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Convert between HDF5 file and Zarr directory store\n'
+                                                 'Zarr store allows concurrent writers, e.g. parallel workers.',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+
+    parser.add_argument('file', type=str, help='HDF5 file (*.h5) or Zarr store (*.zarr) to convert')
+    parser.add_argument('-o', '--output', dest='outfile',
+                        help='output file name, default is the input with the other extension.')
+    parser.add_argument('--comp','--compression', dest='compression', default='auto',
+                        choices={'auto', 'no', 'lzf', 'gzip'},
+                        help='compression of the output datasets (default: %(default)s).\n'
+                             'auto - the same as the input datasets')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
+    return parser
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+
+    fext = os.path.splitext(inps.file.rstrip('/'))[1].lower()
+    if fext not in ['.h5', '.he5', '.zarr']:
+        raise ValueError('input file is neither HDF5 nor Zarr: {}'.format(inps.file))
+    if not inps.outfile:
+        out_ext = '.h5' if is_zarr_file(inps.file) else '.zarr'
+        inps.outfile = os.path.splitext(inps.file.rstrip('/'))[0] + out_ext
+    if is_zarr_file(inps.file) == is_zarr_file(inps.outfile):
+        raise ValueError('input and output files are in the same format: {}, {}'.format(inps.file, inps.outfile))
+    if inps.compression == 'no':
+        inps.compression = None
+    return inps
+
+
+###########################################################################################
+def main(iargs=None):
+    inps = cmd_line_parse(iargs)
+    writefile.convert_store(inps.file,
+                            inps.outfile,
+                            compression=inps.compression,
+                            max_memory=inps.max_memory,
+                            print_msg=True)
+    print('Done.')
+    return inps.outfile
+
+
+###########################################################################################
+if __name__ == '__main__':
+    main()
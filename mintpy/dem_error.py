@@ -9,10 +9,11 @@
 import os
 import time
 import argparse
+import h5py
 import numpy as np
 from scipy import linalg
 from scipy.special import gamma
-from mintpy.utils import ptime, readfile, writefile, utils as ut
+from mintpy.utils import ptime, readfile, writefile, blockwise, utils as ut
 from mintpy.objects import timeseries, geometry
 
 
@@ -93,6 +94,8 @@ def create_parser():
                         help='Use phase velocity instead of phase for inversion constrain.')
     parser.add_argument('-p', '--poly-order', dest='polyOrder', type=int, default=2,
                         help='polynomial order number of temporal deformation model, default = 2')
+    parser.add_argument('--memory', dest='maxMemory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     parser.add_argument('--update', dest='update_mode', action='store_true',
                         help='Enable update mode, and skip inversion if:\n'+
                              '1) output timeseries file already exists, readable '+
@@ -333,31 +336,20 @@ def estimate_dem_error(ts0, A0, tbase, drop_date=None, phaseVelocity=False, num_
     return delta_z, ts_cor, ts_res, step_def
 
 
-def correct_dem_error(inps, A_def):
-    """Correct DEM error of input timeseries file"""
-    # Read Date Info
-    ts_obj = timeseries(inps.timeseries_file)
-    ts_obj.open()
-    num_date = ts_obj.numDate
-    num_pixel = ts_obj.numPixel
-    tbase = np.array(ts_obj.tbase, np.float32) / 365.25
-
-    num_step = len(inps.stepFuncDate)
-    drop_date, inps.excludeDate = read_exclude_date(inps.excludeDate, ts_obj.dateList)
-    if inps.polyOrder > np.sum(drop_date):
-        raise ValueError(("input poly order {} > number of acquisition {}!"
-                          " Reduce it!").format(inps.polyOrder, np.sum(drop_date)))
-
-    # Read time-series Data
-    ts_data = ts_obj.read(print_msg=True).reshape((num_date, -1))
-
-    ##-------------------------------- Loop for L2-norm inversion  --------------------------------##
-    print('inverting DEM error ...')
+def correct_dem_error_patch(ts_data, A_def, inps, tbase, drop_date, num_step=0, box=None, width=None):
+    """Correct DEM error of one patch of time-series.
+    Parameters: ts_data : 2D np.ndarray in size of (num_date, num_pixel), time-series of the patch
+                A_def   : 2D np.ndarray in size of (num_date, num_param), design matrix of deformation model
+                inps    : Namespace with geometry from read_geometry(), for the whole file
+                box     : tuple of 4 int, (x0, y0, x1, y1) of the full-width patch, None for the whole file
+                width   : int, width of the file, to locate the patch in the geometry
+    Returns:    delta_z, ts_cor, ts_res, step_model : np.ndarray in size of (1 / num_date / num_step, num_pixel)
+    """
+    num_date, num_pixel = ts_data.shape
     delta_z = np.zeros(num_pixel, dtype=np.float32)
     ts_cor = np.zeros((num_date, num_pixel), dtype=np.float32)
     ts_res = np.zeros((num_date, num_pixel), dtype=np.float32)
-    if num_step > 0:
-        step_model = np.zeros((num_step, num_pixel), dtype=np.float32)
+    step_model = np.zeros((num_step, num_pixel), dtype=np.float32)
 
     # initiate mask based on time-series
     print('skip pixels with ZERO in ALL acquisitions')
@@ -384,9 +376,15 @@ def correct_dem_error(inps, A_def):
         if num_step > 0:
             step_model[:, mask] = step_model_i
     else:
+        # geometry of the patch
+        idx0, idx1 = (box[1] * width, box[3] * width) if box else (0, num_pixel)
+        range_dist = inps.rangeDist[idx0:idx1]
+        sin_inc_angle = inps.sinIncAngle[idx0:idx1]
+        pbase = inps.pbase[:, idx0:idx1] if inps.pbase.shape[1] != 1 else inps.pbase
+
         # update mask based on geometry
         print('skip pixels with ZERO / NaN value in incidenceAngle / slantRangeDistance')
-        for geom_data in [inps.sinIncAngle, inps.rangeDist]:
+        for geom_data in [sin_inc_angle, range_dist]:
             mask *= geom_data != 0.
             mask *= ~np.isnan(geom_data)
 
@@ -399,10 +397,10 @@ def correct_dem_error(inps, A_def):
 
         # update data matrix to save memory and IO
         ts_data = ts_data[:, mask]
-        inps.rangeDist = inps.rangeDist[mask]
-        inps.sinIncAngle = inps.sinIncAngle[mask]
-        if inps.pbase.shape[1] != 1:
-            inps.pbase = inps.pbase[:, mask]
+        range_dist = range_dist[mask]
+        sin_inc_angle = sin_inc_angle[mask]
+        if pbase.shape[1] != 1:
+            pbase = pbase[:, mask]
 
         # loop pixel by pixel
         prog_bar = ptime.progressBar(maxValue=num_pixel2inv)
@@ -411,11 +409,11 @@ def correct_dem_error(inps, A_def):
             idx = idx_pixel2inv[i]
 
             # design matrix
-            if inps.pbase.shape[1] == 1:
-                pbase = inps.pbase
+            if pbase.shape[1] == 1:
+                pbase_i = pbase
             else:
-                pbase = inps.pbase[:, i].reshape(-1, 1)
-            A_geom = pbase / (inps.rangeDist[i] * inps.sinIncAngle[i])
+                pbase_i = pbase[:, i].reshape(-1, 1)
+            A_geom = pbase_i / (range_dist[i] * sin_inc_angle[i])
             A = np.hstack((A_geom, A_def))
 
             (delta_z_i,
@@ -432,15 +430,42 @@ def correct_dem_error(inps, A_def):
             if num_step > 0:
                 step_model[:, idx:idx+1] = step_model_i
         prog_bar.close()
-    del ts_data
+    return delta_z, ts_cor, ts_res, step_model
+
+
+def write_dem_error_block(out_files, data_list, box):
+    """Write one block of the outputs (demErr, ts_cor, ts_res, step_model) into the laid out files."""
+    x0, y0, x1, y1 = box
+    num_row, num_col = y1 - y0, x1 - x0
+    for fname, data in zip(out_files, data_list):
+        dsName = 'dem' if data.ndim == 1 else 'timeseries'
+        with h5py.File(fname, 'a') as f:
+            if dsName == 'dem':
+                f[dsName][y0:y1, x0:x1] = data.reshape(num_row, num_col)
+            else:
+                f[dsName][:, y0:y1, x0:x1] = data.reshape(-1, num_row, num_col)
+    return out_files
+
+
+def correct_dem_error(inps, A_def):
+    """Correct DEM error of input timeseries file block by block,
+    with the next block read and the previous block written on background threads.
+    """
+    # Read Date Info
+    ts_obj = timeseries(inps.timeseries_file)
+    ts_obj.open()
+    num_date = ts_obj.numDate
+    length, width = ts_obj.length, ts_obj.width
+    tbase = np.array(ts_obj.tbase, np.float32) / 365.25
+
+    num_step = len(inps.stepFuncDate)
+    drop_date, inps.excludeDate = read_exclude_date(inps.excludeDate, ts_obj.dateList)
+    if inps.polyOrder > np.sum(drop_date):
+        raise ValueError(("input poly order {} > number of acquisition {}!"
+                          " Reduce it!").format(inps.polyOrder, np.sum(drop_date)))
 
     ##---------------------------------------- Output  -----------------------------------------##
     # prepare for output
-    ts_cor = ts_cor.reshape((num_date, ts_obj.length, ts_obj.width))
-    ts_res = ts_res.reshape((num_date, ts_obj.length, ts_obj.width))
-    delta_z = delta_z.reshape((ts_obj.length, ts_obj.width))
-    if num_step > 0:
-        step_model = step_model.reshape((num_step, ts_obj.length, ts_obj.width))
     atr = dict(ts_obj.metadata)
 
     # config parameter
@@ -449,30 +474,65 @@ def correct_dem_error(inps, A_def):
         atr[key_prefix+key] = str(vars(inps)[key])
 
     # 1. Estimated DEM error
-    outfile = 'demErr.h5'
+    out_files = ['demErr.h5']
     atr['FILE_TYPE'] = 'dem'
     atr['UNIT'] = 'm'
-    writefile.write(delta_z, out_file=outfile, metadata=atr)
+    writefile.layout_hdf5(out_files[0], {'dem': [np.float32, (length, width)]}, metadata=atr)
 
     # 2. Time-series corrected for DEM error
-    atr['FILE_TYPE'] = 'timeseries'
-    writefile.write(ts_cor, out_file=inps.outfile, metadata=atr, ref_file=ts_obj.file)
-
     # 3. Time-series of inversion residual
-    ts_ref_file = os.path.join(os.path.dirname(inps.outfile), 'timeseriesResidual.h5')
-    writefile.write(ts_res, out_file=ts_ref_file, metadata=atr, ref_file=ts_obj.file)
+    atr['FILE_TYPE'] = 'timeseries'
+    compression = readfile.get_hdf5_compression(ts_obj.file)
+    ts_res_file = os.path.join(os.path.dirname(inps.outfile), 'timeseriesResidual.h5')
+    for fname in [inps.outfile, ts_res_file]:
+        writefile.layout_hdf5(fname, {'timeseries': [np.float32, (num_date, length, width)]},
+                              metadata=atr, ref_file=ts_obj.file, compression=compression)
+        out_files.append(fname)
 
     # 4. Time-series of estimated Step Model
     if num_step > 0:
         atr.pop('REF_DATE')
-        step_obj = timeseries(os.path.join(os.path.dirname(inps.outfile), 'timeseriesStepModel.h5'))
-        step_obj.write2hdf5(data=step_model, metadata=atr, dates=inps.stepFuncDate)
+        step_file = os.path.join(os.path.dirname(inps.outfile), 'timeseriesStepModel.h5')
+        ds_name_dict = {'date': [np.dtype('S8'), (num_step,)],
+                        'timeseries': [np.float32, (num_step, length, width)]}
+        writefile.layout_hdf5(step_file, ds_name_dict, metadata=atr)
+        with h5py.File(step_file, 'a') as f:
+            f['date'][:] = np.array(inps.stepFuncDate, dtype=np.string_)
+        out_files.append(step_file)
 
     ## 5. Time-series of estimated Deformation Model = poly model + step model
     #ts_def_obj = timeseries(os.path.join(os.path.dirname(inps.outfile), 'timeseriesDefModel.h5'))
     #ts_def_obj.write2hdf5(data=ts_cor - ts_res, refFile=ts_obj.file)
     #del ts_cor, ts_res
 
+    ##-------------------------------- Loop for L2-norm inversion  --------------------------------##
+    # split into blocks in rows, with the outputs (3 3D matrices) and the input in memory
+    block_list = blockwise.get_block_list((num_date, length, width), num_file=4, split_z=False,
+                                          max_memory=inps.maxMemory)
+    box_list = [(0, y0, width, y1) for z0, z1, y0, y1 in block_list]
+    read_args = [(ts_obj.file, 'timeseries', [0, num_date, y0, y1, 0, width]) for z0, z1, y0, y1 in block_list]
+    ts_data_list = blockwise.prefetch(blockwise.read_block, read_args)
+
+    print('inverting DEM error ...')
+    with blockwise.AsyncWriter() as writer:
+        for i, (box, ts_data) in enumerate(zip(box_list, ts_data_list)):
+            if len(box_list) > 1:
+                print('\n------- processing patch {} out of {} in box {} --------------'.format(
+                    i+1, len(box_list), box))
+
+            data_list = correct_dem_error_patch(ts_data.reshape(num_date, -1),
+                                                A_def, inps,
+                                                tbase=tbase,
+                                                drop_date=drop_date,
+                                                num_step=num_step,
+                                                box=box,
+                                                width=width)
+            del ts_data
+            writer.submit(write_dem_error_block, out_files, data_list, box)
+
+    for fname in out_files:
+        readfile.clear_metadata_cache(fname)
+        print('finished writing to {}'.format(fname))
     return inps
 
 
@@ -8,9 +8,11 @@
 import os
 import time
 import argparse
+from functools import partial
+import h5py
 import numpy as np
 from mintpy.objects import timeseries, giantTimeseries, ifgramStack, ifgramDatasetNames
-from mintpy.utils import readfile, writefile
+from mintpy.utils import readfile, blockwise
 
 
 #####################################################################################
@@ -37,6 +39,10 @@ def create_parser():
                         help='output file name, default is file1_diff_file2.h5')
     parser.add_argument('--force', action='store_true',
                         help='Enforce the differencing for the shared dates only for time-series files')
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     return parser
 
 
@@ -68,7 +74,68 @@ def _check_reference(atr1, atr2):
     return ref_date, ref_y, ref_x
 
 
-def diff_file(file1, file2, outFile=None, force=False):
+def diff_timeseries_block(data_list, block, file2, date_list, date_flag, unit_fac=1.,
+                          ref_date=None, ref_value=None):
+    """Difference kernel of time-series files for blockwise.process_file()
+    Parameters: date_list : list of str, dates of the 1st file
+                date_flag : 1D np.ndarray of bool, dates of the 1st file shared by file2
+                ref_date  : str, reference date of the 1st file, if different from file2
+                ref_value : 1D np.ndarray, value of file2 at the reference pixel of the 1st file,
+                            for the shared dates, if the reference pixels are different
+    """
+    z0, z1, y0, y1, x0, x1 = block
+    data = data_list[0]
+    flag = date_flag[z0:z1]
+    if not np.any(flag):
+        return data
+
+    # consider different reference_date/pixel
+    box = (x0, y0, x1, y1)
+    dates = [d for d, f in zip(date_list[z0:z1], flag) if f]
+    data2 = readfile.read(file2, datasetName=dates, box=box, print_msg=False)[0]
+    data2 = data2.reshape(len(dates), y1-y0, x1-x0) * unit_fac
+    if ref_date:
+        data2 -= readfile.read(file2, datasetName=ref_date, box=box, print_msg=False)[0] * unit_fac
+    if ref_value is not None:
+        idx = np.cumsum(date_flag)[z0:z1][flag] - 1
+        data2 -= ref_value[idx].reshape(-1, 1, 1)
+
+    mask = data == 0.
+    data[flag] -= data2
+    data[mask] = 0.               # Do not change zero phase value
+    return data
+
+
+def diff_ifgram_block(data_list, block, ref1=None, ref2=None):
+    """Difference kernel of ifgramStack files for blockwise.process_file()
+    Parameters: ref1/2 : 1D np.ndarray, value at the reference pixel of each interferogram
+    """
+    data1, data2 = data_list
+    z0, z1 = block[:2]
+    if ref1 is not None:
+        for i in range(data1.shape[0]):
+            data1[i,:][data1[i, :] != 0.] -= ref1[z0+i]
+            data2[i,:][data2[i, :] != 0.] -= ref2[z0+i]
+
+    # operation and ignore zero values
+    data1[data1 == 0] = np.nan
+    data2[data2 == 0] = np.nan
+    data = data1 - data2
+    data[np.isnan(data)] = 0.
+    return data
+
+
+def diff_block(data_list, block):
+    """Difference kernel of single dataset files for blockwise.process_file()"""
+    data1 = data_list[0]
+    data = np.array(data1, data1.dtype)
+    for data2 in data_list[1:]:
+        data = np.array(data, dtype=np.float32) - np.array(data2, dtype=np.float32)
+        data = np.array(data, data1.dtype)
+    return data
+
+
+def diff_file(file1, file2, outFile=None, force=False, max_memory=2, num_worker=1):
     """Subtraction/difference of two input files"""
     if not outFile:
         fbase, fext = os.path.splitext(file1)
@@ -116,20 +183,25 @@ def diff_file(file1, file2, outFile=None, force=False):
                 raise Exception('To enforce the differencing anyway, use --force option.')
 
         # consider different reference_date/pixel
-        data2 = readfile.read(file2[0], datasetName=dateListShared)[0] * unit_fac
-        if ref_date:
-            data2 -= np.tile(data2[dateListShared.index(ref_date), :, :],
-                             (data2.shape[0], 1, 1))
+        ref_value = None
         if ref_y and ref_x:
-            data2 -= np.tile(data2[:, ref_y, ref_x].reshape(-1, 1, 1),
-                             (1, data2.shape[1], data2.shape[2]))
-
-        data = obj1.read()
-        mask = data == 0.
-        data[dateShared] -= data2
-        data[mask] = 0.               # Do not change zero phase value
-        del data2
-        writefile.write(data, out_file=outFile, ref_file=file1)
+            box = (ref_x, ref_y, ref_x+1, ref_y+1)
+            ref_value = readfile.read(file2[0], datasetName=dateListShared, box=box)[0].flatten() * unit_fac
+            if ref_date:
+                ref_value -= ref_value[dateListShared.index(ref_date)]
+
+        blockwise.process_file(file1, outFile,
+                               func=partial(diff_timeseries_block,
+                                            file2=file2[0],
+                                            date_list=obj1.dateList,
+                                            date_flag=dateShared,
+                                            unit_fac=unit_fac,
+                                            ref_date=ref_date,
+                                            ref_value=ref_value),
+                               datasetNames=['timeseries'],
+                               ref_file=file1,
+                               max_memory=max_memory,
+                               num_worker=num_worker)
 
     elif all(i == 'ifgramStack' for i in [k1, k2]):
         obj1 = ifgramStack(file1)
@@ -141,43 +213,31 @@ def diff_file(file1, file2, outFile=None, force=False):
             raise ValueError('no common dataset between two files!')
         dsName = [i for i in ifgramDatasetNames if i in dsNames][0]
 
-        # read data
-        print('reading {} from file {} ...'.format(dsName, file1))
-        data1 = readfile.read(file1, datasetName=dsName)[0]
-        print('reading {} from file {} ...'.format(dsName, file2[0]))
-        data2 = readfile.read(file2[0], datasetName=dsName)[0]
-
         # consider reference pixel
+        ref1, ref2 = None, None
         if 'unwrapphase' in dsName.lower():
             print('referencing to pixel ({},{}) ...'.format(obj1.refY, obj1.refX))
-            ref1 = data1[:, obj1.refY, obj1.refX]
-            ref2 = data2[:, obj2.refY, obj2.refX]
-            for i in range(data1.shape[0]):
-                data1[i,:][data1[i, :] != 0.] -= ref1[i]
-                data2[i,:][data2[i, :] != 0.] -= ref2[i]
-
-        # operation and ignore zero values
-        data1[data1 == 0] = np.nan
-        data2[data2 == 0] = np.nan
-        data = data1 - data2
-        del data1, data2
-        data[np.isnan(data)] = 0.
-
-        # write to file
-        dsDict = {}
-        dsDict[dsName] = data
-        writefile.write(dsDict, out_file=outFile, ref_file=file1)
+            with h5py.File(file1, 'r') as f:
+                ref1 = f[dsName][:, obj1.refY, obj1.refX]
+            with h5py.File(file2[0], 'r') as f:
+                ref2 = f[dsName][:, obj2.refY, obj2.refX]
+
+        blockwise.process_file([file1, file2[0]], outFile,
+                               func=partial(diff_ifgram_block, ref1=ref1, ref2=ref2),
+                               datasetNames=[dsName],
+                               ref_file=file1,
+                               max_memory=max_memory,
+                               num_worker=num_worker)
 
     # Sing dataset file
     else:
-        data1 = readfile.read(file1)[0]
-        data = np.array(data1, data1.dtype)
-        for fname in file2:
-            data2 = readfile.read(fname)[0]
-            data = np.array(data, dtype=np.float32) - np.array(data2, dtype=np.float32)
-            data = np.array(data, data1.dtype)
         print('writing >>> '+outFile)
-        writefile.write(data, out_file=outFile, metadata=atr1)
+        blockwise.process_file([file1] + file2, outFile,
+                               func=diff_block,
+                               datasetNames=readfile.get_dataset_list(file1)[:1],
+                               metadata=atr1,
+                               max_memory=max_memory,
+                               num_worker=num_worker)
 
     return outFile
 
@@ -186,7 +246,9 @@ def main(iargs=None):
     inps = cmd_line_parse(iargs)
     start_time = time.time()
 
-    inps.outfile = diff_file(inps.file1, inps.file2, inps.outfile, force=inps.force)
+    inps.outfile = diff_file(inps.file1, inps.file2, inps.outfile, force=inps.force,
+                             max_memory=inps.max_memory,
+                             num_worker=inps.num_worker)
 
     m, s = divmod(time.time()-start_time, 60)
     #print('time used: {:02.0f} mins {:02.1f} secs'.format(m, s))
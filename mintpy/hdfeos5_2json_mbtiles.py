@@ -9,13 +9,14 @@
 import json
 import numpy as np
 from datetime import date
-import math
 import time
 import os
 import sys
 import geocoder
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from mintpy.objects import HDFEOS
 from mintpy.mask import mask_matrix
+from mintpy.utils import mbtiles
 import argparse
 import pickle
 
@@ -63,13 +64,60 @@ def serialize_dictionary(dictionary, fileName):
     return
 
 
+# ---------------------------------------------------------------------------------------
+# yield the valid points in chunks of chunk_size in row-major order, with
+# longitude, latitude, displacement (num_point, num_date), slope and point number.
+# slopes of all points in a chunk are estimated with one matrix multiplication.
+def iter_point_chunks(attributes, decimal_dates, displacement_3d_matrix, chunk_size=20000):
+    x_step = float(attributes["X_STEP"])
+    y_step = float(attributes["Y_STEP"])
+    x_first = float(attributes["X_FIRST"])
+    y_first = float(attributes["Y_FIRST"])
+
+    # pixels with valid value on the 1st date
+    rows, cols = np.where(~np.isnan(displacement_3d_matrix[0, :, :]))
+    num_point = rows.size
+
+    # y = mx + c -> we want m = slope of the linear regression line
+    A = np.vstack([decimal_dates, np.ones(len(decimal_dates))]).T
+    A_inv = np.linalg.pinv(A)
+
+    for i0 in range(0, num_point, chunk_size):
+        i1 = min(i0 + chunk_size, num_point)
+        row, col = rows[i0:i1], cols[i0:i1]
+        displacements = displacement_3d_matrix[:, row, col]
+        slopes = np.dot(A_inv, displacements)[0, :]
+        longitudes = x_first + (col * x_step)
+        latitudes = y_first + (row * y_step)
+        yield longitudes, latitudes, displacements.T, slopes, np.arange(i0, i1)
+
+
+# ---------------------------------------------------------------------------------------
+# create the list of json point objects of one chunk and write it into json file
+def write_json_chunk(chunk_num, longitudes, latitudes, displacements, slopes, point_nums,
+                     dates, json_path, folder_name):
+    siu_man = []
+    for longitude, latitude, displacement_values, m, point_num in zip(longitudes.tolist(),
+                                                                        latitudes.tolist(),
+                                                                        displacements.tolist(),
+                                                                        slopes.tolist(),
+                                                                        point_nums.tolist()):
+        data = {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+        "properties": {"d": displacement_values, "m": m, "p": point_num}
+        }
+        siu_man.append(data)
+    return make_json_file(chunk_num, siu_man, dates, json_path, folder_name)
+
+
 # ---------------------------------------------------------------------------------------
 # convert h5 file to json and upload it. folder_name == unavco_name
-def convert_data(attributes, decimal_dates, timeseries_datasets, dates, json_path, folder_name):
+def convert_data(attributes, decimal_dates, displacement_3d_matrix, dates, json_path, folder_name,
+                 num_worker=1):
 
     project_name = attributes["PROJECT_NAME"]
     region = region_name_from_project_name(project_name)
-    # get the attributes for calculating latitude and longitude
     x_step = float(attributes["X_STEP"])
     y_step = float(attributes["Y_STEP"])
     x_first = float(attributes["X_FIRST"])
@@ -78,61 +126,26 @@ def convert_data(attributes, decimal_dates, timeseries_datasets, dates, json_pat
     num_rows = int(attributes["LENGTH"])
     print("columns: %d" % num_columns)
     print("rows: %d" % num_rows)
-    # create a siu_man array to store json point objects
-    siu_man = []
-    displacement_values = []
-    displacements = '{'
-    # np array of decimal dates, x parameter in linear regression equation
-    x = decimal_dates
-    A = np.vstack([x, np.ones(len(x))]).T
-    y = []
-    chunk_num = 1
-    point_num = 0
     CHUNK_SIZE = 20000
 
-    # iterate through h5 file timeseries
-    for (row, col), value in np.ndenumerate(timeseries_datasets[dates[0]]):
-        longitude = x_first + (col * x_step)
-        latitude = y_first + (row * y_step) 
-        displacement = float(value) 
-        # if value is not equal to naN, create a new json point object and append to siu_man array
-        if not math.isnan(displacement):
-            # get displacement values for all the dates into array for json and string for pgsql
-            for datei in dates:
-                displacement = timeseries_datasets[datei][row][col]
-                displacements += (str(displacement) + ",")
-                displacement_values.append(float(displacement))
-            displacements = displacements[:len(displacements) - 1] + '}'
-
-            # np array of displacement values, y parameter in linear regression equation
-            y = displacement_values
-
-            # y = mx + c -> we want m = slope of the linear regression line 
-            m, c = np.linalg.lstsq(A, y)[0]
-
-            data = {
-            "type": "Feature",
-            "geometry": {"type": "Point", "coordinates": [longitude, latitude]},    
-            "properties": {"d": displacement_values, "m": m, "p": point_num}
-            }   
-
-            siu_man.append(data)
-
-            # clear displacement array for json and the other string for dictionary, for next point
-            displacement_values = []
-            displacements = '{'
-            point_num += 1
-            # break;    # for testing purposes convert only 1 point
-
-            # if chunk_size limit is reached, write chunk into a json file
-            # then increment chunk number and clear siu_man array
-            if len(siu_man) == CHUNK_SIZE:
-                make_json_file(chunk_num, siu_man, dates, json_path, folder_name)
-                chunk_num += 1
-                siu_man = []
-
-    # write the last chunk that might be smaller than chunk_size
-    make_json_file(chunk_num, siu_man, dates, json_path, folder_name)
+    # serialize chunks into json files with parallel workers,
+    # while keeping at most 2 chunks per worker in memory
+    chunk_num = 0
+    with ProcessPoolExecutor(max_workers=num_worker) as pool:
+        futures = set()
+        for chunk in iter_point_chunks(attributes, decimal_dates, displacement_3d_matrix, CHUNK_SIZE):
+            chunk_num += 1
+            futures.add(pool.submit(write_json_chunk, chunk_num, *chunk, dates, json_path, folder_name))
+            if len(futures) >= 2 * num_worker:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        for future in futures:
+            future.result()
+
+    # write an empty chunk if there is no valid point
+    if chunk_num == 0:
+        make_json_file(1, [], dates, json_path, folder_name)
 
     # dictionary to contain metadata needed by db to be written to a file
     # and then be read by json_mbtiles2insarmaps.py
@@ -215,10 +228,19 @@ def make_json_file(chunk_num, points, dates, json_path, folder_name):
 
 # ---------------------------------------------------------------------------------------
 def build_parser():
-    parser = argparse.ArgumentParser(description='Convert a Unavco format H5 file for ingestion into insarmaps.')
+    parser = argparse.ArgumentParser(description='Convert a Unavco format H5 file for ingestion into insarmaps.',
+                                     formatter_class=argparse.RawTextHelpFormatter)
     required = parser.add_argument_group("required arguments")
     required.add_argument("file", help="unavco file to ingest")
     required.add_argument("outputDir", help="directory to place json files and mbtiles file")
+    parser.add_argument("--num-worker", dest="num_worker", type=int, default=1,
+                        help="number of parallel workers to write json / mbtiles files (default: %(default)s).")
+    parser.add_argument("--tiler", dest="tiler", choices={"native", "tippecanoe"}, default="native",
+                        help="tool to create the mbtiles file (default: %(default)s).\n"
+                             "native: write vector tiles directly from the arrays\n"
+                             "tippecanoe: run tippecanoe on the json files")
+    parser.add_argument("--zoom", dest="zoom", type=int, nargs=2, default=[0, 14], metavar=("MIN", "MAX"),
+                        help="min/max zoom levels of the mbtiles file for --tiler native (default: %(default)s).")
 
     return parser
 
@@ -236,7 +258,7 @@ def main():
     path_name = path_name_and_extension[0]
     # ---------------------------------------------------------------------------------------
     # start clock to track how long conversion process takes
-    start_time = time.clock()
+    start_time = time.time()
 
     # use h5py to open specified group(s) in the h5 file 
     # then read datasets from h5 file into memory for faster reading of data
@@ -266,15 +288,13 @@ def main():
     # array that stores dates from dates that have been converted to decimal
     decimal_dates = []
 
-    # read datasets in the group into a dictionary of 2d arrays and intialize decimal dates
-    timeseries_datasets = {}
+    # intialize decimal dates
     num_date = len(dates)
     for i in range(num_date):
-        timeseries_datasets[dates[i]] = np.squeeze(displacement_3d_matrix[i, :, :])
         d = get_date(dates[i])
         decimal = get_decimal_date(d)
         decimal_dates.append(decimal)
-    del displacement_3d_matrix
+    displacement_3d_matrix = displacement_3d_matrix.reshape(num_date, -1, displacement_3d_matrix.shape[-1])
 
     #for displacement_2d_matrix in displacement_3d_matrix:
     #    dataset = displacement_2d_matrix[:]
@@ -300,15 +320,40 @@ def main():
         print(output_folder + " already exists")
 
     # read and convert the datasets, then write them into json files and insert into database
-    convert_data(attributes, decimal_dates, timeseries_datasets, dates, output_folder, folder_name)
-
-    # run tippecanoe command to get mbtiles file
-    os.chdir(os.path.abspath(output_folder))
-    os.system("tippecanoe *.json -l chunk_1 -x d -pf -pk -Bg -d9 -D12 -g12 -r0 -o " + folder_name + ".mbtiles")
+    convert_data(attributes, decimal_dates, displacement_3d_matrix, dates, output_folder, folder_name,
+                 num_worker=parseArgs.num_worker)
+
+    if parseArgs.tiler == "native":
+        # write mbtiles file from the arrays directly, equivalent to the tippecanoe command below
+        lons, lats, slopes, point_nums = [], [], [], []
+        for chunk in iter_point_chunks(attributes, decimal_dates, displacement_3d_matrix):
+            lons.append(chunk[0])
+            lats.append(chunk[1])
+            slopes.append(chunk[3])
+            point_nums.append(chunk[4])
+        # write an empty mbtiles file if there is no valid point, as the json files
+        if not lons:
+            print("WARNING: no valid point found, write an empty mbtiles file.")
+        lons, lats, slopes, point_nums = [np.concatenate(i) if i else np.zeros(0)
+                                          for i in [lons, lats, slopes, point_nums]]
+        mbtiles.write_mbtiles(os.path.join(output_folder, folder_name + ".mbtiles"),
+                              lons=lons,
+                              lats=lats,
+                              properties={"m": slopes, "p": point_nums},
+                              layer_name="chunk_1",
+                              min_zoom=parseArgs.zoom[0],
+                              max_zoom=parseArgs.zoom[1],
+                              extent=2**12,
+                              max_zoom_extent=2**9,
+                              num_worker=parseArgs.num_worker)
+    else:
+        # run tippecanoe command to get mbtiles file
+        os.chdir(os.path.abspath(output_folder))
+        os.system("tippecanoe *.json -l chunk_1 -x d -pf -pk -Bg -d9 -D12 -g12 -r0 -o " + folder_name + ".mbtiles")
 
     # ---------------------------------------------------------------------------------------
     # check how long it took to read h5 file data and create json files
-    end_time =  time.clock()
+    end_time =  time.time()
     print(("time elapsed: " + str(end_time - start_time)))
     return
 
@@ -14,11 +14,12 @@ import sys
 import time
 import argparse
 import warnings
-import h5py
+from functools import lru_cache
 import numpy as np
 from scipy import linalg   # more effieint than numpy.linalg
-from mintpy.objects import ifgramStack, timeseries
-from mintpy.utils import readfile, writefile, ptime, utils as ut
+from mintpy.objects import ifgramStack, timeseries, open_store, is_zarr_file
+from mintpy.objects.stack import STATS_CACHE_GROUP
+from mintpy.utils import readfile, writefile, ptime, blockwise, utils as ut
 from mintpy.simulation import decorrelation as decor
 
 
@@ -30,7 +31,8 @@ configKeys = ['unwDatasetName',
               'maskDataset',
               'maskThreshold',
               'minRedundancy',
-              'minNormVelocity']
+              'minNormVelocity',
+              'residualNorm']
 
 
 ################################################################################################
@@ -45,6 +47,9 @@ EXAMPLE = """example:
   # support LSF job scheduler, PBS should also work out of the box after changing module import
   ifgram_inversion.py  inputs/ifgramStack.h5 -w var --parallel
   ifgram_inversion.py  inputs/ifgramStack.h5 -w var --parallel --parallel-workers-num 25
+
+  # MPI-distributed processing, e.g. on one machine with 4 processes or on multiple nodes
+  mpirun -n 4 ifgram_inversion.py  inputs/ifgramStack.h5 -w var --mpi
 """
 
 TEMPLATE = """
@@ -65,7 +70,8 @@ mintpy.networkInversion.maskThreshold   = auto #[0-1], auto for 0.4
 mintpy.networkInversion.minRedundancy   = auto #[1-inf], auto for 1.0, min num_ifgram for every SAR acquisition
 mintpy.networkInversion.waterMaskFile   = auto #[filename / no], auto for waterMask.h5 or no [if no waterMask.h5 found]
 mintpy.networkInversion.minNormVelocity = auto #[yes / no], auto for yes, min-norm deformation velocity or phase
-mintpy.networkInversion.residualNorm    = auto #[L2 ], auto for L2, norm minimization solution
+mintpy.networkInversion.residualNorm    = auto #[L2 / L1 / Huber], auto for L2, norm minimization solution
+mintpy.networkInversion.solver          = auto #[lstsq / splu / cgls], auto for lstsq, splu / cgls for large networks
 
 ## Parallel processing with Dask for HPC
 mintpy.networkInversion.parallel  = auto #[yes / no], auto for no, parallel processing using dask
@@ -123,11 +129,25 @@ def create_parser():
                         'fim - Fisher Information Matrix as weight' +
                         'coh - spatial coherence\n' +
                         'no  - no/uniform weight')
+    parser.add_argument('--precompute-weight', dest='precomputeWeight', action='store_true',
+                        help='Precompute the weight from coherence into the ifgram stack file once,\n'
+                             'which is re-used by later inversion runs until the file is changed,\n'
+                             'to skip the coherence-to-weight conversion. For the var weight function only.')
     parser.add_argument('--min-norm-velocity', dest='minNormVelocity', action='store_true',
                         help=('Enable inversion with minimum-norm deformation velocity,'
                               ' instead of minimum-norm deformation phase'))
-    parser.add_argument('--norm', dest='residualNorm', default='L2', choices=['L1', 'L2'],
-                        help='Inverse method used to residual optimization, L1 or L2 norm minimization. Default: L2')
+    parser.add_argument('--solver', dest='solver', default='lstsq', choices=['lstsq', 'splu', 'cgls'],
+                        help='Least squares solver (default: %(default)s).\n'
+                             'lstsq - dense SVD-based solver (LAPACK gelsd)\n'
+                             'splu  - sparse LU factorization of the normal equation\n'
+                             'cgls  - iterative conjugate gradient solver on the normal equation\n'
+                             'splu / cgls use sparse design matrix, and are faster for large networks,\n'
+                             'e.g. hundreds of acquisitions.')
+    parser.add_argument('--norm', dest='residualNorm', default='L2', choices=['L1', 'L2', 'Huber'],
+                        help='Inverse method used to residual optimization (default: %(default)s).\n'
+                             'L2          - least squares\n'
+                             'L1 / Huber  - robust inversion via iteratively reweighted least squares (IRLS),\n'
+                             '              starting from the L2 solution, to down-weight unwrapping errors')
 
     parser.add_argument('--chunk-size', dest='chunk_size', type=float, default=100e6,
                         help='max number of data (= ifgram_num * num_row * num_col) to read per loop\n' +
@@ -142,6 +162,9 @@ def create_parser():
     parser.add_argument('--update', dest='update_mode', action='store_true',
                         help='Enable update mode, and skip inversion if output timeseries file already exists,\n' +
                         'readable and newer than input interferograms file')
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help='Resume the unfinished inversion, e.g. after a crash or walltime kill, by skipping\n' +
+                        'the completed boxes recorded in the journal file (TS_FILE.journal).')
     parser.add_argument('--water-mask', '-m', dest='waterMaskFile',
                         help='Skip inversion on the masked out region, i.e. water.')
     #parser.add_argument('--split-file', dest='split_file', action='store_true',
@@ -160,6 +183,13 @@ def create_parser():
     par.add_argument('--parallel-walltime','--par-walltime','--parallel-walltime', dest='walltime', type=str,
                      default='00:40', help='Specify the walltime for each dask worker. Default: 00:40')
 
+    mpi = parser.add_argument_group('MPI', 'distributed processing with MPI, e.g. on multiple nodes without dask')
+    mpi.add_argument('--mpi', dest='mpi', action='store_true',
+                     help='Enable MPI-distributed inversion for runs launched via mpirun, with boxes split among\n'
+                          'the ranks. Each rank reads its own boxes and writes them into the output files\n'
+                          'via the MPI-IO driver of h5py (parallel HDF5) if available, or into its own part\n'
+                          'files to be merged by the root rank otherwise. Requires mpi4py.')
+
     return parser
 
 
@@ -176,6 +206,9 @@ def cmd_line_parse(iargs=None):
 
     inps.timeseriesFile, inps.tempCohFile = inps.outfile
 
+    if inps.mpi and inps.parallel:
+        raise ValueError('--mpi and --parallel (dask) can not be used together!')
+
     if inps.waterMaskFile and not os.path.isfile(inps.waterMaskFile):
         inps.waterMaskFile = None
 
@@ -221,7 +254,7 @@ def read_template2inps(template_file, inps):
                 iDict[key] = str(value)
             elif key in ['maskThreshold', 'minRedundancy']:
                 iDict[key] = float(value)
-            elif key in ['weightFunc', 'residualNorm', 'waterMaskFile']:
+            elif key in ['weightFunc', 'residualNorm', 'waterMaskFile', 'solver']:
                 iDict[key] = value
     return inps
 
@@ -232,12 +265,12 @@ def run_or_skip(inps):
     flag = 'skip'
 
     # check output files vs input dataset
-    if not all(os.path.isfile(i) for i in inps.outfile):
+    if not all(os.path.exists(i) for i in inps.outfile):
         flag = 'run'
         print('1) NOT ALL output files found: {}.'.format(inps.outfile))
     else:
         print('1) output files already exist: {}.'.format(inps.outfile))
-        with h5py.File(inps.ifgramStackFile, 'r') as f:
+        with open_store(inps.ifgramStackFile, 'r') as f:
             ti = float(f[inps.unwDatasetName].attrs.get('MODIFICATION_TIME', os.path.getmtime(inps.ifgramStackFile)))
         to = min(os.path.getmtime(i) for i in inps.outfile)
         if ti > to:
@@ -246,6 +279,13 @@ def run_or_skip(inps):
         else:
             print('2) output dataset is newer than input dataset: {}.'.format(inps.unwDatasetName))
 
+    # check unfinished inversion
+    if flag == 'skip':
+        journal_file = '{}.journal'.format(get_output_files(inps)[0])
+        if os.path.isfile(journal_file):
+            flag = 'run'
+            print('3) unfinished inversion found with journal file: {}.'.format(journal_file))
+
     # check configuration
     if flag == 'skip':
         meta_keys = ['REF_Y', 'REF_X']
@@ -255,12 +295,12 @@ def run_or_skip(inps):
 
         if any(str(vars(inps)[key]) != atr_ts.get(key_prefix+key, 'None') for key in configKeys):
             flag = 'run'
-            print('3) NOT all key configration parameters are the same: {}'.format(configKeys))
+            print('4) NOT all key configration parameters are the same: {}'.format(configKeys))
         elif any(atr_ts[key] != atr_ifg[key] for key in meta_keys):
             flag = 'run'
-            print('3) NOT all the metadata are the same: {}'.format(meta_keys))
+            print('4) NOT all the metadata are the same: {}'.format(meta_keys))
         else:
-            print('3) all key configuration parameters are the same: {}.'.format(configKeys))
+            print('4) all key configuration parameters are the same: {}.'.format(configKeys))
 
     # result
     print('run or skip: {}.'.format(flag))
@@ -268,30 +308,53 @@ def run_or_skip(inps):
 
 
 #################################### Weight Functions #####################################
-def coherence2phase_variance(coherence, L=32, epsilon=1e-3, print_msg=False):
-    """Convert coherence to phase variance based on DS phase PDF (Tough et al., 1995)"""
-    lineStr = '    number of looks L={}'.format(L)
-    if L > 80:
-        L = 80
-        lineStr += ', use L=80 to avoid dividing by 0 in calculation with negligible effect'
-    if print_msg:
-        print(lineStr)
+@lru_cache(maxsize=None)
+def get_phase_variance_lut(L=32, epsilon=1e-3, coh_num=1000):
+    """Lookup table (LUT) of phase variance for distributed scatterers, based on phase PDF
+    (Tough et al., 1995). It depends on L and epsilon only, thus, is calculated once per process.
+    Parameters: L       : int, number of looks
+                epsilon : float, coherence range of the LUT is [epsilon, 1-epsilon]
+                coh_num : int, number of coherence bins of the LUT
+    Returns:    coh_lut : 1D np.ndarray in float64, coherence of the LUT bins
+                var_lut : 1D np.ndarray in float64, phase variance of the LUT bins
+    """
+    coh_lut = np.linspace(0.0 + epsilon, 1.0 - epsilon, coh_num)
+    var_lut = decor.phase_variance_ds(int(L), coh_lut)[0]
+    # read-only, as it is shared by all callers
+    coh_lut.flags.writeable = False
+    var_lut.flags.writeable = False
+    return coh_lut, var_lut
+
 
-    coh_num = 1000
-    coh_min = 0.0 + epsilon
-    coh_max = 1.0 - epsilon
-    coh_lut = np.linspace(coh_min, coh_max, coh_num)
+def coherence2lut_index(coherence, coh_lut):
+    """Index of the LUT bin of coherence, with values out of the LUT range clipped"""
     coh_min = np.min(coh_lut)
     coh_max = np.max(coh_lut)
-    coh_step = (coh_max - coh_min) / (coh_num - 1)
+    coh_step = (coh_max - coh_min) / (coh_lut.size - 1)
 
     coherence = np.array(coherence)
     coherence[coherence < coh_min] = coh_min
     coherence[coherence > coh_max] = coh_max
     coherence_idx = np.array((coherence - coh_min) / coh_step, np.int16)
+    return coherence_idx
 
-    var_lut = decor.phase_variance_ds(int(L), coh_lut)[0]
-    variance = var_lut[coherence_idx]
+
+def coherence2phase_variance(coherence, L=32, epsilon=1e-3, print_msg=False, var_lut=None):
+    """Convert coherence to phase variance based on DS phase PDF (Tough et al., 1995)
+    Parameters: var_lut : tuple of 2 np.ndarray, (coh_lut, var_lut) from get_phase_variance_lut(),
+                          e.g. calculated once and passed to all patches / dask workers.
+    """
+    lineStr = '    number of looks L={}'.format(L)
+    if L > 80:
+        L = 80
+        lineStr += ', use L=80 to avoid dividing by 0 in calculation with negligible effect'
+    if print_msg:
+        print(lineStr)
+
+    if var_lut is None:
+        var_lut = get_phase_variance_lut(int(L), epsilon)
+    coh_lut, var_lut = var_lut
+    variance = var_lut[coherence2lut_index(coherence, coh_lut)]
     return variance
 
 
@@ -304,7 +367,7 @@ def coherence2fisher_info_index(data, L=32, epsilon=1e-3):
     return data
 
 
-def coherence2weight(coh_data, weight_func='var', L=20, epsilon=5e-2, print_msg=True):
+def coherence2weight(coh_data, weight_func='var', L=20, epsilon=5e-2, print_msg=True, var_lut=None):
     coh_data[np.isnan(coh_data)] = epsilon
     coh_data[coh_data < epsilon] = epsilon
     coh_data = np.array(coh_data, np.float64)
@@ -315,7 +378,7 @@ def coherence2weight(coh_data, weight_func='var', L=20, epsilon=5e-2, print_msg=
         if print_msg:
             print('convert coherence to weight using inverse of phase variance')
             print('    with phase PDF for distributed scatterers from Tough et al. (1995)')
-        weight = 1.0 / coherence2phase_variance(coh_data, L, print_msg=print_msg)
+        weight = 1.0 / coherence2phase_variance(coh_data, L, print_msg=print_msg, var_lut=var_lut)
 
     elif any(i in weight_func for i in ['coh', 'lin']):
         if print_msg:
@@ -339,9 +402,194 @@ def coherence2weight(coh_data, weight_func='var', L=20, epsilon=5e-2, print_msg=
     return weight
 
 
+def get_weight_dataset_name(weight_func='var'):
+    return '{}/coherence/weight_{}'.format(STATS_CACHE_GROUP, weight_func.lower())
+
+
+def get_weight_cache_key(fname, shape, weight_func='var', L=20, epsilon=5e-2):
+    """Configuration of the precomputed weight as a string, to validate it in the file.
+    The modification time of the file is included, thus, the precomputed weight is out of date after
+    any change of the file, e.g. re-written coherence, except for the weight writing itself.
+    """
+    key = ['FILE_MTIME_NS={}'.format(os.stat(fname).st_mtime_ns),
+           'WEIGHT_FUNC={}'.format(weight_func.lower()),
+           'NUM_LOOK={}'.format(L),
+           'EPSILON={}'.format(epsilon),
+           'SHAPE={}'.format(tuple(shape))]
+    return '; '.join(key)
+
+
+def write_weight_dataset(ifgram_file, weight_func='var', epsilon=5e-2, max_memory=2, print_msg=True):
+    """Precompute the weight of all interferograms from coherence into ifgram_file, so that each
+    inversion run reads it directly, instead of converting coherence to weight patch by patch.
+    Weight is saved as uint16 index of the coherence bins of the phase variance LUT, with the weight
+    of the bins in the dataset {dsName}_lut. This is exactly what coherence2weight() calculates for
+    the 'var' weight function, which is the only one supported, as the other weight functions are
+    not quantized in coherence, e.g. 'fim' changes by orders of magnitude as coherence --> 1.
+
+    Parameters: ifgram_file : str, interferograms stack HDF5 file, e.g. ./inputs/ifgramStack.h5
+                weight_func : str, weight function, var only
+                epsilon     : float, minimum coherence value
+                max_memory  : float, maximum memory in GB for each block of data
+    Returns:    dsName      : str, dataset name of the precomputed weight in ifgram_file
+    """
+    if 'var' not in weight_func.lower():
+        raise ValueError('precomputed weight is supported for the var weight function only, not {}'.format(weight_func))
+
+    stack_obj = ifgramStack(ifgram_file)
+    stack_obj.open(print_msg=False)
+    L = int(stack_obj.metadata['ALOOKS']) * int(stack_obj.metadata['RLOOKS'])
+    dsName = get_weight_dataset_name(weight_func)
+    with open_store(ifgram_file, 'r') as f:
+        shape = f['coherence'].shape
+        key = get_weight_cache_key(ifgram_file, shape, weight_func, L, epsilon)
+        if dsName in f and f[dsName].attrs.get('KEY', '') == key:
+            if print_msg:
+                print('precomputed weight exists in file: {}, skip re-computing.'.format(ifgram_file))
+            return dsName
+
+    # the same LUT (and the same number of looks) as coherence2phase_variance()
+    coh_lut, var_lut = get_phase_variance_lut(min(L, 80))
+    weight_lut = np.array(1.0 / var_lut, np.float32)
+    block_list = blockwise.get_block_list(shape, max_memory=max_memory)
+    if print_msg:
+        print('precompute weight of {} ifgrams using weight function: {}'.format(shape[0], weight_func))
+    file_stat = os.stat(ifgram_file)
+    prog_bar = ptime.progressBar(maxValue=len(block_list), print_msg=print_msg)
+    with open_store(ifgram_file, 'a') as f:
+        for name in [dsName, dsName+'_lut']:
+            if name in f:
+                del f[name]
+        f.create_dataset(dsName+'_lut', data=weight_lut)
+        ds_coh = f['coherence']
+        ds = f.create_dataset(dsName, shape=shape, dtype=np.uint16, chunks=True)
+        for i, (z0, z1, y0, y1) in enumerate(block_list):
+            coh_data = np.array(ds_coh[z0:z1, y0:y1, :], np.float64)
+            coh_data[np.isnan(coh_data)] = epsilon
+            coh_data[coh_data < epsilon] = epsilon
+            ds[z0:z1, y0:y1, :] = coherence2lut_index(coh_data, coh_lut)
+            prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
+        ds.attrs['KEY'] = key
+    prog_bar.close()
+
+    # keep the modification time, as the data is not changed
+    os.utime(ifgram_file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    if print_msg:
+        print('save precomputed weight to /{} in file: {}'.format(dsName, ifgram_file))
+    return dsName
+
+
+def read_weight(stack_obj, box, weight_func='var', L=20, epsilon=5e-2, var_lut=None, dropIfgram=True,
+                print_msg=True):
+    """Read the weight of the patch, from the precomputed weight in file if available and valid,
+    otherwise from coherence via coherence2weight()."""
+    num_ifgram = stack_obj.get_size(dropIfgram=dropIfgram)[0]
+    box = box if box else (0, 0, stack_obj.width, stack_obj.length)
+    dsName = get_weight_dataset_name(weight_func)
+    with open_store(stack_obj.file, 'r') as f:
+        key = get_weight_cache_key(stack_obj.file, f['coherence'].shape, weight_func, L, epsilon)
+        if dsName in f and f[dsName].attrs.get('KEY', '') == key:
+            if print_msg:
+                print('reading precomputed weight in {} * {} ...'.format(box, num_ifgram))
+            flag = f['dropIfgram'][:] if dropIfgram else np.ones(f['coherence'].shape[0], dtype=np.bool_)
+            idx = np.where(flag)[0]
+            if np.all(np.diff(idx) == 1):
+                idx = slice(idx[0], idx[-1]+1)
+            else:
+                idx = idx.tolist()
+            weight_lut = f[dsName+'_lut'][:]
+            weight = weight_lut[f[dsName][idx, box[1]:box[3], box[0]:box[2]]]
+            return weight.reshape(num_ifgram, -1)
+
+    weight = read_coherence(stack_obj, box=box, dropIfgram=dropIfgram, print_msg=print_msg)
+    weight = coherence2weight(weight, weight_func=weight_func, L=L, epsilon=epsilon, var_lut=var_lut)
+    return weight
+
+
 ################################# Time-series Estimator ###################################
+def cgls(G, Y, tol=1e-8, max_iter=None):
+    """Least squares solution of G * X = Y for multiple right-hand sides at once, using the conjugate
+    gradient method on the normal equation (CGLS), with the convergence checked for each column.
+    Starting from zero, it converges to the minimum-norm solution for rank deficient G, e.g. network
+    of interferograms with disconnected subsets, as lstsq does.
+    Parameters: G        : 2D np.ndarray or scipy.sparse matrix in size of (m, n)
+                Y        : 2D np.ndarray in size of (m, k)
+                tol      : float, relative tolerance of the normal equation residual, |G^T R| / |G^T Y|
+                max_iter : int, maximum number of iterations, default is 2 * n
+    Returns:    X        : 2D np.ndarray in float64 in size of (n, k)
+    """
+    Y = np.array(Y, np.float64).reshape(G.shape[0], -1)
+    max_iter = max_iter if max_iter else 2 * G.shape[1]
+
+    X = np.zeros((G.shape[1], Y.shape[1]), np.float64)
+    R = Y.copy()
+    S = G.T.dot(R)
+    P = S.copy()
+    gamma = np.sum(S**2, axis=0)
+    gamma_tol = gamma * tol**2
+    active = gamma > 0
+    for i in range(max_iter):
+        if not np.any(active):
+            break
+        Q = G.dot(P[:, active])
+        delta = np.sum(Q**2, axis=0)
+        alpha = np.zeros(delta.shape)
+        alpha[delta > 0] = gamma[active][delta > 0] / delta[delta > 0]
+        X[:, active] += P[:, active] * alpha
+        R[:, active] -= Q * alpha
+        S = G.T.dot(R[:, active])
+        gamma_new = np.sum(S**2, axis=0)
+        beta = np.zeros(gamma_new.shape)
+        beta[delta > 0] = gamma_new[delta > 0] / gamma[active][delta > 0]
+        P[:, active] = S + P[:, active] * beta
+        gamma[active] = gamma_new
+        active[active] = (gamma_new > gamma_tol[active]) * (delta > 0)
+    return X
+
+
+def is_network_connected(A):
+    """Check if the network of interferograms is connected, i.e. the design matrix is full rank.
+    Parameters: A : 2D np.ndarray in size of (num_ifgram, num_date-1), with the reference date omitted
+    Returns:    True / False
+    """
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    # recover the column of the reference date, as each row sums up to 0
+    A = np.hstack((-np.sum(A, axis=1, keepdims=True), A))
+    num_date = A.shape[1]
+    m_idx, s_idx = np.argmin(A, axis=1), np.argmax(A, axis=1)
+    graph = csr_matrix((np.ones(m_idx.size), (m_idx, s_idx)), shape=(num_date, num_date))
+    num_comp = connected_components(graph, directed=False)[0]
+    return num_comp == 1
+
+
+def solve_lstsq(G, Y, rcond=1e-5, solver='lstsq'):
+    """Least squares solution of G * X = Y, using the solver of choice.
+    Parameters: G      : 2D np.ndarray in size of (m, n)
+                Y      : 2D np.ndarray in size of (m, k)
+                rcond  : float, cut-off ratio of small singular values of G, for lstsq only
+                solver : str, lstsq - SVD-based dense solver of LAPACK (gelsd)
+                              splu  - sparse LU factorization of the normal equation, for large networks,
+                                      G has to be full rank
+                              cgls  - iterative solver on sparse G, for large networks
+    Returns:    X      : 2D np.ndarray in size of (n, k)
+    """
+    if solver == 'splu':
+        from scipy.sparse import csc_matrix
+        from scipy.sparse.linalg import splu
+        G = csc_matrix(G, dtype=np.float64)
+        return splu((G.T * G).tocsc()).solve(G.T.dot(np.array(Y, np.float64)))
+
+    elif solver == 'cgls':
+        from scipy.sparse import csr_matrix
+        return cgls(csr_matrix(G), Y)
+
+    return linalg.lstsq(G, Y, cond=rcond)[0]
+
+
 def estimate_timeseries(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_velocity=True,
-                        rcond=1e-5, min_redundancy=1.):
+                        rcond=1e-5, min_redundancy=1., solver='lstsq'):
     """Estimate time-series from a stack/network of interferograms with
     Least Square minimization on deformation phase / velocity.
 
@@ -381,6 +629,7 @@ def estimate_timeseries(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_vel
                 rcond - cut-off ratio of small singular values of A or B, to maintain robustness.
                     It's recommend to >= 1e-5 by experience, to generate reasonable result.
                 min_redundancy - min redundancy defined as min num_ifgram for every SAR acquisition
+                solver - str, lstsq / splu / cgls, least squares solver, see solve_lstsq()
     Returns:    ts - 2D np.array in size of (num_date, num_pixel), phase time-series
                 temp_coh - 1D np.array in size of (num_pixel), temporal coherence
                 num_inv_ifg - 1D np.array in size of (num_pixel), number of ifgrams
@@ -409,15 +658,24 @@ def estimate_timeseries(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_vel
 
         # check matrix invertability
         if weight_sqrt is not None:  #for WLS only because OLS contains it already
-            try:
-                linalg.inv(np.dot(B.T, B))
-            except linalg.LinAlgError:
-                return ts, temp_coh, num_inv_ifg
+            if solver in ['splu', 'cgls']:
+                # B is full rank if the network is connected, checked as graph in O(num_ifgram)
+                if not is_network_connected(A):
+                    return ts, temp_coh, num_inv_ifg
+            else:
+                try:
+                    linalg.inv(np.dot(B.T, B))
+                except linalg.LinAlgError:
+                    return ts, temp_coh, num_inv_ifg
 
         ifgram = ifgram[idx, :]
         if weight_sqrt is not None:
             weight_sqrt = weight_sqrt[idx, :]
 
+    # min-norm solution for network with disconnected subsets, which can not be factorized
+    if solver == 'splu' and not is_network_connected(A):
+        solver = 'cgls'
+
     # invert time-series
     try:
         # assume minimum-norm deformation velocity
@@ -425,9 +683,9 @@ def estimate_timeseries(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_vel
             if weight_sqrt is not None:
                 B_w = np.multiply(B, weight_sqrt)
                 ifgram_w = np.multiply(ifgram, weight_sqrt)
-                X = linalg.lstsq(B_w, ifgram_w, cond=rcond)[0]
+                X = solve_lstsq(B_w, ifgram_w, rcond=rcond, solver=solver)
             else:
-                X = linalg.lstsq(B, ifgram, cond=rcond)[0]
+                X = solve_lstsq(B, ifgram, rcond=rcond, solver=solver)
 
             ts_diff = X * np.tile(tbase_diff, (1, num_pixel))
             ts[1:, :] = np.cumsum(ts_diff, axis=0)
@@ -438,9 +696,9 @@ def estimate_timeseries(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_vel
             if weight_sqrt is not None:
                 A_w = np.multiply(A, weight_sqrt)
                 ifgram_w = np.multiply(ifgram, weight_sqrt)
-                X = linalg.lstsq(A_w, ifgram_w, cond=rcond)[0]
+                X = solve_lstsq(A_w, ifgram_w, rcond=rcond, solver=solver)
             else:
-                X = linalg.lstsq(A, ifgram, cond=rcond)[0]
+                X = solve_lstsq(A, ifgram, rcond=rcond, solver=solver)
             ts[1: ,:] = X
             ifgram_diff = ifgram - np.dot(A, X)
 
@@ -454,72 +712,301 @@ def estimate_timeseries(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_vel
     return ts, temp_coh, num_inv_ifg
 
 
-###################################### File IO ############################################
-def write2hdf5_file(ifgram_file, metadata, ts, temp_coh, num_inv_ifg=None,
-                    suffix='', inps=None):
-    stack_obj = ifgramStack(ifgram_file)
-    stack_obj.open(print_msg=False)
-    date_list = stack_obj.get_date_list(dropIfgram=True)
+def estimate_timeseries_irls(A, B, tbase_diff, ifgram, ts, weight_sqrt=None, min_norm_velocity=True,
+                             residual_norm='L1', max_iter=20, tol=1e-3, epsilon=1e-3, huber_k=1.345,
+                             max_memory=0.5, print_msg=True):
+    """Estimate time-series with robust residual norm via iteratively reweighted least squares (IRLS),
+    for all pixels at once, to down-weight the outliers, e.g. unwrapping errors.
+
+    Starting from the L2 solution, residuals are re-weighted as below, and the weighted least squares
+    problems of all pixels are solved via their normal equations in batch, until converged per pixel:
+        L1    - w / max(|r|, epsilon)
+        Huber - w^2 * min(1, k * s / |z|), with s = 1.4826 * median(|z|), for each pixel
+    where w is weight_sqrt, i.e. 1 / std. dev. of the phase, and z = r * w is the standardized residual,
+    to minimize sum(|z|) for L1, and the Huber loss of z, respectively.
+    Zero phase is ignored, as in estimate_timeseries().
+
+    Parameters: A / B / tbase_diff / weight_sqrt / min_norm_velocity - the same as estimate_timeseries()
+                ifgram        - 2D np.array in size of (num_ifgram, num_pixel), phase of all interferograms
+                ts            - 2D np.array in size of (num_date, num_pixel), L2 solution from
+                                estimate_timeseries() as the initial value
+                residual_norm - str, L1 or Huber
+                max_iter      - int, maximum number of iterations
+                tol           - float, max relative change of the solution for convergence
+                epsilon       - float, min absolute residual in radian for L1 weight, to avoid dividing by 0
+                huber_k       - float, threshold of Huber weight in the unit of residual std. dev.
+                max_memory    - float, maximum memory in GB for the normal equations of each pixel chunk
+    Returns:    ts            - 2D np.array in size of (num_date, num_pixel), phase time-series
+                temp_coh      - 1D np.array in size of (num_pixel), temporal coherence
+    """
+    residual_norm = residual_norm.lower()
+    if residual_norm not in ['l1', 'huber']:
+        raise ValueError('Un-recognized residual norm: {}'.format(residual_norm))
 
-    # File 1 - timeseries.h5
-    ts_file = '{}{}.h5'.format(suffix, os.path.splitext(inps.outfile[0])[0])
-    metadata['REF_DATE'] = date_list[0]
-    metadata['FILE_TYPE'] = 'timeseries'
-    metadata['UNIT'] = 'm'
+    G = np.array(B if min_norm_velocity else A, np.float64)
+    num_ifgram, num_par = G.shape
+    ifgram = ifgram.reshape(num_ifgram, -1)
+    num_pixel = ifgram.shape[1]
+    ts = np.array(ts, np.float32).reshape(num_par + 1, -1)
+    temp_coh = np.zeros(num_pixel, np.float32)
+    diag_idx = np.arange(num_par)
+
+    # split pixels into chunks, for the weighted design matrix (num_ifgram * num_par)
+    # and the normal equation (num_par * num_par) of each pixel
+    step = max(1, int(max_memory * 1024**3 / ((num_ifgram + num_par) * num_par * 8 * 2)))
+    num_step = int(np.ceil(num_pixel / step))
+    num_iter = np.zeros(num_pixel, np.int16)
+    prog_bar = ptime.progressBar(maxValue=num_step, print_msg=print_msg)
+    for i in range(num_step):
+        p0, p1 = i * step, min(num_pixel, (i + 1) * step)
+        y = np.array(ifgram[:, p0:p1], np.float64)
+        valid = y != 0.
+        w0 = np.array(valid, np.float64)
+        if weight_sqrt is not None:
+            w0 *= weight_sqrt.reshape(num_ifgram, -1)[:, p0:p1]
 
-    print('-'*50)
-    print('converting phase to range')
-    phase2range = -1*float(stack_obj.metadata['WAVELENGTH'])/(4.*np.pi)
-    ts *= phase2range
+        # initial value from the L2 solution
+        if min_norm_velocity:
+            X = np.diff(ts[:, p0:p1], axis=0) / tbase_diff
+        else:
+            X = np.array(ts[1:, p0:p1], np.float64)
+
+        active = np.ones(p1 - p0, np.bool_)
+        for j in range(max_iter):
+            # robust weights from residuals
+            Xa, ya, va, wa = X[:, active], y[:, active], valid[:, active], w0[:, active]
+            res = np.abs(ya - np.dot(G, Xa))
+            if residual_norm == 'l1':
+                w = wa / np.maximum(res, epsilon)
+            else:
+                # robust std. dev. from the median of the absolute standardized residuals
+                res *= wa
+                scale = 1.4826 * np.nanmedian(np.where(va, res, np.nan), axis=0)
+                thres = huber_k * np.maximum(scale, epsilon)
+                w = np.square(wa) * np.minimum(1., thres / np.maximum(res, 1e-12))
+
+            # solve the normal equations of all active pixels in batch: G^T * diag(w) * G
+            N = np.matmul(G.T, w.T[:, :, np.newaxis] * G)
+            rhs = np.dot((w * ya).T, G)
+            # tiny damping for the min-norm solution of networks with disconnected subsets
+            damp = np.maximum(1e-10 * np.max(N[:, diag_idx, diag_idx], axis=1), 1e-30)
+            N[:, diag_idx, diag_idx] += damp[:, np.newaxis]
+            X_new = np.linalg.solve(N, rhs[:, :, np.newaxis])[:, :, 0].T
+
+            # convergence check per pixel
+            dX = np.max(np.abs(X_new - Xa), axis=0) / np.maximum(np.max(np.abs(X_new), axis=0), 1e-12)
+            X[:, active] = X_new
+            num_iter[p0:p1][active] += 1
+            active[active] = dX > tol
+            if not np.any(active):
+                break
+
+        # time-series and temporal coherence
+        if min_norm_velocity:
+            ts[1:, p0:p1] = np.cumsum(X * tbase_diff, axis=0)
+        else:
+            ts[1:, p0:p1] = X
+        res = (y - np.dot(G, X)) * valid
+        temp_coh[p0:p1] = np.abs(np.sum(np.exp(1j*res) * valid, axis=0)) / np.maximum(np.sum(valid, axis=0), 1)
+        prog_bar.update(i+1, suffix='{}/{} pixels'.format(p1, num_pixel))
+    prog_bar.close()
+
+    if print_msg and num_pixel > 0:
+        print('number of IRLS iterations: mean {:.1f}, max {}'.format(np.mean(num_iter), np.max(num_iter)))
+    return ts, temp_coh
+
+
+###################################### File IO ############################################
+def get_output_files(inps):
+    """Get output files: timeseries, temporal coherence and number of inverted ifgrams.
+    Outputs are in HDF5 files, or in Zarr stores if *.zarr is given, e.g. for dask workers writing concurrently.
+    """
+    fexts = ['.zarr' if is_zarr_file(i) else '.h5' for i in inps.outfile]
+    ts_file = '{}{}'.format(os.path.splitext(inps.outfile[0])[0], fexts[0])
+    tcoh_file = '{}{}'.format(os.path.splitext(inps.outfile[1])[0], fexts[1])
+    num_inv_file = 'numInvIfgram{}'.format(fexts[0])
+    return [ts_file, tcoh_file, num_inv_file]
 
-    print('calculating perpendicular baseline timeseries')
-    pbase = stack_obj.get_perp_baseline_timeseries(dropIfgram=True)
 
+def layout_output_files(out_files, metadata, date_list, pbase, ts_shape):
+    """Create the output files with empty datasets, to be filled box by box."""
+    num_date, length, width = ts_shape
+    ts_file, tcoh_file, num_inv_file = out_files
+
+    # File 1 - timeseries.h5
     ts_obj = timeseries(ts_file)
-    ts_obj.write2hdf5(data=ts, dates=date_list, bperp=pbase, metadata=metadata)
+    dsNameDict = {
+        "date": ((np.dtype('S8'), (num_date,))),
+        "bperp": (np.float32, (num_date,)),
+        "timeseries": (np.float32, (num_date, length, width)),
+    }
+    ts_obj.layout_hdf5(dsNameDict, metadata)
+
+    # write date and bperp to disk
+    date_list_utf8 = [dt.encode('utf-8') for dt in date_list]
+    ts_obj.write2hdf5_block(date_list_utf8, datasetName='date')
+    ts_obj.write2hdf5_block(pbase, datasetName='bperp')
 
     # File 2 - temporalCoherence.h5
-    out_file = '{}{}.h5'.format(suffix, os.path.splitext(inps.outfile[1])[0])
-    metadata['FILE_TYPE'] = 'temporalCoherence'
-    metadata['UNIT'] = '1'
+    meta = dict(metadata)
+    meta['FILE_TYPE'] = 'temporalCoherence'
+    meta['UNIT'] = '1'
     print('-'*50)
-    writefile.write(temp_coh, out_file=out_file, metadata=metadata)
-
-    ## File 3 - timeseriesDecorStd.h5
-    #if not np.all(ts_std == 0.):
-    #    out_file = 'timeseriesDecorStd{}.h5'.format(suffix)
-    #    metadata['FILE_TYPE'] = 'timeseries'
-    #    metadata['UNIT'] = 'm'
-    #    ts_std *= abs(phase2range)
-    #    print('-'*50)
-    #    writefile.write(ts_std, out_file=out_file, metadata=metadata, ref_file=ts_file)
+    writefile.layout_hdf5(tcoh_file, {'temporalCoherence': [np.float32, (length, width)]}, metadata=meta)
 
     # File 3 - numInvIfgram.h5
-    out_file = 'numInvIfgram{}.h5'.format(suffix)
-    metadata['FILE_TYPE'] = 'mask'
-    metadata['UNIT'] = '1'
+    meta['FILE_TYPE'] = 'mask'
     print('-'*50)
-    writefile.write(num_inv_ifg, out_file=out_file, metadata=metadata)
-    return
+    writefile.layout_hdf5(num_inv_file, {'mask': [np.int16, (length, width)]}, metadata=meta)
+    return out_files
+
+
+def write2hdf5_box(out_files, tsi, temp_cohi, ifg_numi, box, print_msg=True):
+    """Write the inversion result of one box into the output files.
+    Parameters: out_files : list of 3 str, output files from get_output_files(),
+                            or list of 3 opened files, e.g. with the MPI-IO driver of h5py
+                tsi       : 3D np.ndarray in size of (num_date, num_row, num_col) in meter, or None to skip
+                temp_cohi : 2D np.ndarray in size of (num_row, num_col)
+                ifg_numi  : 2D np.ndarray in size of (num_row, num_col)
+                box       : tuple of 4 int, (x0, y0, x1, y1)
+    """
+    x0, y0, x1, y1 = box
+    if tsi is not None and print_msg:
+        print('writing timeseries of box {} to file: {}'.format(box, out_files[0]))
+    for fname, dsName, data in zip(out_files, ['timeseries', 'temporalCoherence', 'mask'], [tsi, temp_cohi, ifg_numi]):
+        if data is None:
+            continue
+        if isinstance(fname, str):
+            with open_store(fname, 'a') as f:
+                f[dsName][..., y0:y1, x0:x1] = data
+        else:
+            fname[dsName][..., y0:y1, x0:x1] = data
+    return out_files
 
 
-def write2hdf5_auxFiles(metadata, temp_coh, num_inv_ifg=None, suffix='', inps=None):
+def get_journal_key(ifgram_file, box_list, inps):
+    """Configuration of the inversion as a string, to validate the journal file for resuming."""
+    key = ['FILE={}'.format(os.path.abspath(ifgram_file)),
+           'FILE_MTIME={}'.format(os.path.getmtime(ifgram_file)),
+           'BOX_NUM={}'.format(len(box_list)),
+           'BOX_LAST={}'.format(tuple(box_list[-1]))]
+    key += ['{}={}'.format(i, vars(inps)[i]) for i in configKeys + ['skip_ref', 'solver']]
+    return '; '.join(key)
 
-    # File 2 - temporalCoherence.h5
-    out_file = '{}{}.h5'.format(suffix, os.path.splitext(inps.outfile[1])[0])
-    metadata['FILE_TYPE'] = 'temporalCoherence'
-    metadata['UNIT'] = '1'
-    print('-'*50)
-    writefile.write(temp_coh, out_file=out_file, metadata=metadata)
 
-    # File 3 - numInvIfgram.h5
-    out_file = 'numInvIfgram{}.h5'.format(suffix)
-    metadata['FILE_TYPE'] = 'mask'
-    metadata['UNIT'] = '1'
-    print('-'*50)
-    writefile.write(num_inv_ifg, out_file=out_file, metadata=metadata)
+def write_journal(journal_file, key=None, box=None):
+    """Start the journal file with the configuration key, or append one completed box to it.
+    The file is flushed to disk after each write, to survive crashes.
+    """
+    if key is not None:
+        with open(journal_file, 'w') as f:
+            f.write('# journal of completed boxes of ifgram_inversion.py, for --resume\n')
+            f.write('KEY = {}\n'.format(key))
+            f.flush()
+            os.fsync(f.fileno())
+    if box is not None:
+        with open(journal_file, 'a') as f:
+            f.write('BOX = {}\n'.format(' '.join(str(i) for i in box)))
+            f.flush()
+            os.fsync(f.fileno())
+    return journal_file
+
+
+def read_journal(journal_file, key, out_files):
+    """Read the completed boxes from the journal file.
+    Parameters: journal_file : str, path of the journal file
+                key          : str, configuration key from get_journal_key()
+                out_files    : list of str, output files, which should all exist to resume
+    Returns:    box_done     : list of tuple of 4 int, completed boxes,
+                               empty if the journal is missing or from a different configuration
+    """
+    box_done = []
+    if not os.path.isfile(journal_file) or not all(os.path.exists(i) for i in out_files):
+        print('no journal file or output files found, start from scratch.')
+        return box_done
+
+    with open(journal_file, 'r') as f:
+        lines = [i.strip() for i in f.readlines()]
+    if 'KEY = {}'.format(key) not in lines:
+        print('journal file {} is from a different configuration, start from scratch.'.format(journal_file))
+        return box_done
+
+    for line in lines:
+        if line.startswith('BOX = '):
+            try:
+                box_done.append(tuple(int(i) for i in line.split('=')[1].split()))
+            except ValueError:
+                # partially written line at crash
+                pass
+    return box_done
+
+
+def get_mpi_comm():
+    """Get the MPI communicator of all ranks, for --mpi."""
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        raise ImportError('Cannot import mpi4py, which is required for --mpi!')
+    return MPI.COMM_WORLD
+
+
+def get_mpi_part_files(out_files, rank):
+    """Get the per-rank part files of the output files, for MPI without parallel HDF5."""
+    return ['{}.rank{}.h5'.format(os.path.splitext(i)[0], rank) for i in out_files]
+
+
+def open_mpi_output_files(out_files, comm, metadata, date_list, pbase, ts_shape):
+    """Open the output files to be written by all MPI ranks, after they are created by the root rank.
+    HDF5 files are opened with the MPI-IO driver of h5py collectively, if h5py is built with parallel HDF5,
+    and Zarr stores are written by each rank directly, as they allow concurrent writers. Otherwise, each
+    rank writes its boxes into its own part files, which are merged by the root rank afterwards.
 
-    return None
+    Parameters: out_files  : list of 3 str, output files from get_output_files()
+                comm       : mpi4py.MPI.Comm object
+                metadata / date_list / pbase / ts_shape : layout of the part files, see layout_output_files()
+    Returns:    fouts      : list of 3 str / h5py.File, for write2hdf5_box()
+                part_files : list of 3 str, part files of this rank, or None
+    """
+    import h5py
+    if all(is_zarr_file(i) for i in out_files):
+        return list(out_files), None
+
+    if h5py.get_config().mpi:
+        fouts = [i if is_zarr_file(i) else h5py.File(i, 'a', driver='mpio', comm=comm) for i in out_files]
+        return fouts, None
+
+    part_files = get_mpi_part_files(out_files, comm.Get_rank())
+    layout_output_files(part_files, metadata, date_list, pbase, ts_shape)
+    return part_files, part_files
+
+
+def close_mpi_output_files(fouts, part_files, out_files, box_list, comm):
+    """Close the output files collectively, and merge the per-rank part files on the root rank, if any.
+    Parameters: fouts / part_files : list of 3 str / h5py.File, from open_mpi_output_files()
+                out_files          : list of 3 str, output files from get_output_files()
+                box_list           : list of boxes of all ranks, split among ranks as box_list[rank::num_rank]
+                comm               : mpi4py.MPI.Comm object
+    """
+    for f in fouts:
+        if not isinstance(f, str):
+            f.close()
+    comm.Barrier()
+
+    if part_files and comm.Get_rank() == 0:
+        num_rank = comm.Get_size()
+        print('merge the part files of {} ranks into: {}'.format(num_rank, out_files))
+        for rank in range(num_rank):
+            part_files = get_mpi_part_files(out_files, rank)
+            for box in box_list[rank::num_rank]:
+                x0, y0, x1, y1 = box
+                data_list = []
+                for fname, dsName in zip(part_files, ['timeseries', 'temporalCoherence', 'mask']):
+                    with open_store(fname, 'r') as f:
+                        data_list.append(f[dsName][..., y0:y1, x0:x1])
+                write2hdf5_box(out_files, *data_list, box, print_msg=False)
+            for fname in part_files:
+                os.remove(fname)
+    return out_files
 
 
 def split_ifgram_file(ifgram_file, chunk_size=100e6):
@@ -666,7 +1153,7 @@ def read_unwrap_phase(stack_obj, box, ref_phase, unwDatasetName='unwrapPhase', d
         # read ref_phase from file itself
         if print_msg:
             print('read reference phase from file')
-        with h5py.File(stack_obj.file, 'r') as f:
+        with open_store(stack_obj.file, 'r') as f:
             ref_phase = f['refPhase'][:]
     else:
         raise Exception('No reference phase input/found on file!'+
@@ -715,10 +1202,77 @@ def read_coherence(stack_obj, box, dropIfgram=True, print_msg=True):
     return coh_data
 
 
+def read_patch_data(ifgram_file, box=None, ref_phase=None, unwDatasetName='unwrapPhase', weight_func='var',
+                    mask_dataset_name=None, mask_threshold=0.4, water_mask_file=None, var_lut=None):
+    """Read the data of one patch needed for the network inversion, as in ifgram_inversion_patch().
+    Returns:    pha_data : 2D np.ndarray in size of (num_ifgram, num_pixel), masked unwrapped phase
+                mask     : 1D np.ndarray of bool in size of (num_pixel), pixels to invert
+                weight   : 2D np.ndarray in size of (num_ifgram, num_pixel), square root of weight,
+                           None for weight_func = no / sbas or if no pixel to invert
+    """
+    stack_obj = ifgramStack(ifgram_file)
+    stack_obj.open(print_msg=False)
+    if box:
+        num_pixel = (box[3] - box[1]) * (box[2] - box[0])
+    else:
+        num_pixel = stack_obj.length * stack_obj.width
+
+    # Read/Mask unwrapPhase
+    pha_data = read_unwrap_phase(stack_obj,
+                                 box,
+                                 ref_phase,
+                                 unwDatasetName=unwDatasetName,
+                                 dropIfgram=True)
+
+    pha_data = mask_unwrap_phase(pha_data,
+                                 stack_obj,
+                                 box,
+                                 dropIfgram=True,
+                                 mask_ds_name=mask_dataset_name,
+                                 mask_threshold=mask_threshold)
+
+    # Mask for pixels to invert
+    mask = np.ones(num_pixel, np.bool_)
+    # 1 - Water Mask
+    if water_mask_file:
+        print(('skip pixels on water with mask from'
+               ' file: {}').format(os.path.basename(water_mask_file)))
+        atr_msk = readfile.read_attribute(water_mask_file)
+        if (int(atr_msk['LENGTH']), int(atr_msk['WIDTH'])) != (stack_obj.length, stack_obj.width):
+            raise ValueError('Input water mask file has different size from ifgramStack file.')
+        del atr_msk
+        dsName = [i for i in readfile.get_dataset_list(water_mask_file)
+                  if i in ['waterMask', 'mask']][0]
+        waterMask = readfile.read(water_mask_file,
+                                  datasetName=dsName,
+                                  box=box)[0].flatten()
+        mask *= np.array(waterMask, np.bool_)
+        del waterMask
+
+    # 2 - Mask for Zero Phase in ALL ifgrams
+    print('skip pixels with zero/nan value in all interferograms')
+    with warnings.catch_warnings():
+        # ignore warning message for all-NaN slices
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        phase_stack = np.nanmean(pha_data, axis=0)
+    mask *= np.multiply(~np.isnan(phase_stack), phase_stack != 0.)
+    del phase_stack
+
+    # Weight for WLS
+    weight = None
+    if weight_func not in ['no', 'sbas'] and np.any(mask):
+        L = int(stack_obj.metadata['ALOOKS']) * int(stack_obj.metadata['RLOOKS'])
+        weight = read_weight(stack_obj, box=box, weight_func=weight_func, L=L, epsilon=5e-2,
+                             var_lut=var_lut, dropIfgram=True)
+        weight = np.sqrt(weight)
+    return pha_data, mask, weight
+
+
 def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, unwDatasetName='unwrapPhase',
                            weight_func='var', min_norm_velocity=True,
                            mask_dataset_name=None, mask_threshold=0.4, min_redundancy=1.0,
-                           water_mask_file=None):
+                           water_mask_file=None, var_lut=None, solver='lstsq', residual_norm='L2',
+                           patch_data=None):
     """Invert one patch of an ifgram stack into timeseries.
     Parameters: ifgram_file       : str, interferograms stack HDF5 file, e.g. ./inputs/ifgramStack.h5
                 box               : tuple of 4 int, indicating (x0, y0, x1, y1) pixel coordinate of area of interest
@@ -730,6 +1284,12 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, unwDatasetName
                 mask_threshold    : float, min coherence of pixels if mask_dataset_name='coherence'
                 water_mask_file   : str, water mask filename if available,
                                     skip inversion on water to speed up the process
+                var_lut           : tuple of 2 np.ndarray, (coh_lut, var_lut) from get_phase_variance_lut(),
+                                    to share the LUT of weight_func='var' among patches
+                solver            : str, least squares solver, lstsq / splu / cgls, see solve_lstsq()
+                residual_norm     : str, L2 for least squares, L1 / Huber for robust inversion via IRLS
+                patch_data        : tuple of (pha_data, mask, weight) from read_patch_data(),
+                                    e.g. read in advance by blockwise.prefetch(), or None to read here
     Returns:    ts          : 3D array in size of (num_date, num_row, num_col)
                 temp_coh    : 2D array in size of (num_row, num_col)
                 num_inv_ifg : 2D array in size of (num_row, num_col)
@@ -782,46 +1342,19 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, unwDatasetName
     temp_coh    = np.zeros(num_pixel, np.float32)
     num_inv_ifg = np.zeros(num_pixel, np.int16)
 
-    # Read/Mask unwrapPhase
-    pha_data = read_unwrap_phase(stack_obj,
-                                 box,
-                                 ref_phase,
-                                 unwDatasetName=unwDatasetName,
-                                 dropIfgram=True)
-
-    pha_data = mask_unwrap_phase(pha_data,
-                                 stack_obj,
-                                 box,
-                                 dropIfgram=True,
-                                 mask_ds_name=mask_dataset_name,
-                                 mask_threshold=mask_threshold)
-
-    # Mask for pixels to invert
-    mask = np.ones(num_pixel, np.bool_)
-    # 1 - Water Mask
-    if water_mask_file:
-        print(('skip pixels on water with mask from'
-               ' file: {}').format(os.path.basename(water_mask_file)))
-        atr_msk = readfile.read_attribute(water_mask_file)
-        if (int(atr_msk['LENGTH']), int(atr_msk['WIDTH'])) != (stack_obj.length, stack_obj.width):
-            raise ValueError('Input water mask file has different size from ifgramStack file.')
-        del atr_msk
-        dsName = [i for i in readfile.get_dataset_list(water_mask_file)
-                  if i in ['waterMask', 'mask']][0]
-        waterMask = readfile.read(water_mask_file,
-                                  datasetName=dsName,
-                                  box=box)[0].flatten()
-        mask *= np.array(waterMask, np.bool_)
-        del waterMask
-
-    # 2 - Mask for Zero Phase in ALL ifgrams
-    print('skip pixels with zero/nan value in all interferograms')
-    with warnings.catch_warnings():
-        # ignore warning message for all-NaN slices
-        warnings.simplefilter("ignore", category=RuntimeWarning)
-        phase_stack = np.nanmean(pha_data, axis=0)
-    mask *= np.multiply(~np.isnan(phase_stack), phase_stack != 0.)
-    del phase_stack
+    # Read/Mask unwrapPhase and weight
+    if patch_data is None:
+        patch_data = read_patch_data(ifgram_file,
+                                     box=box,
+                                     ref_phase=ref_phase,
+                                     unwDatasetName=unwDatasetName,
+                                     weight_func=weight_func,
+                                     mask_dataset_name=mask_dataset_name,
+                                     mask_threshold=mask_threshold,
+                                     water_mask_file=water_mask_file,
+                                     var_lut=var_lut)
+    pha_data, mask, weight = patch_data
+    del patch_data
 
     # Invert pixels on mask 1+2
     num_pixel2inv = int(np.sum(mask))
@@ -850,7 +1383,8 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, unwDatasetName
                                                        ifgram=pha_data[:, mask_all_net],
                                                        weight_sqrt=None,
                                                        min_norm_velocity=min_norm_velocity,
-                                                       min_redundancy=min_redundancy)
+                                                       min_redundancy=min_redundancy,
+                                                       solver=solver)
             ts[:, mask_all_net] = tsi
             temp_coh[mask_all_net] = tcohi
             num_inv_ifg[mask_all_net] = num_ifgi
@@ -867,7 +1401,8 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, unwDatasetName
                                                            ifgram=pha_data[:, idx],
                                                            weight_sqrt=None,
                                                            min_norm_velocity=min_norm_velocity,
-                                                           min_redundancy=min_redundancy)
+                                                           min_redundancy=min_redundancy,
+                                                           solver=solver)
                 ts[:, idx] = tsi.flatten()
                 temp_coh[idx] = tcohi
                 num_inv_ifg[idx] = num_ifgi
@@ -876,11 +1411,6 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, unwDatasetName
 
     # Inversion - WLS
     else:
-        L = int(stack_obj.metadata['ALOOKS']) * int(stack_obj.metadata['RLOOKS'])
-        weight = read_coherence(stack_obj, box=box, dropIfgram=True)
-        weight = coherence2weight(weight, weight_func=weight_func, L=L, epsilon=5e-2)
-        weight = np.sqrt(weight)
-
         # Weighted Inversion pixel by pixel
         print('inverting network of interferograms into time-series ...')
         prog_bar = ptime.progressBar(maxValue=num_pixel2inv)
@@ -890,14 +1420,29 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, unwDatasetName
                                                        ifgram=pha_data[:, idx],
                                                        weight_sqrt=weight[:, idx],
                                                        min_norm_velocity=min_norm_velocity,
-                                                       min_redundancy=min_redundancy)
+                                                       min_redundancy=min_redundancy,
+                                                       solver=solver)
             ts[:, idx] = tsi.flatten()
             temp_coh[idx] = tcohi
             num_inv_ifg[idx] = num_ifgi
             prog_bar.update(i+1, every=2000, suffix='{}/{} pixels'.format(i+1, num_pixel2inv))
         prog_bar.close()
-        del weight
-    del pha_data
+
+    # Robust inversion - IRLS, starting from the L2 solution
+    if residual_norm.upper() != 'L2':
+        idx_pixel2inv = np.where(num_inv_ifg > 0)[0]
+        if weight is not None:
+            weight = weight[:, idx_pixel2inv]
+        print('re-weighting inversion of {} pixels with {} norm via IRLS ...'.format(idx_pixel2inv.size,
+                                                                                    residual_norm))
+        (ts[:, idx_pixel2inv],
+         temp_coh[idx_pixel2inv]) = estimate_timeseries_irls(A, B, tbase_diff,
+                                                             ifgram=pha_data[:, idx_pixel2inv],
+                                                             ts=ts[:, idx_pixel2inv],
+                                                             weight_sqrt=weight,
+                                                             min_norm_velocity=min_norm_velocity,
+                                                             residual_norm=residual_norm)
+    del pha_data, weight
 
     ts = ts.reshape(num_date, num_row, num_col)
     #ts_std = ts_std.reshape(num_date, num_row, num_col)
@@ -932,6 +1477,10 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     length, width = stack_obj.length, stack_obj.width
     inps.numIfgram = num_ifgram
 
+    # MPI: boxes are split among the ranks, with files created/merged on the root rank
+    comm = get_mpi_comm() if inps.mpi else None
+    rank, num_rank = (comm.Get_rank(), comm.Get_size()) if comm else (0, 1)
+
     # print key setup info
     msg = '-------------------------------------------------------------------------------\n'
     if inps.minNormVelocity:
@@ -943,6 +1492,8 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     #msg += '\tSVD for pixels with rank deficient network\n'
     msg += 'minimum redundancy: {}\n'.format(inps.minRedundancy)
     msg += 'weight function: {}\n'.format(inps.weightFunc)
+    msg += 'least squares solver: {}\n'.format(inps.solver)
+    msg += 'residual norm: {}\n'.format(inps.residualNorm)
 
     if inps.maskDataset:
         if inps.maskDataset == 'coherence':
@@ -964,10 +1515,26 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     print('number of acquisitions  : {}'.format(num_date))
     print('number of lines   : {}'.format(length))
     print('number of columns : {}'.format(width))
+    if comm:
+        print('number of MPI ranks: {}'.format(num_rank))
+
+    # weight: precompute into file or calculate the LUT once for all patches
+    var_lut = None
+    if inps.weightFunc not in ['no', 'sbas']:
+        if inps.precomputeWeight and 'var' in inps.weightFunc:
+            if rank == 0:
+                write_weight_dataset(ifgram_file, weight_func=inps.weightFunc, epsilon=5e-2)
+            if comm:
+                comm.Barrier()
+        else:
+            if inps.precomputeWeight:
+                print('WARNING: --precompute-weight is for the var weight function only, ignore it.')
+            if 'var' in inps.weightFunc:
+                L = int(stack_obj.metadata['ALOOKS']) * int(stack_obj.metadata['RLOOKS'])
+                var_lut = get_phase_variance_lut(min(L, 80))
 
     # split ifgram_file into blocks to save memory
     box_list = split2boxes(dataset_shape=stack_obj.get_size(), chunk_size=inps.chunk_size)
-    num_box = len(box_list)
 
     # read ifgram_file in small patches and write them together
     ref_phase = stack_obj.get_reference_phase(unwDatasetName=inps.unwDatasetName,
@@ -980,11 +1547,6 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     pbase = stack_obj.get_perp_baseline_timeseries(dropIfgram=True)
     date_list = stack_obj.get_date_list(dropIfgram=True)
 
-    #ts     = np.zeros((num_date, length, width), np.float32)
-    #ts_std = np.zeros((num_date, length, width), np.float32)
-    temp_coh    = np.zeros((length, width), np.float32)
-    num_inv_ifg = np.zeros((length, width), np.int16)
-
     # metadata
     metadata = dict(stack_obj.metadata)
     for key in configKeys:
@@ -994,58 +1556,85 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     metadata['FILE_TYPE'] = 'timeseries'
     metadata['UNIT'] = 'm'
 
+    # boxes to invert: split into smaller sub-boxes for dask workers
+    if inps.parallel:
+        all_boxes = []
+        for box in box_list:
+            # `box_list` is split into smaller boxes and then each box is processed in parallel
+            # With larger jobs, increasing the `num_split` factor may improve runtime
+            all_boxes += subsplit_boxes4_workers(box, num_split=1 * inps.numWorker, dimension='x')
+    else:
+        all_boxes = box_list
+
+    # output files, written box by box, with the completed boxes recorded in the journal file
+    out_files = get_output_files(inps)
+    journal_file = '{}.journal'.format(out_files[0])
+    journal_key = get_journal_key(ifgram_file, all_boxes, inps)
+    box_done = []
+    if rank == 0:
+        if inps.resume:
+            box_done = read_journal(journal_file, journal_key, out_files)
+        if box_done:
+            print('resume from journal file: {}, skip {} out of {} completed boxes'.format(
+                journal_file, len(box_done), len(all_boxes)))
+        else:
+            layout_output_files(out_files, metadata, date_list, pbase, (num_date, length, width))
+            write_journal(journal_file, key=journal_key)
+    if comm:
+        box_done = comm.bcast(box_done, root=0)
+    box2inv = [box for box in all_boxes if tuple(box) not in box_done]
+    phase2range = -1*float(metadata['WAVELENGTH']) / (4.*np.pi)
+
     # Loop
     if not inps.parallel:
-        # instantiate a timeseries object
-        ts_file = '{}.h5'.format(os.path.splitext(inps.outfile[0])[0])
-        ts_obj = timeseries(ts_file)
-
-        # A dictionary of the datasets which we like to have in the timeseries
-        dsNameDict = {
-                "date": ((np.dtype('S8'), (num_date,))),
-                "bperp": (np.float32, (num_date,)),
-                "timeseries": (np.float32, (num_date, length, width)),
-            }
-
-        # layout the HDF5 file for the datasets and the metadata
-        ts_obj.layout_hdf5(dsNameDict, metadata)
-
-        # invert & write block by block
-        phase2range = -1*float(metadata['WAVELENGTH']) / (4.*np.pi)
-        for i in range(num_box):
-            box = box_list[i]
-            if num_box > 1:
-                print('\n------- Processing Patch {} out of {} --------------'.format(i+1, num_box))
-
-            # invert the network
-            (tsi,
-             temp_cohi,
-             ifg_numi) = ifgram_inversion_patch(ifgram_file,
-                                                box=box,
-                                                ref_phase=ref_phase,
-                                                unwDatasetName=inps.unwDatasetName,
-                                                weight_func=inps.weightFunc,
-                                                min_norm_velocity=inps.minNormVelocity,
-                                                mask_dataset_name=inps.maskDataset,
-                                                mask_threshold=inps.maskThreshold,
-                                                min_redundancy=inps.minRedundancy,
-                                                water_mask_file=inps.waterMaskFile)
-
-            # write the block of timeseries to disk
-            print('converting phase to range')
-            tsi *= phase2range
-            block = [0, num_date, box[1], box[3], box[0], box[2]]
-            ts_obj.write2hdf5_block(tsi, datasetName='timeseries', block=block)
-
-            # save the block of aux datasets
-            temp_coh[box[1]:box[3], box[0]:box[2]] = temp_cohi
-            num_inv_ifg[box[1]:box[3], box[0]:box[2]] = ifg_numi
-
-        # write date and bperp to disk
-        print('-'*50)
-        date_list_utf8 = [dt.encode('utf-8') for dt in date_list]
-        ts_obj.write2hdf5_block(date_list_utf8, datasetName='date')
-        ts_obj.write2hdf5_block(pbase, datasetName='bperp')
+        # MPI: each rank inverts every num_rank-th box and writes it by itself, without journal, as
+        # the written boxes may be in the MPI-IO buffer or the part files until all ranks finish
+        fouts, part_files = out_files, None
+        rank_boxes = box2inv[rank::num_rank]
+        if comm:
+            comm.Barrier()
+            fouts, part_files = open_mpi_output_files(out_files, comm, metadata, date_list, pbase,
+                                                      (num_date, length, width))
+
+        # invert & write block by block, with the next block read and the previous block written
+        # on background threads, to overlap I/O with the inversion (MPI-IO calls stay in the main thread)
+        read_args = [(ifgram_file, box, ref_phase, inps.unwDatasetName, inps.weightFunc,
+                      inps.maskDataset, inps.maskThreshold, inps.waterMaskFile, var_lut)
+                     for box in rank_boxes]
+        patch_data_list = blockwise.prefetch(read_patch_data, read_args)
+        with blockwise.AsyncWriter(max_pending=0 if comm else 2) as writer:
+            for i, (box, patch_data) in enumerate(zip(rank_boxes, patch_data_list)):
+                if len(rank_boxes) > 1:
+                    print('\n------- Processing Patch {} out of {} --------------'.format(i+1, len(rank_boxes)))
+
+                # invert the network
+                (tsi,
+                 temp_cohi,
+                 ifg_numi) = ifgram_inversion_patch(ifgram_file,
+                                                    box=box,
+                                                    ref_phase=ref_phase,
+                                                    unwDatasetName=inps.unwDatasetName,
+                                                    weight_func=inps.weightFunc,
+                                                    min_norm_velocity=inps.minNormVelocity,
+                                                    mask_dataset_name=inps.maskDataset,
+                                                    mask_threshold=inps.maskThreshold,
+                                                    min_redundancy=inps.minRedundancy,
+                                                    water_mask_file=inps.waterMaskFile,
+                                                    var_lut=var_lut,
+                                                    solver=inps.solver,
+                                                    residual_norm=inps.residualNorm,
+                                                    patch_data=patch_data)
+                del patch_data
+
+                # write the block of timeseries and aux datasets to disk
+                print('converting phase to range')
+                tsi *= phase2range
+                writer.submit(write2hdf5_box, fouts, tsi, temp_cohi, ifg_numi, box)
+                if not comm:
+                    writer.submit(write_journal, journal_file, box=box)
+
+        if comm:
+            close_mpi_output_files(fouts, part_files, out_files, box2inv, comm)
 
     # Parallel loop
     else:
@@ -1057,7 +1646,6 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
         except ImportError:
             raise ImportError('Cannot import dask.distributed or dask_jobqueue!')
 
-        ts = np.zeros((num_date, length, width), np.float32)
         python_executable_location = sys.executable
 
         # Look at the ~/.config/dask/dask_mintpy.yaml file for Changing the Dask configuration defaults
@@ -1080,15 +1668,9 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
         # or "main" block, each worker will try to create its own client (which is bad) when loading the module
         client = Client(cluster)
 
-        all_boxes = []
-        for box in box_list:
-            # `box_list` is split into smaller boxes and then each box is processed in parallel
-            # With larger jobs, increasing the `num_split` factor may improve runtime
-            all_boxes += subsplit_boxes4_workers(box, num_split=1 * NUM_WORKERS, dimension='x')
-
         futures = []
         start_time_subboxes = time.time()
-        for i, subbox in enumerate(all_boxes):
+        for i, subbox in enumerate(box2inv):
             print(i, subbox)
 
             data = (ifgram_file,
@@ -1100,7 +1682,12 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
                     inps.maskDataset,
                     inps.maskThreshold,
                     inps.minRedundancy,
-                    inps.waterMaskFile)
+                    inps.waterMaskFile,
+                    var_lut,
+                    inps.solver,
+                    inps.residualNorm,
+                    out_files if is_zarr_file(out_files[0]) else None,
+                    phase2range)
 
             # David: I haven't played with fussing with `retries`, however sometimes a future fails
             # on a worker for an unknown reason. retrying will save the whole process from failing.
@@ -1116,14 +1703,16 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
         i_future = 0
         for future, result in as_completed(futures, with_results=True):
             i_future += 1
+            tsi, temp_cohi, ifg_numi, subbox = result
             print("FUTURE #" + str(i_future), "complete in", time.time() - start_time_subboxes,
                   "seconds. Box:", subbox, "Time:", time.time())
-            tsi, temp_cohi, ifg_numi, subbox = result
 
-            ts[:, subbox[1]:subbox[3], subbox[0]:subbox[2]] = tsi
-            #ts_std[:, subbox[1]:subbox[3], subbox[0]:subbox[2]] = ts_stdi
-            temp_coh[subbox[1]:subbox[3], subbox[0]:subbox[2]] = temp_cohi
-            num_inv_ifg[subbox[1]:subbox[3], subbox[0]:subbox[2]] = ifg_numi
+            # write the sub-box to disk as it completes, so that only the missing ones are re-submitted
+            # (for Zarr outputs, the sub-box is written by the worker already)
+            if tsi is not None:
+                tsi *= phase2range
+                write2hdf5_box(out_files, tsi, temp_cohi, ifg_numi, subbox, print_msg=False)
+            write_journal(journal_file, box=subbox)
 
         # Shut down Dask workers gracefully
         cluster.close()
@@ -1132,16 +1721,18 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
         ut.move_dask_stdout_stderr_files()
 
     # reference pixel
-    ref_y = int(stack_obj.metadata['REF_Y'])
-    ref_x = int(stack_obj.metadata['REF_X'])
-    num_inv_ifg[ref_y, ref_x] = num_ifgram
-    temp_coh[ref_y, ref_x] = 1.
-
-    if inps.parallel:
-        # for dask still use the old function to write. This needs also migrate to block-by-block writing
-        write2hdf5_file(ifgram_file, metadata, ts, temp_coh, num_inv_ifg, suffix='', inps=inps)
-    else:
-        write2hdf5_auxFiles(metadata, temp_coh, num_inv_ifg, suffix='', inps=inps)
+    if rank == 0:
+        ref_y = int(stack_obj.metadata['REF_Y'])
+        ref_x = int(stack_obj.metadata['REF_X'])
+        write2hdf5_box(out_files,
+                       tsi=None,
+                       temp_cohi=np.ones((1, 1), np.float32),
+                       ifg_numi=np.full((1, 1), num_ifgram, np.int16),
+                       box=(ref_x, ref_y, ref_x+1, ref_y+1),
+                       print_msg=False)
+
+        # all boxes are completed
+        os.remove(journal_file)
 
     m, s = divmod(time.time()-start_time, 60)
     print('time used: {:02.0f} mins {:02.1f} secs.\n'.format(m, s))
@@ -1157,7 +1748,8 @@ def parallel_ifgram_inversion_patch(data):
     (ifgram_file, box, ref_phase, unwDatasetName,
      weight_func, min_norm_velocity,
      mask_dataset_name, mask_threshold,
-     min_redundancy, water_mask_file) = data
+     min_redundancy, water_mask_file, var_lut, solver, residual_norm,
+     out_files, phase2range) = data
 
     print("BOX DIMS:", box)
 
@@ -1173,7 +1765,16 @@ def parallel_ifgram_inversion_patch(data):
                                         mask_dataset_name=mask_dataset_name,
                                         mask_threshold=mask_threshold,
                                         min_redundancy=min_redundancy,
-                                        water_mask_file=water_mask_file)
+                                        water_mask_file=water_mask_file,
+                                        var_lut=var_lut,
+                                        solver=solver,
+                                        residual_norm=residual_norm)
+
+    # write into the Zarr stores directly, instead of sending the result back to the client
+    if out_files:
+        tsi *= phase2range
+        write2hdf5_box(out_files, tsi, temp_cohi, ifg_numi, box, print_msg=False)
+        return None, None, None, box
 
     return tsi, temp_cohi, ifg_numi, box
 
@@ -1182,16 +1783,21 @@ def parallel_ifgram_inversion_patch(data):
 def main(iargs=None):
     inps = cmd_line_parse(iargs)
 
+    # MPI: print messages on the root rank only
+    comm = get_mpi_comm() if inps.mpi else None
+    if comm and comm.Get_rank() > 0:
+        sys.stdout = open(os.devnull, 'w')
+
     # --update option
-    if inps.update_mode and run_or_skip(inps) == 'skip':
-        return inps.outfile
+    if inps.update_mode:
+        flag = run_or_skip(inps) if not comm or comm.Get_rank() == 0 else None
+        if comm:
+            flag = comm.bcast(flag, root=0)
+        if flag == 'skip':
+            return inps.outfile
 
     # Network Inversion
-    if inps.residualNorm == 'L2':
-        ifgram_inversion(inps.ifgramStackFile, inps)
-    else:
-        raise NotImplementedError('L1 norm minimization is not fully tested.')
-        #ut.timeseries_inversion_L1(inps.ifgramStackFile, inps.timeseriesFile)
+    ifgram_inversion(inps.ifgramStackFile, inps)
     return inps.outfile
 
 
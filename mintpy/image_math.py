@@ -8,8 +8,9 @@
 
 import os
 import argparse
+from functools import partial
 import numpy as np
-from mintpy.utils import readfile, writefile
+from mintpy.utils import readfile, blockwise
 
 
 #######################################################################################
@@ -34,6 +35,10 @@ def create_parser():
                         '+', '-', '*', '/', '^'], help='mathmatical operator')
     parser.add_argument('operand', metavar='VALUE', type=float,
                         help='value to be operated with input file')
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     return parser
 
 
@@ -60,7 +65,12 @@ def data_operation(data, operator, operand):
     return data_out
 
 
-def file_operation(fname, operator, operand, out_file=None):
+def operation_block(data_list, block, operator, operand):
+    """Mathmatic operation kernel for blockwise.process_file()"""
+    return data_operation(data_list[0], operator, operand)
+
+
+def file_operation(fname, operator, operand, out_file=None, max_memory=2, num_worker=1):
     """Mathmathic operation of file"""
 
     # Basic Info
@@ -84,14 +94,12 @@ def file_operation(fname, operator, operand, out_file=None):
         out_file = '{}_{}{}{}'.format(os.path.splitext(fname)[0], suffix,
                                       str(operand), os.path.splitext(fname)[1])
 
-    atr = readfile.read_attribute(fname)
-    dsNames = readfile.get_dataset_list(fname)
-    dsDict = {}
-    for dsName in dsNames:
-        data = readfile.read(fname, datasetName=dsName)[0]
-        data = data_operation(data, operator, operand)
-        dsDict[dsName] = data
-    writefile.write(dsDict, out_file=out_file, metadata=atr, ref_file=fname)
+    blockwise.process_file(fname, out_file,
+                           func=partial(operation_block, operator=operator, operand=operand),
+                           metadata=atr,
+                           ref_file=fname,
+                           max_memory=max_memory,
+                           num_worker=num_worker)
     return out_file
 
 
@@ -99,7 +107,9 @@ def file_operation(fname, operator, operand, out_file=None):
 def main(iargs=None):
     inps = cmd_line_parse(iargs)
 
-    inps.outfile = file_operation(inps.file, inps.operator, inps.operand, inps.outfile)
+    inps.outfile = file_operation(inps.file, inps.operator, inps.operand, inps.outfile,
+                                  max_memory=inps.max_memory,
+                                  num_worker=inps.num_worker)
 
     print('Done.')
     return inps.outfile
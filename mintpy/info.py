@@ -8,14 +8,17 @@
 
 import os
 import argparse
-import h5py
 import numpy as np
 from mintpy.utils import readfile, ptime
 from mintpy.objects import (giantIfgramStack, 
                             giantTimeseries, 
                             ifgramStack, 
                             timeseries, 
-                            HDFEOS)
+                            HDFEOS,
+                            open_store,
+                            is_zarr_file,
+                            DATASET_CLASSES,
+                            GROUP_CLASSES)
 
 
 ############################################################
@@ -77,7 +80,7 @@ def cmd_line_parse(iargs=None):
     parser = create_parser()
     inps = parser.parse_args(args=iargs)
 
-    if not os.path.isfile(inps.file):
+    if not os.path.isfile(inps.file) and not (is_zarr_file(inps.file) and os.path.isdir(inps.file)):
         raise FileExistsError(inps.file)
 
     inps.max_meta_num = 200
@@ -121,9 +124,9 @@ def print_hdf5_structure(fname, max_meta_num=200):
 
     def hdf5_structure2string(name, obj):
         global h5_string, maxDigit
-        if isinstance(obj, h5py.Group):
+        if isinstance(obj, GROUP_CLASSES):
             h5_string += 'HDF5 group   "/{n}"\n'.format(n=name)
-        elif isinstance(obj, h5py.Dataset):
+        elif isinstance(obj, DATASET_CLASSES):
             h5_string += ('HDF5 dataset "/{n:<{w}}": shape {s:<20}, '
                           'dtype <{t}>\n').format(n=name,
                                                   w=maxDigit,
@@ -133,7 +136,7 @@ def print_hdf5_structure(fname, max_meta_num=200):
         if len(atr) > 0:
             h5_string += attributes2string(atr, max_meta_num=max_meta_num)+"\n"
 
-    f = h5py.File(fname, 'r')
+    f = open_store(fname, 'r')
     # grab metadata in root level as it will be missed in hdf5_structure2string()
     atr = dict(f.attrs)
     if len(atr) > 0:
@@ -255,10 +258,10 @@ def print_dataset(fname, dsName):
     global dsNames
     def get_hdf5_dataset(name, obj):
         global dsNames
-        if isinstance(obj, h5py.Dataset):
+        if isinstance(obj, DATASET_CLASSES):
             dsNames.append(name)
     dsNames = []
-    with h5py.File(fname, 'r') as f:
+    with open_store(fname, 'r') as f:
         f.visititems(get_hdf5_dataset)
 
     # check input dataset
@@ -268,7 +271,7 @@ def print_dataset(fname, dsName):
         raise ValueError(msg)
 
     # print dataset values
-    with h5py.File(fname, 'r') as f:
+    with open_store(fname, 'r') as f:
         data = f[dsName][:]
         print(data)
 
@@ -282,7 +285,7 @@ def print_dataset(fname, dsName):
 ############################################################
 def main(iargs=None):
     inps = cmd_line_parse(iargs)
-    ext = os.path.splitext(inps.file)[1].lower()
+    ext = os.path.splitext(inps.file.rstrip('/'))[1].lower()
 
     # --date option
     if inps.disp_date:
@@ -310,7 +313,7 @@ def main(iargs=None):
     print_aux_info(inps.file)
 
     # Generic Attribute/Structure of all files
-    if ext in ['.h5', '.he5']:
+    if ext in ['.h5', '.he5', '.zarr']:
         print('\n{} {:*<40}'.format('*'*20, 'HDF5 File Structure '))
         print_hdf5_structure(inps.file, max_meta_num=inps.max_meta_num)
     else:
@@ -9,8 +9,9 @@
 import os
 import sys
 import argparse
+from functools import partial
 import numpy as np
-from mintpy.utils import readfile, writefile
+from mintpy.utils import readfile, blockwise
 
 
 ############################################################
@@ -46,6 +47,10 @@ def create_parser():
                         help='subset range in x/cross-track/column direction')
     parser.add_argument('-y', dest='subset_y', type=int, nargs=2,
                         help='subset range in y/along-track/row direction')
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     return parser
 
 
@@ -77,6 +82,12 @@ def mask_matrix(data, mask, fill_value=np.nan):
     return data
 
 
+def mask_block(data_list, block, mask, fill_value=np.nan):
+    """Mask kernel for blockwise.process_file()"""
+    mask = mask[block[-4]:block[-3], block[-2]:block[-1]]
+    return mask_matrix(data_list[0], mask, fill_value=fill_value)
+
+
 def update_mask_with_inps(mask, inps=None, print_msg=True):
     """Update mask matrix from input options: subset_x/y and threshold"""
     if not inps:
@@ -118,30 +129,19 @@ def mask_file(fname, mask_file, out_file, inps=None):
     mask = readfile.read(mask_file)[0]
     mask = update_mask_with_inps(mask, inps)
 
-    # masking input file
-    atr = readfile.read_attribute(fname)
-    dsNames = readfile.get_dataset_list(fname)
-    maxDigit = max([len(i) for i in dsNames])
-    dsDict = {}
-    for dsName in dsNames:
-        if dsName not in ['coherence']:
-            print('masking {d:<{w}} from {f} ...'.format(d=dsName, w=maxDigit, f=fname))
-            data = readfile.read(fname, datasetName=dsName, print_msg=False)[0]
-            
-            # keep timeseries data as 3D matrix when there is only one acquisition
-            # because readfile.read() will squeeze it to 2D
-            if atr['FILE_TYPE'] == 'timeseries' and len(data.shape) == 2:
-                data = np.reshape(data, (1, data.shape[0], data.shape[1]))
-
-            data = mask_matrix(data, mask, fill_value=inps.fill_value)
-        dsDict[dsName] = data
-
     # default output filename
     if not out_file:
         fbase, fext = os.path.splitext(fname)
         out_file = '{}_msk{}'.format(fbase, fext)
 
-    writefile.write(dsDict, out_file=out_file, ref_file=fname)
+    # masking input file block by block
+    print('masking {} ...'.format(fname))
+    blockwise.process_file(fname, out_file,
+                           func=partial(mask_block, mask=mask, fill_value=inps.fill_value),
+                           ref_file=fname,
+                           skip_datasets=['coherence'],
+                           max_memory=inps.max_memory,
+                           num_worker=inps.num_worker)
     return out_file
 
 
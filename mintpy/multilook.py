@@ -10,8 +10,9 @@ import os
 import sys
 import argparse
 import warnings
+from functools import partial
 import numpy as np
-from mintpy.utils import readfile, writefile, utils as ut
+from mintpy.utils import readfile, blockwise, utils as ut
 
 
 ##################################################################################################
@@ -38,6 +39,10 @@ def create_parser():
                         help='Output file name. Disabled when more than 1 input files')
     parser.add_argument('--no-parallel', dest='parallel', action='store_false', default=True,
                         help='Disable parallel processing. Diabled auto for 1 input file.')
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     return parser
 
 
@@ -106,6 +111,11 @@ def multilook_data(data, lksY, lksX):
     return coarseData
 
 
+def multilook_block(data_list, block, lks_y, lks_x):
+    """Multilook kernel for blockwise.process_file()"""
+    return multilook_data(data_list[0], lks_y, lks_x)
+
+
 def multilook_attribute(atr_dict, lks_y, lks_x, print_msg=True):
     atr = dict()
     for key, value in iter(atr_dict.items()):
@@ -158,7 +168,15 @@ def multilook_attribute(atr_dict, lks_y, lks_x, print_msg=True):
     return atr
 
 
-def multilook_file(infile, lks_y, lks_x, outfile=None):
+def multilook_file(infile, lks_y, lks_x, outfile=None, max_memory=2, num_worker=1):
+    """Multilook input file block by block.
+    Parameters: infile     : str, path of input file
+                lks_y/x    : int, number of looks in y / x direction
+                outfile    : str, path of output file
+                max_memory : float, maximum memory in GB for each block
+                num_worker : int, number of parallel processes
+    Returns:    outfile    : str
+    """
     lks_y = int(lks_y)
     lks_x = int(lks_x)
 
@@ -178,24 +196,15 @@ def multilook_file(infile, lks_y, lks_x, outfile=None):
             outfile = os.path.basename(infile)
     #print('writing >>> '+outfile)
 
-    # read source data and multilooking
-    dsNames = readfile.get_dataset_list(infile)
-    maxDigit = max([len(i) for i in dsNames])
-    dsDict = dict()
-    for dsName in dsNames:
-        print('multilooking {d:<{w}} from {f} ...'.format(
-            d=dsName, w=maxDigit, f=os.path.basename(infile)))
-        data = readfile.read(infile, datasetName=dsName, print_msg=False)[0]
-
-        # keep timeseries data as 3D matrix when there is only one acquisition
-        # because readfile.read() will squeeze it to 2D
-        if atr['FILE_TYPE'] == 'timeseries' and len(data.shape) == 2:
-            data = np.reshape(data, (1, data.shape[0], data.shape[1]))
-
-        data = multilook_data(data, lks_y, lks_x)
-        dsDict[dsName] = data
+    # read source data, multilooking and write block by block
     atr = multilook_attribute(atr, lks_y, lks_x)
-    writefile.write(dsDict, out_file=outfile, metadata=atr, ref_file=infile)
+    blockwise.process_file(infile, outfile,
+                           func=partial(multilook_block, lks_y=lks_y, lks_x=lks_x),
+                           metadata=atr,
+                           ref_file=infile,
+                           lks=(lks_y, lks_x),
+                           max_memory=max_memory,
+                           num_worker=num_worker)
     return outfile
 
 
@@ -204,7 +213,8 @@ def main(iargs=None):
     inps = cmd_line_parse(iargs)
 
     for infile in inps.file:
-        multilook_file(infile, lks_y=inps.lks_y, lks_x=inps.lks_x, outfile=inps.outfile)
+        multilook_file(infile, lks_y=inps.lks_y, lks_x=inps.lks_x, outfile=inps.outfile,
+                       max_memory=inps.max_memory, num_worker=inps.num_worker)
 
     print('Done.')
     return
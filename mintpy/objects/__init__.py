@@ -1,6 +1,7 @@
 from .giant import *
 from .stack import *
 from .ramp import *
+from .zarr_store import *
 
 
 ## Sub-module dependency graph:
@@ -13,7 +13,6 @@ import time
 import codecs
 from datetime import datetime as dt
 import numpy as np
-from pyproj import Geod
 from urllib.request import urlretrieve
 
 from mintpy.objects import timeseries
@@ -219,6 +218,7 @@ class GPS:
 
         az = np.arctan2(e0, n0) / np.pi * 180.
         dist = np.sqrt(e0**2 + n0**2)
+        from pyproj import Geod
         g = Geod(ellps='WGS84')
         self.site_lon, self.site_lat = g.fwd(ref_lon, ref_lat, az, dist)[0:2]
         return self.site_lat, self.site_lon
@@ -19,6 +19,118 @@ RAMP_LIST = [
 ]
 
 
+def get_design_matrix4ramp(ramp_type, shape, box=None):
+    """Design matrix of ramp estimation, with pixel coordinates normalized by the image size
+    for numerical stability of the normal equation.
+    Parameters: ramp_type : str, name of ramp to be estimated
+                shape     : tuple of 2 int, (length, width) of the whole image
+                box       : tuple of 4 int, (x0, y0, x1, y1) of the pixels, default is the whole image
+    Returns:    G         : 2D np.ndarray in float64 in size of (num_pixel, num_param)
+    """
+    length, width = shape
+    if box is None:
+        box = (0, 0, width, length)
+    xx, yy = np.meshgrid(np.arange(box[0], box[2], dtype=np.float64) / width,
+                         np.arange(box[1], box[3], dtype=np.float64) / length)
+    xx = xx.reshape(-1, 1)
+    yy = yy.reshape(-1, 1)
+    ones = np.ones(xx.shape, dtype=np.float64)
+    if ramp_type == 'linear':
+        G = np.hstack((yy, xx, ones))
+    elif ramp_type == 'quadratic':
+        G = np.hstack((yy**2, xx**2, yy*xx, yy, xx, ones))
+    elif ramp_type == 'linear_range':
+        G = np.hstack((xx, ones))
+    elif ramp_type == 'linear_azimuth':
+        G = np.hstack((yy, ones))
+    elif ramp_type == 'quadratic_range':
+        G = np.hstack((xx**2, xx, ones))
+    elif ramp_type == 'quadratic_azimuth':
+        G = np.hstack((yy**2, yy, ones))
+    else:
+        raise ValueError('un-recognized ramp type: {}'.format(ramp_type))
+    return G
+
+
+def get_normal_equation4ramp(data, mask, G, common_mask=False):
+    """Normal equation (G^T G) x = G^T d of ramp estimation for a block of pixels, to be accumulated
+    block by block. Pixels with NaN or zero value are ignored.
+    Parameters: data        : 2D np.ndarray in size of (num_slice, num_pixel)
+                mask        : 1D np.ndarray of bool in size of (num_pixel,), pixels used for ramp estimation
+                G           : 2D np.ndarray in size of (num_pixel, num_param), design matrix
+                common_mask : bool, True to ignore pixels with NaN or zero value in the temporal mean,
+                              for all slices; False to ignore them for each slice separately
+    Returns:    GtG         : 3D np.ndarray in size of (num_slice, num_param, num_param)
+                Gtd         : 2D np.ndarray in size of (num_slice, num_param)
+                flag        : 1D np.ndarray of bool in size of (num_slice,),
+                              True for slices with GtG of the mask, shared by all of them
+    """
+    num_slice = data.shape[0]
+    if common_mask:
+        dmean = np.mean(data, axis=0)
+        mask = mask * ~np.isnan(dmean) * (dmean != 0.)
+
+    Gm = G[mask, :]
+    dm = np.array(data[:, mask], dtype=np.float64)
+    GtG = np.tile(np.dot(Gm.T, Gm), (num_slice, 1, 1))
+    flag = np.ones(num_slice, dtype=np.bool_)
+
+    if not common_mask:
+        invalid = np.isnan(dm) + (dm == 0.)
+        dm[invalid] = 0.
+        num_invalid = np.sum(invalid, axis=1)
+        for i in np.where(num_invalid > 0)[0]:
+            flag[i] = False
+            if num_invalid[i] < Gm.shape[0] / 2:
+                # remove the few invalid pixels from the gram matrix of the mask
+                Gi = Gm[invalid[i, :], :]
+                GtG[i] -= np.dot(Gi.T, Gi)
+            else:
+                Gi = Gm[~invalid[i, :], :]
+                GtG[i] = np.dot(Gi.T, Gi)
+
+    Gtd = np.dot(dm, Gm)
+    return GtG, Gtd, flag
+
+
+def estimate_ramp_coeff(GtG, Gtd, flag=None):
+    """Solve the normal equation of ramp estimation, with the least squares minimum norm solution.
+    The gram matrix shared by slices is factorized once.
+    Parameters: GtG  : 3D np.ndarray in size of (num_slice, num_param, num_param)
+                Gtd  : 2D np.ndarray in size of (num_slice, num_param)
+                flag : 1D np.ndarray of bool, slices sharing the same GtG
+    Returns:    X    : 2D np.ndarray in size of (num_slice, num_param), ramp coefficients
+    """
+    num_slice = Gtd.shape[0]
+    if flag is None:
+        flag = np.zeros(num_slice, dtype=np.bool_)
+
+    X = np.zeros(Gtd.shape, dtype=np.float64)
+    if np.any(flag):
+        i = np.where(flag)[0][0]
+        X[flag] = np.dot(Gtd[flag], np.linalg.pinv(GtG[i]).T)
+    if not np.all(flag):
+        X[~flag] = np.einsum('nij,nj->ni', np.linalg.pinv(GtG[~flag]), Gtd[~flag])
+    return X
+
+
+def get_ramp(X, G, data, ref_G=None):
+    """Evaluate the ramp of pixels from the coefficients.
+    Parameters: X     : 2D np.ndarray in size of (num_slice, num_param), ramp coefficients
+                G     : 2D np.ndarray in size of (num_pixel, num_param), design matrix
+                data  : 2D np.ndarray in size of (num_slice, num_pixel), pixels with zero value are not changed
+                ref_G : 2D np.ndarray in size of (1, num_param), design matrix of the reference pixel
+    Returns:    ramp  : 2D np.ndarray in size of (num_slice, num_pixel), in the data type of data
+    """
+    ramp = np.dot(G, X.T).T
+    # reference in space
+    if ref_G is not None:
+        ramp -= np.dot(ref_G, X.T).T
+    # do not change pixel with original zero value
+    ramp[data == 0] = 0
+    return np.array(ramp, dtype=data.dtype)
+
+
 def deramp(data, mask_in, ramp_type='linear', metadata=None):
     '''Remove ramp from input data matrix based on pixel marked by mask
     Ignore data with nan or zero value.
@@ -32,65 +144,26 @@ def deramp(data, mask_in, ramp_type='linear', metadata=None):
     '''
     dshape = data.shape
     length, width = dshape[-2:]
-    num_pixel = length * width
+    data = data.reshape(-1, length * width)
 
-    # prepare input data
-    if len(dshape) == 3:
-        data = np.moveaxis(data, 0, -1)        #reshape to (length, width, numDate)
-        data = data.reshape(num_pixel, -1)
-        dmean = np.mean(data, axis=-1).flatten()
-    else:
-        data = data.reshape(-1, 1)
-        dmean = np.array(data).flatten()
-
-    ## mask
-    # default
+    # mask
     if mask_in is None:
         mask_in = np.ones((length, width), dtype=np.float32)
     mask = (mask_in != 0).flatten()
-    # ignore pixels with NaN or zero data value
-    mask *= np.multiply(~np.isnan(dmean), dmean != 0.)
-
-    # design matrix
-    xx, yy = np.meshgrid(np.arange(0, width),
-                         np.arange(0, length))
-    xx = xx.reshape(-1, 1)
-    yy = yy.reshape(-1, 1)
-    ones = np.ones(xx.shape, dtype=np.float32)
-    if ramp_type == 'linear':
-        G = np.hstack((yy, xx, ones))
-    elif ramp_type == 'quadratic':
-        G = np.hstack((yy**2, xx**2, yy*xx, yy, xx, ones))
-    elif ramp_type == 'linear_range':
-        G = np.hstack((xx, ones))
-    elif ramp_type == 'linear_azimuth':
-        G = np.hstack((yy, ones))
-    elif ramp_type == 'quadratic_range':
-        G = np.hstack((xx**2, xx, ones))
-    elif ramp_type == 'quadratic_azimuth':
-        G = np.hstack((yy**2, yy, ones))
-    else:
-        raise ValueError('un-recognized ramp type: {}'.format(ramp_type))
 
     # estimate ramp
-    X = np.dot(np.linalg.pinv(G[mask, :], rcond=1e-15), data[mask, :])
-    ramp = np.dot(G, X)
+    G = get_design_matrix4ramp(ramp_type, (length, width))
+    GtG, Gtd, flag = get_normal_equation4ramp(data, mask, G, common_mask=len(dshape) == 3)
+    X = estimate_ramp_coeff(GtG, Gtd, flag)
 
     # reference in space if metadata
+    ref_G = None
     if metadata:
         ref_y, ref_x = int(metadata['REF_Y']), int(metadata['REF_X'])
-        ref_idx = ref_y * width + ref_x
-        ramp -= ramp[ref_idx, :]
-
-    # do not change pixel with original zero value
-    ramp[data == 0] = 0
-    ramp = np.array(ramp, dtype=data.dtype)
+        ref_G = G[ref_y * width + ref_x, :].reshape(1, -1)
 
+    ramp = get_ramp(X, G, data, ref_G=ref_G)
     data_out = data - ramp
-    if len(dshape) == 3:
-        ramp = np.moveaxis(ramp, -1, 0)
-        data_out = np.moveaxis(data_out, -1, 0)
     ramp = ramp.reshape(dshape)
     data_out = data_out.reshape(dshape)
     return data_out, ramp
-
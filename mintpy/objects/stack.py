@@ -9,11 +9,10 @@
 
 
 import os
-import sys
 import time
 import datetime as dt
-import h5py
 import numpy as np
+from mintpy.objects.zarr_store import open_store, DATASET_CLASSES, GROUP_CLASSES
 
 
 BOOL_ZERO = np.bool_(0)
@@ -123,6 +122,46 @@ datasetUnitDict = {'unwrapPhase'        :'radian',
                    }
 
 
+## pixel-major (time-contiguous) companion of 3D datasets, written by writefile.write_pixel_major()
+# /pixel_major/{datasetName} : 3D array in size of (l, w, n), chunked in (tile, tile, n)
+# removed by writefile.remove_derived_datasets() when the dataset is re-written in place
+PIXEL_MAJOR_GROUP = 'pixel_major'
+# max number of pixels of the box to read from the pixel-major companion
+PIXEL_MAJOR_MAX_NUM_PIXEL = 64 * 64
+
+## statistics cache of 3D datasets, written by ifgramStack.scan_stats()
+# /stats_cache/{datasetName}/{statName} : array of the statistic, with its configuration in attribute KEY
+STATS_CACHE_GROUP = 'stats_cache'
+# statistics in time (of kept ifgrams) and in space (of each ifgram)
+IFGRAM_TEMPORAL_STATS = ['temporal_average', 'nonzero_mask']
+IFGRAM_SPATIAL_STATS = ['spatial_average', 'min', 'max']
+
+
+def read_3d_dataset(f, ds, flag, box):
+    """Read 3D dataset in box, from its pixel-major companion if available for small box.
+
+    For a point or small box, reading along the 1st dimension of the (n, l, w) layout
+    touches one chunk per slice; while the pixel-major companion in (l, w, n) layout
+    returns the whole history with one contiguous read.
+
+    Parameters: f    : h5py.File object
+                ds   : h5py.Dataset object in size of (n, l, w)
+                flag : 1D np.ndarray of bool in size of (n,), slices to read
+                box  : tuple of 4 int, for (x0, y0, x1, y1)
+    Returns:    data : 3D np.ndarray in size of (num_flag, y1-y0, x1-x0)
+    """
+    num_pixel = (box[2] - box[0]) * (box[3] - box[1])
+    pm_name = '{}{}'.format(PIXEL_MAJOR_GROUP, ds.name)
+    if num_pixel <= PIXEL_MAJOR_MAX_NUM_PIXEL and pm_name in f:
+        ds_pm = f[pm_name]
+        # skip out-of-date companion
+        if ds_pm.shape == (ds.shape[1], ds.shape[2], ds.shape[0]):
+            data = ds_pm[box[1]:box[3], box[0]:box[2], :]
+            if not np.all(flag):
+                data = data[:, :, flag]
+            return np.ascontiguousarray(np.moveaxis(data, -1, 0))
+    return ds[flag, box[1]:box[3], box[0]:box[2]]
+
 
 ################################ timeseries class begin ################################
 FILE_STRUCTURE_TIMESERIES = """
@@ -155,7 +194,7 @@ class timeseries:
 
     def open_hdf5(self, mode='a'):
         print('open {} in {} mode'.format(self.file, mode))
-        self.f = h5py.File(self.file, mode)
+        self.f = open_store(self.file, mode)
         return self.f
 
     def open(self, print_msg=True):
@@ -166,7 +205,7 @@ class timeseries:
         self.get_date_list()
         self.numPixel = self.length * self.width
 
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             try:
                 self.pbase = f['bperp'][:]
                 self.pbase -= self.pbase[self.refIndex]
@@ -181,7 +220,7 @@ class timeseries:
         return None
 
     def get_metadata(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.metadata = dict(f.attrs)
             dates = f['date'][:]
         for key, value in self.metadata.items():
@@ -200,12 +239,12 @@ class timeseries:
         return self.metadata
 
     def get_size(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.numDate, self.length, self.width = f[self.name].shape
         return self.numDate, self.length, self.width
 
     def get_date_list(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.dateList = [i.decode('utf8') for i in f['date'][:]]
         return self.dateList
 
@@ -233,9 +272,9 @@ class timeseries:
             datasetName = [datasetName]
         datasetName = [i.replace('timeseries', '').replace('-', '') for i in datasetName]
 
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             ds = f[self.name]
-            if isinstance(ds, h5py.Group):  # support for old mintpy files
+            if isinstance(ds, GROUP_CLASSES):  # support for old mintpy files
                 ds = ds[self.name]
 
             # Get dateFlag - mark in time/1st dimension
@@ -250,7 +289,7 @@ class timeseries:
             if box is None:
                 box = [0, 0, self.width, self.length]
 
-            data = ds[dateFlag, box[1]:box[3], box[0]:box[2]]
+            data = read_3d_dataset(f, ds, dateFlag, box)
             if squeeze:
                 data = np.squeeze(data)
         return data
@@ -258,7 +297,7 @@ class timeseries:
     def layout_hdf5(self, dsNameDict, metadata, compression=None):
         print('-'*50)
         print('create HDF5 file {} with w mode'.format(self.file))
-        f = h5py.File(self.file, "w")
+        f = open_store(self.file, "w")
 
         for key in dsNameDict.keys():
             print("create dataset: {d:<25} of {t:<25} in size of {s}".format(
@@ -311,7 +350,7 @@ class timeseries:
                          0, shape[2]]
 
         print('open {} in {} mode'.format(self.file, mode))
-        f = h5py.File(self.file, mode)
+        f = open_store(self.file, mode)
 
         print("writing dataset /{:<25} block: {}".format(datasetName, block))
         if len(block) == 6:
@@ -364,7 +403,7 @@ class timeseries:
                 bperp = refobj.pbase
             # get ref file compression type if input compression is None
             if compression is None:
-                with h5py.File(refFile, 'r') as rf:
+                with open_store(refFile, 'r') as rf:
                     compression = rf[timeseriesDatasetNames[0]].compression
             refobj.close(print_msg=False)
         data = np.array(data, dtype=np.float32)
@@ -375,7 +414,7 @@ class timeseries:
 
         # 3D dataset - timeseries
         print('create timeseries HDF5 file: {} with w mode'.format(outFile))
-        f = h5py.File(outFile, 'w')
+        f = open_store(outFile, 'w')
         print(('create dataset /timeseries of {t:<10} in size of {s} '
                'with compression={c}').format(t=str(data.dtype),
                                               s=data.shape,
@@ -544,7 +583,7 @@ class geometry:
         if 'Y_FIRST' in self.metadata.keys():
             self.geocoded = True
 
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.datasetNames = [i for i in geometryDatasetNames if i in f.keys()]
             self.sliceList = list(self.datasetNames)
             if 'bperp' in f.keys():
@@ -560,7 +599,7 @@ class geometry:
                 self.dateList = None
 
     def get_size(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             dsName = [i for i in f.keys() if i in geometryDatasetNames][0]
             dsShape = f[dsName].shape
             if len(dsShape) == 3:
@@ -570,7 +609,7 @@ class geometry:
         return self.length, self.width
 
     def get_metadata(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.metadata = dict(f.attrs)
         for key, value in self.metadata.items():
             try:
@@ -610,7 +649,7 @@ class geometry:
         elif isinstance(datasetName, str):
             datasetName = [datasetName]
 
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             familyName = datasetName[0].split('-')[0]
             ds = f[familyName]
             if print_msg:
@@ -649,6 +688,7 @@ Attributes         Dictionary for metadata
 /wrapPhase         3D array of float32 in size of (m, l, w) in radian. (optional)
 /rangeOffset       3D array of float32 in size of (m, l, w).           (optional)
 /azimuthOffset     3D array of float32 in size of (m, l, w).           (optional)
+/stats_cache       group of cached statistics of the 3D datasets          (optional)
 """
 
 class ifgramStack:
@@ -684,13 +724,13 @@ class ifgramStack:
         self.date12List = ['{}_{}'.format(i, j) for i, j in zip(self.mDates, self.sDates)]
         self.tbaseIfgram = np.array([i.days for i in self.sTimes - self.mTimes], dtype=np.float32)
 
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.dropIfgram = f['dropIfgram'][:]
             self.pbaseIfgram = f['bperp'][:]
 
             # get existed datasetNames in the order of ifgramDatasetNames
             dsNames = [i for i in f.keys()
-                       if (isinstance(f[i], h5py.Dataset)
+                       if (isinstance(f[i], DATASET_CLASSES)
                            and f[i].shape[-2:] == (self.length, self.width))]
             self.datasetNames = [i for i in ifgramDatasetNames if i in dsNames]
             self.datasetNames += [i for i in dsNames if i not in ifgramDatasetNames]
@@ -719,7 +759,7 @@ class ifgramStack:
             self.refLon = None
 
     def get_metadata(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.metadata = dict(f.attrs)
             dates = f['date'][:].flatten()
         for key, value in self.metadata.items():
@@ -733,7 +773,7 @@ class ifgramStack:
         return self.metadata
 
     def get_size(self, dropIfgram=False, datasetName='unwrapPhase'):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.numIfgram, self.length, self.width = f[datasetName].shape
             if dropIfgram:
                 self.numIfgram = np.sum(f['dropIfgram'][:])
@@ -741,7 +781,7 @@ class ifgramStack:
 
     def read_datetimes(self):
         """Read master/slave dates into array of datetime.datetime objects"""
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             dates = f['date'][:]
         self.mDates = np.array([i.decode('utf8') for i in dates[:, 0]])
         self.sDates = np.array([i.decode('utf8') for i in dates[:, 1]])
@@ -782,7 +822,7 @@ class ifgramStack:
         elif isinstance(datasetName, str):
             datasetName = [datasetName]
 
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             familyName = datasetName[0].split('-')[0]
             ds = f[familyName]
             if print_msg:
@@ -804,7 +844,7 @@ class ifgramStack:
             if box is None:
                 box = (0, 0, self.width, self.length)
 
-            data = ds[dateFlag, box[1]:box[3], box[0]:box[2]]
+            data = read_3d_dataset(f, ds, dateFlag, box)
             data = np.squeeze(data)
         return data
 
@@ -812,32 +852,20 @@ class ifgramStack:
         if datasetName is None:
             datasetName = 'coherence'
         print('calculating spatial average of {} in file {} ...'.format(datasetName, self.file))
-        if maskFile and os.path.isfile(maskFile):
-            print('read mask from file: '+maskFile)
-            mask = singleDataset(maskFile).read(box=box)
-        else:
-            maskFile = None
+        self.open(print_msg=False)
+        if box is None:
+            box = (0, 0, self.width, self.length)
 
-        with h5py.File(self.file, 'r') as f:
-            dset = f[datasetName]
-            numIfgram = dset.shape[0]
-            dmean = np.zeros((numIfgram), dtype=np.float32)
-            for i in range(numIfgram):
-                data = dset[i, box[1]:box[3], box[0]:box[2]]
-                if maskFile:
-                    data[mask == 0] = np.nan
-                # ignore ZERO value for coherence
-                if datasetName == 'coherence':
-                    data[data == 0] = np.nan
-                dmean[i] = np.nanmean(data)
-                sys.stdout.write('\rreading interferogram {}/{} ...'.format(i+1, numIfgram))
-                sys.stdout.flush()
-            print('')
-        return dmean, self.date12List
+        # calculate the statistics in time in the same pass, if no extra reading is needed
+        statNames = list(IFGRAM_SPATIAL_STATS)
+        if box == (0, 0, self.width, self.length):
+            statNames += IFGRAM_TEMPORAL_STATS
+        stats = self.scan_stats(datasetName, statNames, maskFile=maskFile, box=box)
+        return stats['spatial_average'], self.date12List
 
     # Functions considering dropIfgram value
     def get_date12_list(self, dropIfgram=True):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             dates = f['date'][:]
             if dropIfgram:
                 dates = dates[f['dropIfgram'][:], :]
@@ -847,7 +875,7 @@ class ifgramStack:
         return date12List
 
     def get_drop_date12_list(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             dates = f['date'][:]
             dates = dates[~f['dropIfgram'][:], :]
         mDates = np.array([i.decode('utf8') for i in dates[:, 0]])
@@ -856,7 +884,7 @@ class ifgramStack:
         return date12List
 
     def get_date_list(self, dropIfgram=False):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             dates = f['date'][:]
             if dropIfgram:
                 dates = dates[f['dropIfgram'][:], :]
@@ -891,66 +919,211 @@ class ifgramStack:
            Ignoring dropped ifgrams
         """
         self.open(print_msg=False)
-        with h5py.File(self.file, 'r') as f:
-            if datasetName is None:
-                datasetName = [i for i in ['connectComponent', 'unwrapPhase']
-                               if i in f.keys()][0]
-            print('calculate the common mask of pixels with non-zero {} value'.format(datasetName))
-
-            dset = f[datasetName]
-            mask = np.ones(dset.shape[1:3], dtype=np.bool_)
-            dropIfgramFlag = np.ones(dset.shape[0], dtype=np.bool_)
-            if dropIfgram:
-                dropIfgramFlag = self.dropIfgram
-            num2read = np.sum(dropIfgramFlag)
-            idx2read = np.where(dropIfgramFlag)[0]
-            for i in range(num2read):  # Loop to save memory usage
-                data = dset[idx2read[i], :, :]
-                mask[data == 0.] = 0
-                mask[np.isnan(data)] = 0
-                sys.stdout.write('\rreading interferogram {}/{} ...'.format(i+1, num2read))
-                sys.stdout.flush()
-            print('')
-        return mask
+        if datasetName is None:
+            datasetName = [i for i in ['connectComponent', 'unwrapPhase']
+                           if i in self.datasetNames][0]
+        print('calculate the common mask of pixels with non-zero {} value'.format(datasetName))
+        stats = self.scan_stats(datasetName, self._get_full_pass_stats(dropIfgram), dropIfgram=dropIfgram)
+        return stats['nonzero_mask']
 
     def temporal_average(self, datasetName='coherence', dropIfgram=True):
         self.open(print_msg=False)
         if datasetName is None:
             datasetName = 'coherence'
         print('calculate the temporal average of {} in file {} ...'.format(datasetName, self.file))
-        if 'unwrapPhase' in datasetName:
-            phase2range = -1 * float(self.metadata['WAVELENGTH']) / (4.0 * np.pi)
-            tbaseIfgram = self.tbaseIfgram / 365.25
-
-        with h5py.File(self.file, 'r') as f:
-            dset = f[datasetName]
-            num_ifgram, length, width = dset.shape
-            dmean = np.zeros((length, width), dtype=np.float32)
-            drop_ifgram_flag = np.ones(num_ifgram, dtype=np.bool_)
-            if dropIfgram:
-                drop_ifgram_flag = self.dropIfgram
-                if np.all(drop_ifgram_flag == 0.):
-                    raise Exception(('ALL interferograms are marked as dropped, '
-                                     'can not calculate temporal average.'))
-
-            num2read = np.sum(drop_ifgram_flag)
-            idx2read = np.where(drop_ifgram_flag)[0]
-            for i in range(num2read):
-                idx = idx2read[i]
-                data = dset[idx, :, :]
-                if 'unwrapPhase' in datasetName:
-                    if self.refY:
-                        try:
-                            data -= data[self.refY, self.refX]
-                        except:
-                            pass
-                    data *= (phase2range * (1./tbaseIfgram[idx]))
-                dmean += data
-                sys.stdout.write('\rreading interferogram {}/{} ...'.format(i+1, num2read))
-                sys.stdout.flush()
-            dmean *= 1./np.sum(self.dropIfgram)
-            print('')
-        return dmean
+        stats = self.scan_stats(datasetName, self._get_full_pass_stats(dropIfgram), dropIfgram=dropIfgram)
+        return stats['temporal_average']
+
+    def _get_full_pass_stats(self, dropIfgram=True):
+        """Statistics to calculate in one pass of the whole frame: all of them, if no ifgram is
+        skipped for the statistics in time; otherwise those in time only, to avoid extra reading.
+        """
+        if dropIfgram and not np.all(self.dropIfgram):
+            return list(IFGRAM_TEMPORAL_STATS)
+        return IFGRAM_TEMPORAL_STATS + IFGRAM_SPATIAL_STATS
+
+    def get_stats_cache_key(self, datasetName, statName, maskFile=None, box=None, dropIfgram=True):
+        """Configuration of the statistic as a string, to validate its cache in the file.
+        The modification time of the file is included, thus, the cache is out of date after any change
+        of the file, e.g. data, reference point and dropIfgram, except for the cache writing itself.
+        """
+        with open_store(self.file, 'r') as f:
+            shape = f[datasetName].shape
+        key = ['FILE_MTIME_NS={}'.format(os.stat(self.file).st_mtime_ns),
+               'SHAPE={}'.format(shape)]
+        if statName in IFGRAM_TEMPORAL_STATS:
+            flag = self.dropIfgram if dropIfgram else np.ones(shape[0], dtype=np.bool_)
+            key.append('IFGRAM={}'.format(''.join(str(int(i)) for i in flag)))
+            if 'unwrapPhase' in datasetName:
+                key.append('REF_YX=({}, {})'.format(self.refY, self.refX))
+        else:
+            if maskFile and os.path.isfile(maskFile):
+                key.append('MASK={} {}'.format(os.path.abspath(maskFile), os.stat(maskFile).st_mtime_ns))
+            key.append('BOX={}'.format(tuple(box)))
+        return '; '.join(key)
+
+    def scan_stats(self, datasetName='coherence', statNames=None, maskFile=None, box=None, dropIfgram=True,
+                   max_memory=2, use_cache=True, print_msg=True):
+        """Calculate the statistics of 3D dataset, reading each interferogram once for all of them.
+        Results are cached in the file, for later calls with the same configuration.
+
+        Parameters: datasetName : str, 3D dataset name, e.g. coherence, unwrapPhase, connectComponent
+                    statNames   : list of str, statistics to calculate, default is all of:
+                                  temporal_average - 2D np.ndarray in float32, average in time of ifgrams,
+                                                     in phase velocity (m/year) for unwrapPhase
+                                  nonzero_mask     - 2D np.ndarray in bool, common mask of pixels with
+                                                     non-zero and non-NaN value in all ifgrams
+                                  spatial_average  - 1D np.ndarray in float32, average in space of each ifgram,
+                                                     within box and mask, ignoring zero value for coherence
+                                  min / max        - 1D np.ndarray in float32, min / max in space of each ifgram,
+                                                     within box and mask, ignoring zero value for coherence
+                    maskFile    : str, mask file for the statistics in space
+                    box         : tuple of 4 int, (x0, y0, x1, y1) for the statistics in space
+                    dropIfgram  : bool, ignore the dropped ifgrams for the statistics in time
+                    max_memory  : float, maximum memory in GB for each block of data
+                    use_cache   : bool, read / write the statistics from / into the cache in file
+        Returns:    stats       : dict of np.ndarray for each of statNames
+        Example:    obj = ifgramStack('inputs/ifgramStack.h5')
+                    stats = obj.scan_stats('coherence', ['temporal_average', 'spatial_average'],
+                                           maskFile='maskConnComp.h5')
+        """
+        from mintpy.utils import blockwise, ptime
+
+        self.open(print_msg=False)
+        if statNames is None:
+            statNames = IFGRAM_TEMPORAL_STATS + IFGRAM_SPATIAL_STATS
+        if box is None:
+            box = (0, 0, self.width, self.length)
+        if not (maskFile and os.path.isfile(maskFile)):
+            maskFile = None
+
+        # read from the cache
+        stats = dict()
+        keys = dict()
+        for statName in statNames:
+            keys[statName] = self.get_stats_cache_key(datasetName, statName, maskFile, box, dropIfgram)
+        if use_cache:
+            with open_store(self.file, 'r') as f:
+                for statName in statNames:
+                    name = '{}/{}/{}'.format(STATS_CACHE_GROUP, datasetName, statName)
+                    if name in f and f[name].attrs.get('KEY', '') == keys[statName]:
+                        stats[statName] = f[name][()]
+        statNames = [i for i in statNames if i not in stats.keys()]
+        if not statNames:
+            if print_msg:
+                print('read {} statistics from cache in file: {}'.format(datasetName, self.file))
+            return stats
+        file_stat = os.stat(self.file)
+
+        # ifgrams and area to read
+        temporal = any(i in IFGRAM_TEMPORAL_STATS for i in statNames)
+        spatial = any(i in IFGRAM_SPATIAL_STATS for i in statNames)
+        flag_t = np.array(self.dropIfgram) if dropIfgram else np.ones(self.numIfgram, dtype=np.bool_)
+        if temporal and not np.any(flag_t):
+            raise Exception(('ALL interferograms are marked as dropped, '
+                             'can not calculate temporal average.'))
+        flag_read = np.ones(self.numIfgram, dtype=np.bool_) if spatial else flag_t
+        idx_read = np.where(flag_read)[0]
+        rbox = (0, 0, self.width, self.length) if temporal else box
+        rlength, rwidth = rbox[3] - rbox[1], rbox[2] - rbox[0]
+
+        if temporal:
+            dsum = np.zeros((self.length, self.width), dtype=np.float32)
+            mask_nz = np.ones((self.length, self.width), dtype=np.bool_)
+            if 'unwrapPhase' in datasetName:
+                # convert phase to phase velocity in m/year, referenced in space
+                phase2range = -1 * float(self.metadata['WAVELENGTH']) / (4.0 * np.pi)
+                scale = phase2range / (self.tbaseIfgram / 365.25)
+                ref_val = np.zeros(self.numIfgram, dtype=np.float32)
+                if self.refY is not None and 0 <= self.refY < self.length and 0 <= self.refX < self.width:
+                    ref_val = self.read(datasetName=datasetName,
+                                        box=(self.refX, self.refY, self.refX+1, self.refY+1),
+                                        print_msg=False).reshape(-1)
+
+        if spatial:
+            smask = np.zeros((rlength, rwidth), dtype=np.bool_)
+            smask[box[1]-rbox[1]:box[3]-rbox[1],
+                  box[0]-rbox[0]:box[2]-rbox[0]] = True
+            if maskFile:
+                print('read mask from file: '+maskFile)
+                mask = singleDataset(maskFile).read(box=rbox)
+                smask[mask == 0] = False
+            s_sum = np.zeros(self.numIfgram, dtype=np.float64)
+            s_num = np.zeros(self.numIfgram, dtype=np.int64)
+            s_min = np.full(self.numIfgram, np.inf, dtype=np.float64)
+            s_max = np.full(self.numIfgram, -np.inf, dtype=np.float64)
+
+        # read each block of (ifgrams, rows) once
+        block_list = blockwise.get_block_list((idx_read.size, rlength, rwidth), max_memory=max_memory)
+        if print_msg:
+            print('scan {} of {} ifgrams in {} blocks for: {}'.format(datasetName, idx_read.size,
+                                                                      len(block_list), statNames))
+        prog_bar = ptime.progressBar(maxValue=len(block_list), print_msg=print_msg)
+        with open_store(self.file, 'r') as f:
+            ds = f[datasetName]
+            for i, (z0, z1, y0, y1) in enumerate(block_list):
+                idx = idx_read[z0:z1]
+                if np.all(np.diff(idx) == 1):
+                    idx_slice = slice(idx[0], idx[-1]+1)
+                else:
+                    idx_slice = idx.tolist()
+                data = ds[idx_slice,
+                          rbox[1]+y0:rbox[1]+y1,
+                          rbox[0]:rbox[2]]
+
+                if temporal:
+                    flag = flag_t[idx]
+                    data_t = data[flag]
+                    mask_nz[y0:y1, :] *= np.all((data_t != 0.) * ~np.isnan(data_t), axis=0)
+                    data_t = np.array(data_t, dtype=np.float32)
+                    if 'unwrapPhase' in datasetName:
+                        data_t -= ref_val[idx[flag]].reshape(-1, 1, 1)
+                        data_t *= scale[idx[flag]].reshape(-1, 1, 1)
+                    dsum[y0:y1, :] += np.sum(data_t, axis=0)
+
+                if spatial:
+                    data_s = np.array(data[:, smask[y0:y1, :]], dtype=np.float64)
+                    # ignore ZERO value for coherence
+                    if datasetName == 'coherence':
+                        data_s[data_s == 0] = np.nan
+                    valid = ~np.isnan(data_s)
+                    s_num[idx] += np.sum(valid, axis=1)
+                    s_sum[idx] += np.nansum(data_s, axis=1)
+                    if data_s.shape[1] > 0:
+                        s_min[idx] = np.minimum(s_min[idx], np.min(np.where(valid, data_s, np.inf), axis=1))
+                        s_max[idx] = np.maximum(s_max[idx], np.max(np.where(valid, data_s, -np.inf), axis=1))
+                prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
+        prog_bar.close()
+
+        if temporal:
+            stats['temporal_average'] = dsum / np.sum(flag_t)
+            stats['nonzero_mask'] = mask_nz
+        if spatial:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stats['spatial_average'] = np.array(s_sum / s_num, dtype=np.float32)
+            s_min[s_num == 0] = np.nan
+            s_max[s_num == 0] = np.nan
+            stats['min'] = np.array(s_min, dtype=np.float32)
+            stats['max'] = np.array(s_max, dtype=np.float32)
+        stats = {k: v for k, v in stats.items() if k in keys.keys()}
+
+        # write to the cache, if the file is not changed during the scan
+        if use_cache and os.stat(self.file).st_mtime_ns == file_stat.st_mtime_ns:
+            try:
+                with open_store(self.file, 'a') as f:
+                    for statName in statNames:
+                        name = '{}/{}/{}'.format(STATS_CACHE_GROUP, datasetName, statName)
+                        if name in f:
+                            del f[name]
+                        f.create_dataset(name, data=stats[statName])
+                        f[name].attrs['KEY'] = keys[statName]
+                # keep the modification time, as the data is not changed
+                os.utime(self.file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+                if print_msg:
+                    print('save {} statistics to cache in file: {}'.format(datasetName, self.file))
+            except OSError as e:
+                print('WARNING: can not write statistics cache into file {}: {}'.format(self.file, e))
+        return stats
 
     def get_max_connection_number(self):
         date12_list = self.get_date12_list()
@@ -963,9 +1136,11 @@ class ifgramStack:
 
     # Functions for Unwrap error correction
     @staticmethod
-    def get_design_matrix4triplet(date12_list):
+    def get_design_matrix4triplet(date12_list, sparse=False):
         """Generate the design matrix of ifgram triangle for unwrap error correction using phase closure
         Parameters: date12_list : list of string in YYYYMMDD_YYYYMMDD format
+                    sparse      : bool, return scipy.sparse.csr_matrix instead of np.ndarray,
+                                  for large networks
         Returns:    C : 2D np.array in size of (num_tri, num_ifgram) consisting 0, 1, -1
                         for 3 SAR acquisition in t1, t2 and t3 in time order,
                         ifg1 for (t1, t2) with 1
@@ -977,6 +1152,15 @@ class ifgramStack:
         """
         # Date info
         date12_list = list(date12_list)
+        num_ifgram = len(date12_list)
+
+        # hash table of ifgram index, and of date2 for each date1
+        ifgram_idx = dict()
+        date2_dict = dict()
+        for i, date12 in enumerate(date12_list):
+            ifgram_idx.setdefault(date12, i)
+            date1, date2 = date12.split('_')
+            date2_dict.setdefault(date1, []).append(date2)
 
         # calculate triangle_idx
         triangle_idx = []
@@ -984,51 +1168,49 @@ class ifgramStack:
             # ifgram1 (date1, date2)
             date1, date2 = ifgram1.split('_')
 
-            # ifgram2 candidates (date1, date3)
-            date3_list = []
-            for ifgram2 in date12_list:
-                if date1 == ifgram2.split('_')[0] and ifgram2 != ifgram1:
-                    date3_list.append(ifgram2.split('_')[1])
-
-            # ifgram2/3
-            if len(date3_list) > 0:
-                for date3 in date3_list:
-                    ifgram3 = '{}_{}'.format(date2, date3)
-                    if ifgram3 in date12_list:
-                        ifgram1 = '{}_{}'.format(date1, date2)
-                        ifgram2 = '{}_{}'.format(date1, date3)
-                        ifgram3 = '{}_{}'.format(date2, date3)
-                        triangle_idx.append([date12_list.index(ifgram1),
-                                             date12_list.index(ifgram2),
-                                             date12_list.index(ifgram3)])
+            # ifgram2 (date1, date3) and ifgram3 (date2, date3)
+            for date3 in date2_dict[date1]:
+                if date3 == date2:
+                    continue
+                idx3 = ifgram_idx.get('{}_{}'.format(date2, date3), None)
+                if idx3 is not None:
+                    triangle_idx.append([ifgram_idx[ifgram1],
+                                         ifgram_idx['{}_{}'.format(date1, date3)],
+                                         idx3])
         if len(triangle_idx) == 0:
             raise ValueError("No triangles found!")
 
-        triangle_idx = np.array(triangle_idx, np.int16)
+        triangle_idx = np.array(triangle_idx, np.int32)
         triangle_idx = np.unique(triangle_idx, axis=0)
 
         # triangle_idx to C
         num_triangle = triangle_idx.shape[0]
-        C = np.zeros((num_triangle, len(date12_list)), np.float32)
-        for i in range(num_triangle):
-            C[i, triangle_idx[i, 0]] = 1
-            C[i, triangle_idx[i, 1]] = -1
-            C[i, triangle_idx[i, 2]] = 1
+        rows = np.repeat(np.arange(num_triangle), 3)
+        values = np.tile(np.array([1, -1, 1], np.float32), num_triangle)
+        if sparse:
+            from scipy import sparse as sp
+            C = sp.csr_matrix((values, (rows, triangle_idx.flatten())), shape=(num_triangle, num_ifgram))
+        else:
+            C = np.zeros((num_triangle, num_ifgram), np.float32)
+            C[rows, triangle_idx.flatten()] = values
         return C
 
 
     # Functions for Network Inversion
     @staticmethod
-    def get_design_matrix4timeseries(date12_list, refDate=None):
+    def get_design_matrix4timeseries(date12_list, refDate=None, sparse=False):
         """Return design matrix of the input ifgramStack for timeseries estimation
         Parameters: date12_list : list of string in YYYYMMDD_YYYYMMDD format
                     refDate : str, date in YYYYMMDD format
+                    sparse  : bool, return scipy.sparse.csr_matrix instead of np.ndarray,
+                              for large networks
         Returns:    A : 2D array of float32 in size of (num_ifgram, num_date-1)
                     B : 2D array of float32 in size of (num_ifgram, num_date-1)
         Examples:   obj = ifgramStack('./inputs/ifgramStack.h5')
                     A, B = obj.get_design_matrix4timeseries(obj.get_date12_list(dropIfgram=True))
                     A = ifgramStack.get_design_matrix4timeseries(date12_list, refDate='20101022')[0]
                     A = ifgramStack.get_design_matrix4timeseries(date12_list, refDate=0)[0] #do not omit the 1st column
+                    A, B = ifgramStack.get_design_matrix4timeseries(date12_list, sparse=True)
         """
         # Date info
         date12_list = list(date12_list)
@@ -1040,28 +1222,48 @@ class ifgramStack:
         numIfgram = len(date12_list)
         numDate = len(dateList)
 
+        # index of master/slave date of each ifgram, via hash table of date
+        date_idx = dict((date, i) for i, date in enumerate(dateList))
+        m_idx = np.array([date_idx[i] for i in mDates], dtype=np.int64)
+        s_idx = np.array([date_idx[i] for i in sDates], dtype=np.int64)
+
+        # A: -1 / 1 at master / slave date
+        A_rows = np.tile(np.arange(numIfgram), 2)
+        A_cols = np.hstack((m_idx, s_idx))
+        A_vals = np.hstack((-np.ones(numIfgram, np.float32), np.ones(numIfgram, np.float32)))
+
+        # B: time difference between [master, slave) dates
+        num_step = s_idx - m_idx
+        B_rows = np.repeat(np.arange(numIfgram), num_step)
+        B_cols = (np.arange(np.sum(num_step))
+                  - np.repeat(np.cumsum(num_step) - num_step, num_step)
+                  + np.repeat(m_idx, num_step))
+        B_vals = (tbase[1:] - tbase[:-1])[B_cols]
+
         # calculate design matrix
-        A = np.zeros((numIfgram, numDate), np.float32)
-        B = np.zeros(A.shape, np.float32)
-        for i in range(numIfgram):
-            m_idx, s_idx = [dateList.index(j) for j in date12_list[i].split('_')]
-            A[i, m_idx] = -1
-            A[i, s_idx] = 1
-            B[i, m_idx:s_idx] = tbase[m_idx+1:s_idx+1] - tbase[m_idx:s_idx]
+        if sparse:
+            from scipy import sparse as sp
+            A = sp.csr_matrix((A_vals, (A_rows, A_cols)), shape=(numIfgram, numDate))
+            B = sp.csr_matrix((B_vals, (B_rows, B_cols)), shape=(numIfgram, numDate))
+        else:
+            A = np.zeros((numIfgram, numDate), np.float32)
+            B = np.zeros(A.shape, np.float32)
+            A[A_rows, A_cols] = A_vals
+            B[B_rows, B_cols] = B_vals
 
         # Remove reference date as it can not be resolved
         if refDate is None:
             refDate = dateList[0]
         if refDate:
             refIndex = dateList.index(refDate)
-            A = np.hstack((A[:, 0:refIndex], A[:, (refIndex+1):]))
+            A = A[:, [i for i in range(numDate) if i != refIndex]]
             B = B[:, :-1]
         return A, B
 
     def get_perp_baseline_timeseries(self, dropIfgram=True):
         """Get spatial perpendicular baseline in timeseries from ifgramStack, ignoring dropped ifgrams"""
         # read pbase of interferograms
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             pbaseIfgram = f['bperp'][:]
             if dropIfgram:
                 pbaseIfgram = pbaseIfgram[f['dropIfgram'][:]]
@@ -1078,7 +1280,7 @@ class ifgramStack:
         if date12List_to_drop is None:
             return
         date12ListAll = self.get_date12_list(dropIfgram=False)
-        with h5py.File(self.file, 'r+') as f:
+        with open_store(self.file, 'r+') as f:
             print('open file {} with r+ mode'.format(self.file))
             print('update HDF5 dataset "/dropIfgram".')
             f['dropIfgram'][:] = np.array([i not in date12List_to_drop
@@ -1108,7 +1310,7 @@ class singleDataset:
             pass
 
     def read(self, box=None):
-        self.f = h5py.File(self.file, 'r')
+        self.f = open_store(self.file, 'r')
         k = list(self.f.keys())[0]
         data = self.f[k][:]
         if box is not None:
@@ -1185,7 +1387,7 @@ class HDFEOS:
         self.width = int(self.metadata['WIDTH'])
 
         self.sliceList = []
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             gname = 'HDFEOS/GRIDS/timeseries/observation'
             g = f[gname]
             self.dateList = [i.decode('utf8') for i in g['date'][:]]
@@ -1198,11 +1400,11 @@ class HDFEOS:
                           'HDFEOS/GRIDS/timeseries/geometry']:
                 g = f[gname]
                 for key in g.keys():
-                    if isinstance(g[key], h5py.Dataset) and len(g[key].shape) == 2:
+                    if isinstance(g[key], DATASET_CLASSES) and len(g[key].shape) == 2:
                         self.sliceList.append('{}/{}'.format(gname, key))
 
     def get_metadata(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             self.metadata = dict(f.attrs)
             dates = f['HDFEOS/GRIDS/timeseries/observation/date'][:]
         for key, value in self.metadata.items():
@@ -1220,7 +1422,7 @@ class HDFEOS:
         return self.metadata
 
     def get_date_list(self):
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             g = f['HDFEOS/GRIDS/timeseries/observation']
             self.dateList = [i.decode('utf8') for i in g['date'][:]]
         return self.dateList
@@ -1248,7 +1450,7 @@ class HDFEOS:
         elif isinstance(datasetName, str):
             datasetName = [datasetName]
 
-        with h5py.File(self.file, 'r') as f:
+        with open_store(self.file, 'r') as f:
             familyName = datasetName[0].split('-')[0]
             groupName = self.datasetGroupNameDict[familyName]
             ds = f['HDFEOS/GRIDS/timeseries/{}/{}'.format(groupName, familyName)]
@@ -13,7 +13,6 @@
 import os
 import time
 import warnings
-import h5py
 import numpy as np
 
 try:
@@ -23,7 +22,8 @@ except ImportError:
 
 from mintpy.objects import (dataTypeDict,
                             geometryDatasetNames,
-                            ifgramDatasetNames)
+                            ifgramDatasetNames,
+                            open_store)
 from mintpy.utils import readfile, ptime, utils0 as ut
 
 
@@ -113,7 +113,7 @@ class ifgramStackDict:
         '''
 
         self.outputFile = outputFile
-        f = h5py.File(self.outputFile, access_mode)
+        f = open_store(self.outputFile, access_mode)
         print('create HDF5 file {} with {} mode'.format(self.outputFile, access_mode))
 
         self.pairs = sorted([pair for pair in self.pairsDict.keys()])
@@ -431,7 +431,7 @@ class geometryDict:
             return None
 
         self.outputFile = outputFile
-        f = h5py.File(self.outputFile, access_mode)
+        f = open_store(self.outputFile, access_mode)
         print('create HDF5 file {} with {} mode'.format(self.outputFile, access_mode))
 
         #groupName = self.name
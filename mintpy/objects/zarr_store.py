@@ -0,0 +1,303 @@
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+# Zarr directory store as an alternative storage backend of the HDF5 files,
+# with the same h5py.File interface used in MintPy (groups, datasets, attributes),
+# so that readfile / writefile / stack objects handle *.zarr transparently.
+# Unlike HDF5, a Zarr store on local disk allows concurrent writers, e.g. dask workers,
+# each writing its own box of the output into separate chunk files.
+# Recommend import:
+#     from mintpy.objects import open_store
+
+
+import os
+import h5py
+import numpy as np
+
+
+ZARR_FILE_EXT = ['.zarr']
+
+# compression names of h5py and the corresponding zarr compressors
+# lzf is not available in numcodecs, use the similarly fast lz4 via blosc instead.
+ZARR_COMPRESSION_NAMES = {'gzip': 'gzip', 'zlib': 'gzip', 'blosc': 'lzf'}
+
+
+def is_zarr_file(fname):
+    """Check if the input path is a Zarr directory store, based on the file extension."""
+    return os.path.splitext(str(fname).rstrip('/'))[1].lower() in ZARR_FILE_EXT
+
+
+def open_store(fname, mode='r'):
+    """Open HDF5 file or Zarr directory store, with the h5py.File interface.
+    Parameters: fname : str, path of the HDF5 file (*.h5 / *.he5) or Zarr store (*.zarr)
+                mode  : str, access mode, r / r+ / a / w, as in h5py.File
+    Returns:    f     : h5py.File or ZarrFile object
+    Example:    with open_store('timeseries.zarr', 'r') as f:
+                    data = f['timeseries'][:, 200:300, 500:600]
+    """
+    if is_zarr_file(fname):
+        return ZarrFile(fname, mode)
+    return h5py.File(fname, mode)
+
+
+def get_zarr_compressor(compression=None, compression_opts=None):
+    """Get the numcodecs compressor for the h5py compression name."""
+    if compression is None:
+        return None
+
+    import numcodecs
+    if compression == 'gzip':
+        return numcodecs.GZip(level=compression_opts if compression_opts is not None else 4)
+    elif compression == 'lzf':
+        return numcodecs.Blosc(cname='lz4', clevel=5, shuffle=numcodecs.Blosc.SHUFFLE)
+    else:
+        raise ValueError('un-supported compression for zarr: {}'.format(compression))
+
+
+def _is_basic_selection(selection):
+    """Check if the selection is integer / slice only, which zarr supports via __getitem__."""
+    if not isinstance(selection, tuple):
+        selection = (selection,)
+    return all(isinstance(i, (int, np.integer, slice)) or i is Ellipsis for i in selection)
+
+
+def _to_attr_value(value):
+    """Convert numpy scalar / array / bytes into JSON serializable value."""
+    if isinstance(value, bytes):
+        return value.decode('utf8')
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+    elif isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+########################################################################################
+class ZarrAttributes:
+    """Attributes of Zarr group / array, in the h5py AttributeManager interface."""
+    def __init__(self, attrs):
+        self._attrs = attrs
+
+    def __getitem__(self, key):
+        return self._attrs[key]
+
+    def __setitem__(self, key, value):
+        self._attrs[key] = _to_attr_value(value)
+
+    def __delitem__(self, key):
+        del self._attrs[key]
+
+    def __contains__(self, key):
+        return key in self._attrs
+
+    def __iter__(self):
+        return iter(self._attrs.keys())
+
+    def __len__(self):
+        return len(self._attrs)
+
+    def keys(self):
+        return self._attrs.keys()
+
+    def values(self):
+        return self._attrs.asdict().values()
+
+    def items(self):
+        return self._attrs.asdict().items()
+
+    def get(self, key, default=None):
+        return self._attrs.get(key, default)
+
+    def update(self, other):
+        # write all items at once, instead of one file write per item
+        self._attrs.update({key: _to_attr_value(value) for key, value in dict(other).items()})
+
+
+class ZarrDataset:
+    """Zarr array in the h5py.Dataset interface."""
+    def __init__(self, array):
+        self._array = array
+
+    @property
+    def name(self):
+        return self._array.name
+
+    @property
+    def shape(self):
+        return self._array.shape
+
+    @property
+    def dtype(self):
+        return self._array.dtype
+
+    @property
+    def ndim(self):
+        return self._array.ndim
+
+    @property
+    def size(self):
+        return self._array.size
+
+    @property
+    def chunks(self):
+        return self._array.chunks
+
+    @property
+    def compression(self):
+        """Compression in h5py name, for writing the same data into HDF5 file."""
+        compressor = self._array.compressor
+        if compressor is None:
+            return None
+        return ZARR_COMPRESSION_NAMES.get(compressor.codec_id, None)
+
+    @property
+    def attrs(self):
+        return ZarrAttributes(self._array.attrs)
+
+    def __len__(self):
+        return self._array.shape[0]
+
+    def __array__(self, dtype=None):
+        data = self._array[...]
+        return data.astype(dtype) if dtype else data
+
+    def __getitem__(self, selection):
+        # fancy indexing in h5py, e.g. ds[[0, 2, 5], :, :], is orthogonal indexing in zarr
+        if _is_basic_selection(selection):
+            return self._array[selection]
+        return self._array.oindex[selection]
+
+    def __setitem__(self, selection, value):
+        if _is_basic_selection(selection):
+            self._array[selection] = value
+        else:
+            self._array.oindex[selection] = value
+
+    def resize(self, size, axis=None):
+        """Resize the dataset, as h5py.Dataset.resize()."""
+        if axis is not None:
+            shape = list(self.shape)
+            shape[axis] = size
+            size = shape
+        self._array.resize(*size)
+
+
+class ZarrGroup:
+    """Zarr group in the h5py.Group interface."""
+    def __init__(self, group):
+        self._group = group
+
+    @staticmethod
+    def _wrap(obj):
+        import zarr
+        if isinstance(obj, zarr.hierarchy.Group):
+            return ZarrGroup(obj)
+        return ZarrDataset(obj)
+
+    @property
+    def name(self):
+        return self._group.name
+
+    @property
+    def attrs(self):
+        return ZarrAttributes(self._group.attrs)
+
+    def __getitem__(self, key):
+        return self._wrap(self._group[key])
+
+    def __delitem__(self, key):
+        del self._group[key]
+
+    def __contains__(self, key):
+        return key in self._group
+
+    def __iter__(self):
+        return iter(self._group.keys())
+
+    def __len__(self):
+        return len(self._group)
+
+    def keys(self):
+        return list(self._group.keys())
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def create_group(self, name):
+        return ZarrGroup(self._group.create_group(name))
+
+    def require_group(self, name):
+        return ZarrGroup(self._group.require_group(name))
+
+    def create_dataset(self, name, shape=None, dtype=None, data=None, chunks=True,
+                       compression=None, compression_opts=None, **kwargs):
+        """Create dataset, as h5py.Group.create_dataset().
+        h5py specific options, e.g. maxshape, are ignored, as zarr arrays are always resizable.
+        """
+        if data is not None:
+            data = np.asarray(data)
+            shape = data.shape if shape is None else shape
+            dtype = data.dtype if dtype is None else dtype
+        ds = self._group.create_dataset(name,
+                                        shape=shape,
+                                        dtype=dtype,
+                                        chunks=chunks,
+                                        compressor=get_zarr_compressor(compression, compression_opts),
+                                        overwrite=False)
+        if data is not None:
+            ds[...] = data
+        return ZarrDataset(ds)
+
+    def visit(self, func):
+        return self._group.visit(func)
+
+    def visititems(self, func):
+        return self._group.visititems(lambda name, obj: func(name, self._wrap(obj)))
+
+
+class ZarrFile(ZarrGroup):
+    """Zarr directory store in the h5py.File interface.
+    Writes of the same chunk from multiple processes are serialized with file locks in *.zarr.sync
+    next to the store (not inside, to keep lock files out of the hierarchy), thus, writers of any
+    disjoint boxes are safe.
+
+    Example:    with ZarrFile('timeseries.zarr', 'a') as f:
+                    f['timeseries'][:, 200:300, :] = data
+    """
+    def __init__(self, fname, mode='r'):
+        try:
+            import zarr
+        except ImportError:
+            raise ImportError('Cannot import zarr, which is required to read/write *.zarr files!')
+        # zarr 3 removed zarr.hierarchy, the synchronizers and the compressor argument used here
+        if int(zarr.__version__.split('.')[0]) >= 3:
+            raise ImportError('zarr {} is not supported, use zarr>=2.11,<3 to read/write *.zarr files!'.format(
+                zarr.__version__))
+
+        self.filename = str(fname).rstrip('/')
+        self.mode = mode
+        synchronizer = None
+        if mode != 'r':
+            synchronizer = zarr.ProcessSynchronizer(self.filename + '.sync')
+        if mode == 'r' and not os.path.isdir(self.filename):
+            raise FileNotFoundError('Unable to open file (file not found): {}'.format(self.filename))
+        super().__init__(zarr.open_group(self.filename, mode=mode, synchronizer=synchronizer))
+
+    def close(self):
+        self._group.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# h5py-like classes, for isinstance() check of objects from open_store()
+DATASET_CLASSES = (h5py.Dataset, ZarrDataset)
+GROUP_CLASSES = (h5py.Group, ZarrGroup)
@@ -132,6 +132,7 @@ def ref_date_file(ts_file, ref_date, outfile=None):
             print('open {} with r+ mode'.format(ts_file))
             with h5py.File(ts_file, 'r+') as f:
                 print("update /timeseries dataset and 'REF_DATE' attribute value")
+                writefile.remove_derived_datasets(f, 'timeseries')
                 f['timeseries'][:] = ts_data
                 f.attrs['REF_DATE'] = ref_date
             print('close {}'.format(ts_file))
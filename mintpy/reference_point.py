@@ -217,6 +217,7 @@ def reference_file(inps):
         if k == 'ifgramStack':
             f = h5py.File(inps.file, 'r+')
             ds = f[k].get('unwrapPhase')
+            writefile.remove_derived_datasets(f, ds.name)
             for i in range(ds.shape[0]):
                 ds[i, :, :] -= ds[i, inps.ref_y, inps.ref_x]
             f[k].attrs.update(atrNew)
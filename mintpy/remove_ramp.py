@@ -51,6 +51,10 @@ def create_parser():
                              'e.g.: unwrapPhase\n' +
                              '      unwrapPhase_bridging')
     parser.add_argument('-o', '--outfile', help='Output file name.')
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes to remove the ramp of timeseries file (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     parser.add_argument('--update', dest='update_mode', action='store_true',
                         help='Enable update mode, and skip inversion if:\n'+
                              '1) output file already exists, readable '+
@@ -119,7 +123,9 @@ def main(iargs=None):
                              ramp_type=inps.surface_type,
                              mask_file=inps.mask_file,
                              out_file=inps.outfile,
-                             datasetName=inps.dset)
+                             datasetName=inps.dset,
+                             max_memory=inps.max_memory,
+                             num_worker=inps.num_worker)
 
     # config parameter
     print('add/update the following configuration metadata to file:\n{}'.format(configKeys))
@@ -8,12 +8,14 @@
 
 import os
 import re
+import zlib
 import argparse
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 import h5py
 import numpy as np
 from mintpy.objects import timeseries, geometry, sensor
-from mintpy.utils import readfile
+from mintpy.utils import ptime, readfile
 from mintpy import info
 
 
@@ -22,6 +24,10 @@ INT_ZERO = np.int16(0)
 FLOAT_ZERO = np.float32(0.0)
 CPX_ZERO = np.complex64(0.0)
 compression = 'lzf'
+# gzip compression level, same as the h5py default
+GZIP_LEVEL = 4
+# number of elements per chunk of the displacement dataset, i.e. 1 MB in float32
+CHUNK_NUM_ELEMENT = 2**18
 
 
 ################################################################
@@ -54,12 +60,26 @@ def create_parser():
                         help='Enable update mode, a.k.a. put XXXXXXXX as endDate in filename if endDate < 1 year')
     parser.add_argument('--subset', action='store_true',
                         help='Enable subset mode, a.k.a. put suffix _N31700_N32100_E130500_E131100')
+
+    parser.add_argument('--compression', dest='compression', choices=['lzf', 'gzip', 'none'], default=compression,
+                        help='compression filter of the output datasets (default: %(default)s). '
+                             'gzip is compressed by parallel threads for the displacement dataset.')
+    parser.add_argument('--chunk-layout', dest='chunk_layout', choices=['map', 'pixel', 'balanced'],
+                        default='balanced',
+                        help='chunk shape of the displacement dataset, optimized for reading '
+                             'one date at a time (map, e.g. view.py), '
+                             'the time-series of one pixel (pixel, e.g. tsview.py / insarmaps), '
+                             'or a trade-off of both (balanced, default).')
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=4,
+                        help='number of threads for the gzip compression (default: %(default)s).')
     return parser
 
 
 def cmd_line_parse(iargs=None):
     parser = create_parser()
     inps = parser.parse_args(args=iargs)
+    if inps.compression == 'none':
+        inps.compression = None
     return inps
 
 
@@ -286,7 +306,68 @@ def read_template2inps(template_file, inps=None):
     return inps
 
 
-def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata):
+def get_chunk_shape(shape, layout='balanced'):
+    """Get the chunk shape of 3D dataset in (num_date, length, width) for the given access pattern.
+    Parameters: shape  : tuple of 3 int, dataset shape
+                layout : str, map / pixel / balanced
+    Returns:    chunks : tuple of 3 int
+    """
+    num_date, length, width = shape
+    if layout == 'map':
+        num_t = 1
+    elif layout == 'pixel':
+        num_t = num_date
+    else:
+        num_t = min(num_date, 16)
+    # square chunk in space with CHUNK_NUM_ELEMENT elements in total
+    num_yx = max(8, int(np.sqrt(CHUNK_NUM_ELEMENT / num_t)))
+    return (num_t, min(length, num_yx), min(width, num_yx))
+
+
+def write_timeseries_dataset(group, dsName, ts_obj, chunks, compression=None, num_worker=4):
+    """Write the displacement time-series block by block, with blocks aligned to the chunks.
+    For gzip, chunks are compressed by parallel threads and written directly,
+    so that the peak memory is one block instead of the whole time-series.
+    """
+    num_date, length, width = ts_obj.numDate, ts_obj.length, ts_obj.width
+    dset = group.create_dataset(dsName,
+                                shape=(num_date, length, width),
+                                dtype=np.float32,
+                                chunks=chunks,
+                                compression=compression,
+                                compression_opts=GZIP_LEVEL if compression == 'gzip' else None)
+
+    def compress_chunk(data):
+        return zlib.compress(np.ascontiguousarray(data, dtype=np.float32).tobytes(), GZIP_LEVEL)
+
+    block_list = [(t0, y0) for t0 in range(0, num_date, chunks[0]) for y0 in range(0, length, chunks[1])]
+    prog_bar = ptime.progressBar(maxValue=len(block_list))
+    with ThreadPoolExecutor(max_workers=num_worker) as pool:
+        for i, (t0, y0) in enumerate(block_list):
+            t1 = min(t0 + chunks[0], num_date)
+            y1 = min(y0 + chunks[1], length)
+            data = ts_obj.read(datasetName=ts_obj.dateList[t0:t1],
+                               box=(0, y0, width, y1),
+                               squeeze=False,
+                               print_msg=False)
+
+            if compression == 'gzip':
+                # pad the edge block to full chunks
+                block = np.zeros((chunks[0], chunks[1], int(np.ceil(width / chunks[2])) * chunks[2]), np.float32)
+                block[:t1-t0, :y1-y0, :width] = data
+                x0s = list(range(0, width, chunks[2]))
+                chunk_list = [block[:, :, x0:x0+chunks[2]] for x0 in x0s]
+                for x0, chunk_data in zip(x0s, pool.map(compress_chunk, chunk_list)):
+                    dset.id.write_direct_chunk((t0, y0, x0), chunk_data)
+            else:
+                dset[t0:t1, y0:y1, :] = data
+            prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
+    prog_bar.close()
+    return dset
+
+
+def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata, compression=compression,
+               chunk_layout='balanced', num_worker=4):
     """Write HDF5 file in HDF-EOS5 format"""
     ts_obj = timeseries(ts_file)
     ts_obj.open(print_msg=False)
@@ -303,19 +384,19 @@ def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata):
     group = f.create_group(gName)
 
     dsName = 'displacement'
-    data = ts_obj.read(print_msg=False)
+    shape = (ts_obj.numDate, ts_obj.length, ts_obj.width)
+    chunks = get_chunk_shape(shape, layout=chunk_layout)
     print(('create dataset /{g}/{d:<{w}} of {t:<10} in size of {s}'
-           ' with compression={c}').format(g=gName,
-                                           d=dsName,
-                                           w=maxDigit,
-                                           t=str(data.dtype),
-                                           s=data.shape,
-                                           c=compression))
-    dset = group.create_dataset(dsName,
-                                data=data,
-                                dtype=np.float32,
-                                chunks=True,
-                                compression=compression)
+           ' with compression={c} and chunks={k}').format(g=gName,
+                                                          d=dsName,
+                                                          w=maxDigit,
+                                                          t='float32',
+                                                          s=shape,
+                                                          c=compression,
+                                                          k=chunks))
+    dset = write_timeseries_dataset(group, dsName, ts_obj, chunks,
+                                    compression=compression,
+                                    num_worker=num_worker)
     dset.attrs['Title'] = dsName
     dset.attrs['MissingValue'] = FLOAT_ZERO
     dset.attrs['_FillValue'] = FLOAT_ZERO
@@ -460,7 +541,10 @@ def main(iargs=None):
                coh_file=inps.coherence_file,
                mask_file=inps.mask_file,
                geom_file=inps.geom_file,
-               metadata=meta_dict)
+               metadata=meta_dict,
+               compression=inps.compression,
+               chunk_layout=inps.chunk_layout,
+               num_worker=inps.num_worker)
     return outName
 
 
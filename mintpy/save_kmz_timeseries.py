@@ -14,7 +14,10 @@ import os
 import argparse
 from lxml import etree
 from zipfile import ZipFile
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
 import shutil
+import h5py
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -68,6 +71,9 @@ def create_parser():
                       help='choose points with velocity >= cutoff * MAD. Default: 3.')
     defo.add_argument('--min-percentage','--min-perc', dest='min_percentage', type=float, default=0.2,
                       help='choose boxes with >= min percentage of pixels are deforming. Default: 0.2.')
+
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel workers to create the KML region documents. Default: 1.')
     return parser
 
 
@@ -277,8 +283,8 @@ def get_description_string(coords, yx, v, vstd, disp, tcoh=None, font_size=4):
     return des_str
 
 
-def generate_js_datastring(dates, dygraph_file, num_date, ts):
-    """String of the Java Script for interactive plot of diplacement time-series"""
+def get_js_datastring_head_tail(dygraph_file):
+    """Strings of the Java Script before and after the date/displacement data"""
     dygraph_file = '../../../{}'.format(os.path.basename(dygraph_file))
     js_data_string = "<script type='text/javascript' src='{}'></script>".format(dygraph_file)
     js_data_string += """
@@ -294,14 +300,7 @@ def generate_js_datastring(dates, dygraph_file, num_date, ts):
             "Date, displacement\\n" +
     """
 
-    # append the date/displacement data
-    for k in range(num_date):
-        date = dates[k]
-        dis = ts[k]
-        date_displacement_string = "\"{}, {}\\n\" + \n".format(date, dis)
-        js_data_string += date_displacement_string
-
-    js_data_string += """
+    js_tail_string = """
     
     "",
        {
@@ -349,107 +348,182 @@ def generate_js_datastring(dates, dygraph_file, num_date, ts):
        </script>
     
     """
+    return js_data_string, js_tail_string
+
+
+def generate_js_datastring(dates, dygraph_file, num_date, ts):
+    """String of the Java Script for interactive plot of diplacement time-series"""
+    js_data_string, js_tail_string = get_js_datastring_head_tail(dygraph_file)
+
+    # append the date/displacement data
+    for k in range(num_date):
+        date = dates[k]
+        dis = ts[k]
+        date_displacement_string = "\"{}, {}\\n\" + \n".format(date, dis)
+        js_data_string += date_displacement_string
+
+    js_data_string += js_tail_string
     return js_data_string
 
 
-def create_kml_region_document(inps, box_list, ts_obj, step):
-    """Create list of KML.Document() objects 
-    for one level of details defined by box_list and step
-    """
-    dot_file = '../../{}'.format(os.path.basename(inps.dot_file))
+## KML strings of the region files, same as the pretty-printed pykml elements,
+## to create the large number of placemarks without building the element tree.
+KML_REGION_FILE = ('<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom"'
+                   ' xmlns:gx="http://www.google.com/kml/ext/2.2">\n{}</kml>\n')
 
-    ## 1. read data file into timeseries object
-    region_docs = []
-    num_box = len(box_list)
-    for i in range(num_box):
-        box = box_list[i]
+KML_REGION_DOCUMENT = """  <Document>
+    <Folder>
+      <name>Data</name>
+{}    </Folder>
+  </Document>
+"""
+
+KML_PLACEMARK = """      <Placemark>
+        <Style>
+          <IconStyle>
+            <color>{color}</color>
+            <scale>0.5</scale>
+            <Icon>
+              <href>{dot_file}</href>
+            </Icon>
+          </IconStyle>
+        </Style>
+        <description>{description}</description>
+        <Point>
+          <coordinates>{lon},{lat}</coordinates>
+        </Point>
+      </Placemark>
+"""
 
-        if box is None:
-            box = (0, 0, ts_obj.width, ts_obj.length)
 
-        length = box[3] - box[1]
-        width = box[2] - box[0]
+def get_hex_colors(v, colormap, norm):
+    """Get color names in hex format in KML order (aabbggrr), vectorized version of get_hex_color()"""
+    rgba = np.round(np.asarray(colormap(norm(v))) * 255).astype(np.int64).reshape(-1, 4)
+    return ['{:02x}{:02x}{:02x}{:02x}'.format(*i) for i in rgba[:, ::-1].tolist()]
 
-        # 1.1 Parse Date
-        dates = np.array(ts_obj.times)  # 1D np.array of dates in datetime.datetime object in size of [num_date,]
-        dates = list(map(lambda d: d.strftime("%Y-%m-%d"), dates))
-        num_date = len(dates)
 
-        # 1.2 Parse Spatial coordinates
-        lats, lons = ut.get_lat_lon(ts_obj.metadata, box=box)
-        rows, cols = np.mgrid[box[1]:box[3] - 1:length * 1j, box[0]:box[2] - 1:width * 1j]
+def read_box_data(inps, box_list):
+    """Read velocity, velocityStd, time-series, temporal coherence and mask for a list of boxes,
+    from files opened only once.
+    Returns: list of (vel, vel_std, ts_data, temp_coh, mask)
+    """
+    fnames = [inps.vel_file, inps.vel_file, inps.ts_file, inps.tcoh_file, inps.mask_file]
+    dnames = ['velocity', 'velocityStd', 'timeseries', None, None]
+    if any(os.path.splitext(i)[1] not in ['.h5', '.he5'] for i in fnames):
+        # read via readfile for non-HDF5 files
+        box_data = []
+        for box in box_list:
+            box_data.append([readfile.read(fname, datasetName=dname, box=box)[0]
+                             for fname, dname in zip(fnames, dnames)])
+        return box_data
+
+    dnames = [dname if dname else readfile.get_dataset_list(fname)[0] for fname, dname in zip(fnames, dnames)]
+    fhandles = {fname: h5py.File(fname, 'r') for fname in set(fnames)}
+    try:
+        box_data = []
+        for box in box_list:
+            data_list = []
+            for fname, dname in zip(fnames, dnames):
+                ds = fhandles[fname][dname]
+                data_list.append(ds[..., box[1]:box[3], box[0]:box[2]])
+            box_data.append(data_list)
+    finally:
+        for f in fhandles.values():
+            f.close()
+    return box_data
+
+
+def create_kml_region_document4boxes(inps, box_list, step, dates):
+    """Create the list of KML documents in string for a list of boxes.
+    Run by parallel workers in create_kml_region_document().
+    """
+    dot_file = '../../{}'.format(os.path.basename(inps.dot_file))
+    num_date = len(dates)
+
+    # 2.1 Set and normalize colormap to defined vlim
+    colormap = mpl.cm.get_cmap(inps.colormap)
+    norm = mpl.colors.Normalize(vmin=inps.vlim[0], vmax=inps.vlim[1])
 
-        # 1.3 Read Velocity / time-series / temporal coherence data
-        vel = readfile.read(inps.vel_file, datasetName='velocity', box=box)[0] * 100.
-        vel_std = readfile.read(inps.vel_file, datasetName='velocityStd', box=box)[0] * 100.
-        ts_data = readfile.read(inps.ts_file, box=box)[0] * 100.
-        ts_data -= np.tile(ts_data[0, :, :], (ts_data.shape[0], 1, 1))  # enforce displacement starts from zero
-        temp_coh = readfile.read(inps.tcoh_file, box=box)[0]
-        mask = readfile.read(inps.mask_file, box=box)[0]
+    # Java Script strings before/after the date/displacement data
+    js_head_string, js_tail_string = get_js_datastring_head_tail(inps.dygraph_file)
+    date_strings = ["\"{}, ".format(date) for date in dates]
 
-        vel_c = np.array(vel, dtype=np.float32)
+    region_docs = []
+    box_data = read_box_data(inps, box_list)
+    for box, (vel, vel_std, ts_data, temp_coh, mask) in zip(box_list, box_data):
+        ## 1. Prepare data
+        # 1.1 Parse Spatial coordinates, at every step pixel
+        lats, lons = ut.get_lat_lon(inps.metadata, box=box)
+        rows, cols = np.mgrid[box[1]:box[3]:step, box[0]:box[2]:step]
+        lats, lons = lats[::step, ::step], lons[::step, ::step]
+
+        # 1.2 Velocity / time-series / temporal coherence data
+        vel = vel[::step, ::step] * 100.
+        vel_std = vel_std[::step, ::step] * 100.
+        ts_data = ts_data[:, ::step, ::step] * 100.
+        ts_data -= ts_data[0, :, :]  # enforce displacement starts from zero
+        temp_coh = temp_coh[::step, ::step]
+        flag = mask[::step, ::step] != 0  # add point if it's not marked as masked out
+
+        vel_c = np.array(vel[flag], dtype=np.float32)
         if inps.wrap:
             vel_c = inps.vlim[0] + np.mod(vel_c - inps.vlim[0], inps.vlim[1] - inps.vlim[0])
 
+        ## 2. Create KML Document in string
+        colors = get_hex_colors(vel_c, colormap, norm)
+        # coordinates / displacement in strings of float32, not the float64 digits of tolist()
+        lat_strs = np.array(lats[flag], np.float32).astype(str).tolist()
+        lon_strs = np.array(lons[flag], np.float32).astype(str).tolist()
+        ts_strs = np.array(ts_data[:, flag].T, np.float32).astype(str).tolist()
+        lats, lons = lats[flag].tolist(), lons[flag].tolist()
+        rows, cols = rows[flag].tolist(), cols[flag].tolist()
+        vel, vel_std, temp_coh = vel[flag].tolist(), vel_std[flag].tolist(), temp_coh[flag].tolist()
+        disp = ts_data[-1, flag].tolist()
+
+        placemarks = []
+        for k in range(len(colors)):
+            # 2.1 date/displacement data of the dygraph plot
+            js_data_string = js_head_string
+            js_data_string += ''.join([d + dis + "\\n\" + \n" for d, dis in zip(date_strings, ts_strs[k])])
+            js_data_string += js_tail_string
+            # 2.2 description / style / point elements
+            stats_info = get_description_string((lats[k], lons[k]), (rows[k], cols[k]),
+                                                vel[k], vel_std[k], disp[k], tcoh=temp_coh[k])
+            placemarks.append(KML_PLACEMARK.format(color=colors[k],
+                                                   dot_file=dot_file,
+                                                   description=escape(stats_info + js_data_string).encode(
+                                                       'ascii', 'xmlcharrefreplace').decode('ascii'),
+                                                   lon=lon_strs[k],
+                                                   lat=lat_strs[k]))
+
+        region_docs.append(KML_REGION_DOCUMENT.format(''.join(placemarks)))
+    return region_docs
+
 
-        ## 2. Create KML Document
-        kml_document = KML.Document()
-
-        # 2.1 Set and normalize colormap to defined vlim
-        colormap = mpl.cm.get_cmap(inps.colormap)
-        norm = mpl.colors.Normalize(vmin=inps.vlim[0], vmax=inps.vlim[1])
-
-        # 2.2 Set number of pixels to use
-        num_pixel = int(length / step) * int(width / step)
-        msg = "create KML doc for box {}/{}: {}".format(i+1, num_box, box)
-        msg += ", step: {} pixels, {} pixels in total ...".format(step, num_pixel)
-        print(msg)
-
-        # 2.3 Create data folder for all points
-        data_folder = KML.Folder(KML.name("Data"))
-        for i in range(0, length, step):
-            for j in range(0, width, step):
-                if mask[i, j]:  # add point if it's not marked as masked out
-                    lat = lats[i, j]
-                    lon = lons[i, j]
-                    row = rows[i, j]
-                    col = cols[i, j]
-                    ts = ts_data[:, i, j]
-                    v = vel[i, j]
-                    vc = vel_c[i, j]
-                    vstd = vel_std[i, j]
-                    tcoh = temp_coh[i, j]
-
-                    # 2.3.1 Create KML icon style element
-                    style = KML.Style(
-                        KML.IconStyle(
-                            KML.color(get_hex_color(vc, colormap, norm)),
-                            KML.scale(0.5),
-                            KML.Icon(KML.href("{}".format(dot_file)))
-                        )
-                    )
-
-                    # 2.3.2 Create KML point element
-                    point = KML.Point(KML.coordinates("{},{}".format(lon, lat)))
-
-                    js_data_string = generate_js_datastring(dates, inps.dygraph_file, num_date, ts)
-
-                    # 2.3.3 Create KML description element
-                    stats_info = get_description_string((lat, lon), (row, col), v, vstd, ts[-1], tcoh=tcoh)
-                    description = KML.description(stats_info, js_data_string)
-
-                    # 2.3.4 Crate KML Placemark element to hold style, description, and point elements
-                    placemark = KML.Placemark(style, description, point)
-
-                    # 2.3.5 Append each placemark element to the KML document object
-                    data_folder.append(placemark)
-
-        # 2.4 Append data folder to KML document
-        kml_document.append(data_folder)
-
-        # 2.5 Append KML document to list of regionalized documents
-        region_docs.append(kml_document)
+def create_kml_region_document(inps, box_list, ts_obj, step):
+    """Create list of KML documents in string
+    for one level of details defined by box_list and step.
+    Boxes are split into groups and processed by parallel workers.
+    """
+    box_list = [box if box is not None else (0, 0, ts_obj.width, ts_obj.length) for box in box_list]
+    dates = [d.strftime("%Y-%m-%d") for d in ts_obj.times]
+    num_box = len(box_list)
+    num_pixel = sum(len(range(b[1], b[3], step)) * len(range(b[0], b[2], step)) for b in box_list)
+    print('create KML doc for {} boxes, step: {} pixels, {} pixels in total ...'.format(num_box, step, num_pixel))
 
+    if num_box == 0:
+        return []
+
+    # split boxes into about 4 groups per worker, in order
+    num_group = max(1, min(num_box, inps.num_worker * 4))
+    group_size = int(np.ceil(num_box / num_group))
+    box_groups = [box_list[i:i+group_size] for i in range(0, num_box, group_size)]
+
+    region_docs = []
+    with ProcessPoolExecutor(max_workers=inps.num_worker) as pool:
+        futures = [pool.submit(create_kml_region_document4boxes, inps, boxes, step, dates) for boxes in box_groups]
+        for future in futures:
+            region_docs += future.result()
     return region_docs
 
 
@@ -471,10 +545,8 @@ def write_network_link_file(region_docs, ts_obj, box_list, lod, net_link_file):
         region_kml_file = os.path.join(links_dir, "region_{}.kml".format(num))
 
         ## 5.1 Write the first region_document to a file and move it to the proper subdircetory
-        kml_1 = KML.kml()
-        kml_1.append(region_doc)
         with open(region_kml_file, 'w') as f:
-            f.write(etree.tostring(kml_1, pretty_print=True).decode('utf-8'))
+            f.write(KML_REGION_FILE.format(region_doc))
 
         ## 5.2 Flatten lats and lons data
         lats, lons = flatten_lat_lon(box, ts_obj)
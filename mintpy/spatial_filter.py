@@ -7,8 +7,8 @@
 
 
 import os
-import sys
 import argparse
+from functools import partial
 
 try:
     from skimage import filters, feature
@@ -16,8 +16,12 @@ except ImportError:
     raise ImportError('Could not import skimage!')
 
 import numpy as np
-from scipy import ndimage
-from mintpy.utils import readfile, writefile
+from scipy import ndimage, signal
+from mintpy.utils import readfile, blockwise
+
+
+# minimum kernel size in pixels to use FFT convolution for the auto method
+FFT_MIN_KERNEL_SIZE = 65
 
 
 ################################################################################################
@@ -27,6 +31,9 @@ EXAMPLE = """example:
   spatial_filter.py  velocity.h5    lowpass_avg        5
   spatial_filter.py  velocity.h5    highpass_gaussian  3
   spatial_filter.py  velocity.h5    sobel
+
+  # large kernel with FFT convolution, in parallel
+  spatial_filter.py  timeseries.h5  lowpass_gaussian  20  --method fft  --num-worker 8
 """
 
 
@@ -48,6 +55,18 @@ def create_parser():
                              'Sigma       for low/high pass gaussian filter, default: 3.0\n' +
                              'Kernel Size for low/high pass average filter, default: 5')
     parser.add_argument('-o', '--outfile', help='Output file name.')
+    parser.add_argument('--method', dest='method', default='auto',
+                        choices=['auto', 'direct', 'separable', 'fft'],
+                        help='convolution method for low/high pass filter (default: %(default)s):\n'
+                             'direct    - dense 2D kernel for avg and skimage.filters.gaussian for gaussian\n'
+                             'separable - 1D kernels along each axis, for both avg and gaussian\n'
+                             'fft       - FFT convolution, whose cost does not depend on the kernel size\n'
+                             'auto      - separable, or fft for gaussian kernel larger than {} pixels'.format(
+                                 FFT_MIN_KERNEL_SIZE))
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     return parser
 
 
@@ -59,7 +78,77 @@ def cmd_line_parse(iargs=None):
 
 
 ################################################################################################
-def filter_data(data, filter_type, filter_par=None):
+def fft_convolve(data, kernel, mode='reflect'):
+    """2D convolution via FFT with the same boundary handling and NaN propagation as scipy.ndimage.
+    Parameters: data   : 2D np.ndarray
+                kernel : 2D np.ndarray in odd size
+                mode   : str, boundary mode of scipy.ndimage, reflect or nearest
+    Returns:    out    : 2D np.ndarray in the same size and float data type as data
+    """
+    ry, rx = kernel.shape[0] // 2, kernel.shape[1] // 2
+    pad_mode = {'reflect' : 'symmetric', 'nearest' : 'edge'}[mode]
+    dtype = np.result_type(data.dtype, np.float32)
+
+    # NaN values are set to zero for FFT and propagated to their neighborhood afterwards
+    nan_flag = np.isnan(data)
+    if np.any(nan_flag):
+        data = np.array(data, dtype=dtype)
+        data[nan_flag] = 0.
+        nan_flag = ndimage.maximum_filter(nan_flag, size=kernel.shape, mode=mode)
+
+    data = np.pad(data, ((ry, ry), (rx, rx)), mode=pad_mode)
+    out = signal.fftconvolve(data, kernel, mode='valid').astype(dtype)
+    out[nan_flag] = np.nan
+    return out
+
+
+def lowpass_data(data, filter_type, filter_par, method='auto'):
+    """Low pass filter of 2D matrix with average or gaussian kernel
+    Parameters: data        : 2D np.array, matrix to be filtered
+                filter_type : str, avg or gaussian
+                filter_par  : float, kernel size for avg and sigma for gaussian
+                method      : str, auto / direct / separable / fft
+    Returns:    data_filt   : 2D np.array, matrix after filtering
+    """
+    if filter_type == 'avg':
+        p = int(filter_par)
+        if method == 'direct':
+            kernel = np.ones((p, p), np.float32)/(p*p)
+            data_filt = ndimage.convolve(data, kernel)
+        elif method == 'fft' and p % 2 == 1:
+            kernel = np.ones((p, p), np.float64)/(p*p)
+            data_filt = fft_convolve(data, kernel, mode='reflect')
+        else:
+            # running average along each axis, cost independent of kernel size,
+            # with the same origin as ndimage.convolve for kernel in even size.
+            # NaN values are set to zero, as they would be propagated along the whole line otherwise
+            origin = -1 if p % 2 == 0 else 0
+            nan_flag = np.isnan(data)
+            if np.any(nan_flag):
+                data = np.where(nan_flag, 0, data)
+                nan_flag = ndimage.maximum_filter(nan_flag, size=p, origin=origin)
+            data_filt = ndimage.uniform_filter(data, size=p, origin=origin)
+            data_filt[nan_flag] = np.nan
+
+    elif filter_type == 'gaussian':
+        # kernel radius of skimage.filters.gaussian with truncate=4.0
+        radius = int(4.0 * filter_par + 0.5)
+        if method == 'auto':
+            method = 'fft' if 2 * radius + 1 >= FFT_MIN_KERNEL_SIZE else 'separable'
+
+        if method == 'direct':
+            data_filt = filters.gaussian(data, sigma=filter_par)
+        elif method == 'fft':
+            x = np.arange(-radius, radius + 1, dtype=np.float64)
+            kernel = np.exp(-0.5 * x**2 / filter_par**2)
+            kernel /= np.sum(kernel)
+            data_filt = fft_convolve(data, np.outer(kernel, kernel), mode='nearest')
+        else:
+            data_filt = ndimage.gaussian_filter(data, sigma=filter_par, mode='nearest', truncate=4.0)
+    return data_filt
+
+
+def filter_data(data, filter_type, filter_par=None, method='auto'):
     """Filter 2D matrix with selected filter
     Inputs:
         data        : 2D np.array, matrix to be filtered
@@ -67,6 +156,7 @@ def filter_data(data, filter_type, filter_par=None):
         filter_par  : string, optional, parameter for low/high pass filter
                       for low/highpass_avg, it's kernel size in int
                       for low/highpass_gaussain, it's sigma in float
+        method      : string, convolution method for low/high pass filter, auto / direct / separable / fft
     Output:
         data_filt   : 2D np.array, matrix after filtering.
     """
@@ -78,20 +168,10 @@ def filter_data(data, filter_type, filter_par=None):
     elif filter_type == "canny":
         data_filt = feature.canny(data)
 
-    elif filter_type == "lowpass_avg":
-        p = int(filter_par)
-        kernel = np.ones((p, p), np.float32)/(p*p)
-        data_filt = ndimage.convolve(data, kernel)
-    elif filter_type == "highpass_avg":
-        p = int(filter_par)
-        kernel = np.ones((p, p), np.float32)/(p*p)
-        lp_data = ndimage.convolve(data, kernel)
-        data_filt = data - lp_data
-
-    elif filter_type == "lowpass_gaussian":
-        data_filt = filters.gaussian(data, sigma=filter_par)
-    elif filter_type == "highpass_gaussian":
-        lp_data = filters.gaussian(data, sigma=filter_par)
+    elif filter_type.startswith('lowpass_'):
+        data_filt = lowpass_data(data, filter_type.split('_')[1], filter_par, method=method)
+    elif filter_type.startswith('highpass_'):
+        lp_data = lowpass_data(data, filter_type.split('_')[1], filter_par, method=method)
         data_filt = data - lp_data
 
     else:
@@ -100,8 +180,36 @@ def filter_data(data, filter_type, filter_par=None):
     return data_filt
 
 
+def filter_block(data_list, block, filter_type, filter_par=None, method='auto'):
+    """Filter kernel for blockwise.process_file(), slice by slice for 3D matrix"""
+    data = data_list[0]
+    if len(data.shape) == 3:
+        for i in range(data.shape[0]):
+            data[i, :, :] = filter_data(data[i, :, :], filter_type, filter_par, method=method)
+    else:
+        data = filter_data(data, filter_type, filter_par, method=method)
+    return data
+
+
+def get_filter_halo(filter_type, filter_par=None):
+    """Get the number of rows needed beyond a block for the filter to be the same as
+    filtering the whole image, None for filters using the whole image.
+    """
+    if filter_type.endswith('avg'):
+        halo = int(filter_par) // 2 + 1
+    elif filter_type.endswith('gaussian'):
+        # kernel radius of skimage.filters.gaussian with truncate=4.0
+        halo = int(4.0 * filter_par + 0.5) + 1
+    elif filter_type in ['sobel', 'roberts']:
+        halo = 2
+    else:
+        # canny: edge tracking by hysteresis is not local
+        halo = None
+    return halo
+
+
 ############################################################
-def filter_file(fname, filter_type, filter_par=None, fname_out=None):
+def filter_file(fname, filter_type, filter_par=None, fname_out=None, method='auto', max_memory=2, num_worker=1):
     """Filter 2D matrix with selected filter
     Inputs:
         fname       : string, name/path of file to be filtered
@@ -109,8 +217,12 @@ def filter_file(fname, filter_type, filter_par=None, fname_out=None):
         filter_par  : string, optional, parameter for low/high pass filter
                       for low/highpass_avg, it's kernel size in int
                       for low/highpass_gaussain, it's sigma in float
-    Output:
         fname_out   : string, optional, output file name/path
+        method      : string, convolution method for low/high pass filter, auto / direct / separable / fft
+        max_memory  : float, maximum memory in GB for each block
+        num_worker  : int, number of parallel processes
+    Output:
+        fname_out   : string, output file name/path
     """
     # Info
     filter_type = filter_type.lower()
@@ -132,25 +244,15 @@ def filter_file(fname, filter_type, filter_par=None, fname_out=None):
         fname_out = '{}_{}{}'.format(os.path.splitext(fname)[0], filter_type,
                                      os.path.splitext(fname)[1])
 
-    # filtering file
-    dsNames = readfile.get_dataset_list(fname)
-    maxDigit = max([len(i) for i in dsNames])
-    dsDict = dict()
-    for dsName in dsNames:
-        msg = 'filtering {d:<{w}} from {f} '.format(
-            d=dsName, w=maxDigit, f=os.path.basename(fname))
-        data = readfile.read(fname, datasetName=dsName, print_msg=False)[0]
-        if len(data.shape) == 3:
-            num_loop = data.shape[0]
-            for i in range(num_loop):
-                data[i, :, :] = filter_data(data[i, :, :], filter_type, filter_par)
-                sys.stdout.write('\r{} {}/{} ...'.format(msg, i+1, num_loop))
-                sys.stdout.flush()
-            print('')
-        else:
-            data = filter_data(data, filter_type, filter_par)
-        dsDict[dsName] = data
-    writefile.write(dsDict, out_file=fname_out, metadata=atr, ref_file=fname)
+    # filtering file block by block, with overlap in rows
+    blockwise.process_file(fname, fname_out,
+                           func=partial(filter_block, filter_type=filter_type, filter_par=filter_par,
+                                        method=method),
+                           metadata=atr,
+                           ref_file=fname,
+                           halo=get_filter_halo(filter_type, filter_par),
+                           max_memory=max_memory,
+                           num_worker=num_worker)
     return fname_out
 
 
@@ -158,7 +260,10 @@ def filter_file(fname, filter_type, filter_par=None, fname_out=None):
 def main(iargs=None):
     inps = cmd_line_parse(iargs)
 
-    inps.outfile = filter_file(inps.file, inps.filter_type, inps.filter_par)
+    inps.outfile = filter_file(inps.file, inps.filter_type, inps.filter_par, inps.outfile,
+                               method=inps.method,
+                               max_memory=inps.max_memory,
+                               num_worker=inps.num_worker)
     print('Done.')
     return inps.outfile
 
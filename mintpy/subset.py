@@ -8,8 +8,9 @@
 
 import os
 import argparse
+import h5py
 import numpy as np
-from mintpy.utils import readfile, writefile, utils as ut
+from mintpy.utils import ptime, readfile, writefile, utils as ut
 
 
 ###########################################################################################
@@ -36,6 +37,9 @@ EXAMPLE = """example:
 
   # "tight" subset for geocoded lookup table larger than data file
   subset.py geomap_4rlks.trans --tight
+
+  # virtual subset pointing to the input file, without copying data
+  subset.py inputs/ifgramStack.h5 -y 400 1500 -x 200 600 --virtual
 """
 
 def create_parser():
@@ -70,6 +74,12 @@ def create_parser():
                              "By default, it's None for no-outfill.")
     parser.add_argument('--no-parallel', dest='parallel', action='store_false', default=True,
                         help='Disable parallel processing. Diabled auto for 1 input file.\n\n')
+    parser.add_argument('--virtual', action='store_true',
+                        help='write HDF5 virtual datasets pointing into the input file, instead of copying data.\n'
+                             'A quick subset without disk space, for HDF5 file only.\n'
+                             'The output file is invalid once the input file is moved or deleted.')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).\n\n')
 
     parser.add_argument('-o', '--output', dest='outfile',
                         help='output file name\n' +
@@ -273,6 +283,95 @@ def subset_input_dict2box(subset_dict, meta_dict):
 
 
 ################################################################
+def subset_dataset(fi, fo, dsName, pix_box, pix_box4data, pix_box4subset, fill_value=np.nan,
+                   max_memory=2, print_msg=True):
+    """Subset 2D/3D HDF5 dataset by reading the overlapping hyperslab only, in groups of slices.
+    Parameters: fi/fo          : h5py.File object of the input / output file
+                dsName         : str, dataset name
+                pix_box        : 4-tuple of int, subset box in (x0, y0, x1, y1)
+                pix_box4data   : 4-tuple of int, overlap box in the input  data coordinates
+                pix_box4subset : 4-tuple of int, overlap box in the output data coordinates
+                fill_value     : float, value for area outside of the data coverage
+                max_memory     : float, maximum memory in GB for each group of slices
+    Returns:    ds_out         : h5py.Dataset object of the output dataset
+    """
+    ds = fi[dsName]
+    ysub = slice(pix_box4subset[1], pix_box4subset[3])
+    xsub = slice(pix_box4subset[0], pix_box4subset[2])
+    ydata = slice(pix_box4data[1], pix_box4data[3])
+    xdata = slice(pix_box4data[0], pix_box4data[2])
+    length, width = pix_box[3] - pix_box[1], pix_box[2] - pix_box[0]
+    full_overlap = (pix_box4subset == (0, 0, width, length))
+
+    # same data type as filled by fill_value in numpy
+    dtype = (np.ones(1, ds.dtype) * fill_value).dtype
+    ds_out = fo[dsName]
+
+    if ds.ndim == 2:
+        data = ds[ydata, xdata]
+        if not full_overlap:
+            data_out = np.ones((length, width), dtype) * fill_value
+            data_out[ysub, xsub] = data
+            data = data_out
+        ds_out[:] = data
+
+    elif ds.ndim == 3:
+        num_slice = ds.shape[0]
+        step = max(1, int(max_memory * 1024**3 / (length * width * max(dtype.itemsize, 8) * 2)))
+        step = min(step, num_slice)
+        num_step = int(np.ceil(num_slice / step))
+        prog_bar = ptime.progressBar(maxValue=num_step, print_msg=print_msg and num_step > 1)
+        for i, z0 in enumerate(range(0, num_slice, step)):
+            z1 = min(z0 + step, num_slice)
+            data = ds[z0:z1, ydata, xdata]
+            if not full_overlap:
+                data_out = np.ones((z1 - z0, length, width), dtype) * fill_value
+                data_out[:, ysub, xsub] = data
+                data = data_out
+            ds_out[z0:z1, :, :] = data
+            prog_bar.update(i+1, suffix='{}/{}'.format(z1, num_slice))
+        prog_bar.close()
+    return ds_out
+
+
+def check_virtual_fill_value(fi, dsNames, fill_value=None):
+    """Check the fill value for all datasets in virtual mode, where the data type is kept,
+    before writing any of them, to not leave a half-written file behind.
+    Parameters: fi         : h5py.File object of the input file
+                dsNames    : list of str, datasets to subset
+                fill_value : number, fill value for the area outside of the data coverage
+    """
+    if fill_value is None or not np.isnan(fill_value):
+        return
+    ds_list = ['{} ({})'.format(i, fi[i].dtype) for i in dsNames if fi[i].dtype.kind not in ('f', 'c')]
+    if ds_list:
+        raise ValueError('can not fill NaN into non-float datasets in virtual mode: {}'.format(', '.join(ds_list)))
+    return
+
+
+def subset_dataset_virtual(fi, fo, dsName, pix_box, pix_box4data, pix_box4subset, fill_value=None):
+    """Write HDF5 virtual dataset of the subset, pointing into the input file.
+    Parameters: see subset_dataset()
+    Returns:    ds_out : h5py.Dataset object of the output virtual dataset
+    """
+    ds = fi[dsName]
+    check_virtual_fill_value(fi, [dsName], fill_value)
+
+    ysub = slice(pix_box4subset[1], pix_box4subset[3])
+    xsub = slice(pix_box4subset[0], pix_box4subset[2])
+    ydata = slice(pix_box4data[1], pix_box4data[3])
+    xdata = slice(pix_box4data[0], pix_box4data[2])
+    shape = ds.shape[:-2] + (pix_box[3] - pix_box[1], pix_box[2] - pix_box[0])
+
+    src = h5py.VirtualSource(os.path.abspath(fi.filename), dsName, shape=ds.shape, dtype=ds.dtype)
+    layout = h5py.VirtualLayout(shape=shape, dtype=ds.dtype)
+    if ds.ndim == 3:
+        layout[:, ysub, xsub] = src[:, ydata, xdata]
+    else:
+        layout[ysub, xsub] = src[ydata, xdata]
+    return fo.create_virtual_dataset(dsName, layout, fillvalue=fill_value)
+
+
 def subset_file(fname, subset_dict_input, out_file=None):
     """Subset file with
     Inputs:
@@ -286,6 +385,8 @@ def subset_file(fname, subset_dict_input, out_file=None):
                       fill_value : float, optional. filled value for area outside of data coverage. default=None
                                    None/not-existed to subset within data coverage only.
                       tight  : bool, tight subset or not, for lookup table file, i.e. geomap*.trans
+                      virtual    : bool, write virtual datasets pointing into fname, for HDF5 file only
+                      max_memory : float, maximum memory in GB for each block of data
     Outputs:
         out_file :  str, path/name of output file; 
                    out_file = 'subset_'+fname, if fname is in current directory;
@@ -345,42 +446,58 @@ def subset_file(fname, subset_dict_input, out_file=None):
     # subset datasets one by one
     dsNames = readfile.get_dataset_list(fname)
     maxDigit = max([len(i) for i in dsNames])
+    fill_value = subset_dict['fill_value']
+    atr_sub = ut.subset_attribute(atr, pix_box)
+
+    # HDF5 file: read the overlapping hyperslab only and write slice group by slice group
+    if os.path.splitext(fname)[1].lower() in ['.h5', '.he5']:
+        virtual = subset_dict.get('virtual', False)
+        max_memory = subset_dict.get('max_memory', 2)
+        if virtual:
+            with h5py.File(fname, 'r') as fi:
+                check_virtual_fill_value(fi, dsNames, fill_value if outfill else None)
+            writefile.layout_hdf5(out_file, metadata=atr_sub, ref_file=fname)
+        else:
+            compression = readfile.get_hdf5_compression(fname)
+            with h5py.File(fname, 'r') as fi:
+                ds_name_dict = {}
+                for dsName in dsNames:
+                    ds = fi[dsName]
+                    ds_name_dict[dsName] = [(np.ones(1, ds.dtype) * fill_value).dtype,
+                                            ds.shape[:-2] + (pix_box[3] - pix_box[1], pix_box[2] - pix_box[0])]
+            writefile.layout_hdf5(out_file, ds_name_dict, metadata=atr_sub, ref_file=fname,
+                                  compression=compression)
+
+        with h5py.File(fname, 'r') as fi, h5py.File(out_file, 'a') as fo:
+            for dsName in dsNames:
+                print('subsetting {d:<{w}} from {f} ...'.format(
+                    d=dsName, w=maxDigit, f=os.path.basename(fname)))
+                if virtual:
+                    subset_dataset_virtual(fi, fo, dsName, pix_box, pix_box4data, pix_box4subset,
+                                           fill_value=fill_value if outfill else None)
+                else:
+                    subset_dataset(fi, fo, dsName, pix_box, pix_box4data, pix_box4subset,
+                                   fill_value=fill_value,
+                                   max_memory=max_memory)
+        readfile.clear_metadata_cache(out_file)
+        print('finished writing to {}'.format(out_file))
+        return out_file
+
+    # binary file: read the overlapping box only
+    overlap_box = (pix_box4data[0], pix_box4data[1], pix_box4data[2], pix_box4data[3])
     dsDict = dict()
     for dsName in dsNames:
         print('subsetting {d:<{w}} from {f} ...'.format(
             d=dsName, w=maxDigit, f=os.path.basename(fname)))
-        data = readfile.read(fname, datasetName=dsName, print_msg=False)[0]
-
-        # keep timeseries data as 3D matrix when there is only one acquisition
-        # because readfile.read() will squeeze it to 2D
-        if atr['FILE_TYPE'] == 'timeseries' and len(data.shape) == 2:
-            data = np.reshape(data, (1, data.shape[0], data.shape[1]))
-
-        # subset 2D data
-        if len(data.shape) == 2:
-            data_overlap = data[pix_box4data[1]:pix_box4data[3],
-                                pix_box4data[0]:pix_box4data[2]]
-            data = np.ones((pix_box[3] - pix_box[1],
-                            pix_box[2] - pix_box[0]), data.dtype) * subset_dict['fill_value']
-            data[pix_box4subset[1]:pix_box4subset[3],
-                 pix_box4subset[0]:pix_box4subset[2]] = data_overlap
-
-        # subset 3D data
-        elif len(data.shape) == 3:
-            data_overlap = data[:,
-                                pix_box4data[1]:pix_box4data[3],
-                                pix_box4data[0]:pix_box4data[2]]
-            data = np.ones((data.shape[0],
-                            pix_box[3] - pix_box[1],
-                            pix_box[2] - pix_box[0]), data.dtype) * subset_dict['fill_value']
-            data[:,
-                 pix_box4subset[1]:pix_box4subset[3],
-                 pix_box4subset[0]:pix_box4subset[2]] = data_overlap
-
+        data = readfile.read(fname, datasetName=dsName, box=overlap_box, print_msg=False)[0]
+        data_overlap = data
+        data = np.ones((pix_box[3] - pix_box[1],
+                        pix_box[2] - pix_box[0]), data.dtype) * fill_value
+        data[pix_box4subset[1]:pix_box4subset[3],
+             pix_box4subset[0]:pix_box4subset[2]] = data_overlap
         dsDict[dsName] = data
 
-    atr = ut.subset_attribute(atr, pix_box)
-    writefile.write(dsDict, out_file=out_file, metadata=atr, ref_file=fname)
+    writefile.write(dsDict, out_file=out_file, metadata=atr_sub, ref_file=fname)
     return out_file
 
 
@@ -8,31 +8,53 @@
 
 import os
 import argparse
+from functools import partial
 import numpy as np
 from mintpy.objects import timeseries
-from mintpy.utils import ptime
+from mintpy.utils import blockwise
 
 
 ############################################################
 EXAMPLE = """example:
  temporal_filter.py timeseries_ECMWF_demErr.h5
  temporal_filter.py timeseries_ECMWF_demErr.h5 -t 0.1
+ temporal_filter.py timeseries_ECMWF_demErr.h5 -f average -t 0.2
+ temporal_filter.py timeseries_ECMWF_demErr.h5 -f savgol  -t 0.3 --order 2
 """
 
 REFERENCE="""reference:
   Wikipedia: https://en.wikipedia.org/wiki/Gaussian_blur
+  Savitzky, A., and M. J. E. Golay (1964), Smoothing and differentiation of data by simplified
+    least squares procedures, Analytical Chemistry, 36(8), 1627-1639.
 """
 
 def create_parser():
-    parser = argparse.ArgumentParser(description='Smoothing timeseries in time domain with a moving Gaussian window',
+    parser = argparse.ArgumentParser(description='Smoothing timeseries in time domain with a moving window',
                                      formatter_class=argparse.RawTextHelpFormatter,
                                      epilog=REFERENCE+'\n'+EXAMPLE)
 
     parser.add_argument('timeseries_file',
                         help='timeseries file to be smoothed.')
+    parser.add_argument('-f', '--filter', dest='filter_type', default='gaussian',
+                        choices=['gaussian', 'average', 'savgol'],
+                        help='filter type (default: %(default)s):\n'
+                             'gaussian - moving Gaussian window, weighted by the time difference\n'
+                             'average  - moving average within the time window\n'
+                             'savgol   - Savitzky-Golay filter, i.e. local polynomial fit within the time window,\n'
+                             '           on the actual acquisition times for irregular sampling')
     parser.add_argument('-t', '--time-win', dest='time_win', type=float, default=0.1,
-                        help='time window in years, default: 0.1 (Sigma of the assmued Gaussian distribution.)')
+                        help='time window in years, default: 0.1\n'
+                             'gaussian   : sigma of the assmued Gaussian distribution\n'
+                             'average    : full width of the window\n'
+                             'savgol     : half width of the window')
+    parser.add_argument('--order', dest='poly_order', type=int, default=2,
+                        help='polynomial order for the savgol filter (default: %(default)s).')
     parser.add_argument('-o', '--outfile', help='Output file name.')
+
+    parser.add_argument('--num-worker', dest='num_worker', type=int, default=1,
+                        help='number of parallel processes (default: %(default)s).')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     return parser
 
 
@@ -43,41 +65,79 @@ def cmd_line_parse(iargs=None):
 
 
 ############################################################
+def get_filter_matrix(tbase, filter_type='gaussian', time_win=0.1, poly_order=2):
+    """Get the weight matrix of the temporal filter, so that the filtered time-series
+    is a matrix multiplication: ts_filt = np.dot(weight, ts).
+    Parameters: tbase       : 1D np.ndarray, time of acquisitions in years
+                filter_type : str, gaussian / average / savgol
+                time_win    : float, time window in years
+                poly_order  : int, polynomial order for savgol filter
+    Returns:    weight      : 2D np.ndarray in float32 in size of (num_date, num_date)
+    """
+    tbase = np.array(tbase, dtype=np.float64).flatten()
+    num_date = tbase.size
+    tbase_diff = tbase.reshape(1, -1) - tbase.reshape(-1, 1)
+
+    if filter_type == 'gaussian':
+        # Weight from Gaussian (normal) distribution in time
+        weight = np.exp(-0.5 * (tbase_diff**2) / (time_win**2))
+
+    elif filter_type == 'average':
+        weight = (np.abs(tbase_diff) <= time_win / 2.).astype(np.float64)
+
+    elif filter_type == 'savgol':
+        # least squares polynomial fit on the neighboring acquisitions,
+        # evaluated at the current acquisition, i.e. the 1st row of the pseudo-inverse
+        weight = np.zeros((num_date, num_date), dtype=np.float64)
+        for i in range(num_date):
+            idx = np.where(np.abs(tbase_diff[i, :]) <= time_win)[0]
+            order = min(poly_order, idx.size - 1)
+            A = np.vander(tbase_diff[i, idx], order + 1, increasing=True)
+            weight[i, idx] = np.linalg.pinv(A)[0, :]
+
+    else:
+        raise ValueError('un-recognized filter type: {}'.format(filter_type))
+
+    weight /= np.sum(weight, axis=1, keepdims=True)
+    return np.array(weight, dtype=np.float32)
+
+
+def filter_block(data_list, block, weight):
+    """Temporal filter kernel for blockwise.process_file()"""
+    data = data_list[0]
+    shape = data.shape
+    data = np.dot(weight, data.reshape(shape[0], -1))
+    return data.reshape(shape)
+
+
 def main(iargs=None):
     inps = cmd_line_parse(iargs)
 
-    # read timeseries info / data
+    # read timeseries info
     obj = timeseries(inps.timeseries_file)
     obj.open()
 
-    tbase = np.array(obj.yearList, np.float32).reshape(-1, 1)
-    tbase -= tbase[obj.refIndex]
-
-    ts_data = obj.read().reshape(obj.numDate, -1)
-
-    # Smooth acquisitions / moving window in time one by one
+    # filter as a matrix, with the re-referencing in time
     print('-'*50)
-    print('filtering in time Gaussian window with size of {:.1f} years'.format(inps.time_win))
-    ts_data_filt = np.zeros(ts_data.shape, np.float32)
-    prog_bar = ptime.progressBar(maxValue=obj.numDate)
-    for i in range(obj.numDate):
-        # Weight from Gaussian (normal) distribution in time
-        tbase_diff = tbase[i] - tbase
-        weight = np.exp(-0.5 * (tbase_diff**2) / (inps.time_win**2))
-        weight /= np.sum(weight)
-        # Smooth the current acquisition
-        ts_data_filt[i, :] = np.sum(ts_data * weight, axis=0)
-        prog_bar.update(i+1, suffix=obj.dateList[i])
-    prog_bar.close()
-    del ts_data
-    ts_data_filt -= ts_data_filt[obj.refIndex, :]
-    ts_data_filt = np.reshape(ts_data_filt, (obj.numDate, obj.length, obj.width))
-
-    # write filtered timeseries file
+    print('filtering in time {} window with size of {:.1f} years'.format(inps.filter_type, inps.time_win))
+    weight = get_filter_matrix(obj.yearList,
+                               filter_type=inps.filter_type,
+                               time_win=inps.time_win,
+                               poly_order=inps.poly_order)
+    weight -= weight[obj.refIndex, :]
+
+    # filter and write timeseries file block by block
     if not inps.outfile:
-        inps.outfile = '{}_tempGaussian.h5'.format(os.path.splitext(inps.timeseries_file)[0])
-    obj_out = timeseries(inps.outfile)
-    obj_out.write2hdf5(ts_data_filt, refFile=inps.timeseries_file)
+        inps.outfile = '{}_temp{}.h5'.format(os.path.splitext(inps.timeseries_file)[0],
+                                             inps.filter_type.capitalize())
+    blockwise.process_file(inps.timeseries_file, inps.outfile,
+                           func=partial(filter_block, weight=weight),
+                           datasetNames=['timeseries'],
+                           metadata=obj.metadata,
+                           ref_file=inps.timeseries_file,
+                           split_z=False,
+                           max_memory=inps.max_memory,
+                           num_worker=inps.num_worker)
     return inps.outfile
 
 
@@ -51,6 +51,10 @@ def create_parser():
     parser.add_argument('-r','--ramp','--deramp', dest='deramp', default='quadratic',
                         help='ramp type to be remove for RMS calculation.\n' +
                              'Default - quadratic; no - do not remove ramp')
+    parser.add_argument('--save-deramp', dest='save_deramp', action='store_true',
+                        help='Save the deramped timeseries file, which is not needed for RMS calculation.')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=2,
+                        help='maximum memory in GB for each block of data (default: %(default)s).')
     parser.add_argument('--cutoff', dest='cutoff', default='3', type=float,
                         help='M-score used for outlier detection based on standardised residuals\n'+
                              'Recommend range: [3, 4], default is 3.')
@@ -231,7 +235,9 @@ def main(iargs=None):
      inps.date_list,
      inps.rms_file) = ut.get_residual_rms(inps.timeseries_file,
                                           mask_file=inps.maskFile,
-                                          ramp_type=inps.deramp)
+                                          ramp_type=inps.deramp,
+                                          save_deramp=inps.save_deramp,
+                                          max_memory=inps.max_memory)
 
     analyze_rms(inps.date_list, inps.rms_list, inps)
     return
@@ -9,6 +9,7 @@
 import os
 import sys
 import argparse
+from collections import OrderedDict
 import numpy as np
 import scipy.stats as stats
 import matplotlib.pyplot as plt
@@ -303,49 +304,149 @@ def read_exclude_date(input_ex_date, dateListAll):
     return ex_date_list, ex_dates, ex_flag
 
 
+class timeseriesPointReader():
+    """Read point time-series from a time-series file on demand.
+
+    Instead of loading the whole 3D time-series into memory, the time-series of the block
+    of pixels around the queried one is read from the file and kept in a LRU cache, so that
+    clicks in the neighborhood do not touch the file again.
+
+    Example:
+        reader = timeseriesPointReader('timeseries.h5', date_list)
+        dis_ts = reader.read(y=300, x=400)
+    """
+    def __init__(self, fname, date_list, block_size=64, cache_size=32):
+        self.file = fname
+        self.date_list = date_list
+        self.block_size = block_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.metadata = readfile.read_attribute(fname)
+        self.length = int(self.metadata['LENGTH'])
+        self.width = int(self.metadata['WIDTH'])
+
+    def read_block(self, y, x):
+        """Read the block of pixels containing pixel (y, x) with cache."""
+        key = (y // self.block_size, x // self.block_size)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            y0, x0 = key[0] * self.block_size, key[1] * self.block_size
+            box = (x0, y0,
+                   min(x0 + self.block_size, self.width),
+                   min(y0 + self.block_size, self.length))
+            data = readfile.read(self.file, datasetName=self.date_list, box=box, print_msg=False)[0]
+            data = data.reshape(-1, box[3]-box[1], box[2]-box[0])
+            self.cache[key] = (box, data)
+            # discard the least recently used block
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return self.cache[key]
+
+    def read(self, y, x):
+        """Read the time-series of pixel (y, x) as 1D np.array in size of (num_date,)"""
+        box, data = self.read_block(y, x)
+        return np.array(data[:, y-box[1], x-box[0]])
+
+
+def read_timeseries_slice(inps, idx, fname=None, overview=1):
+    """Read one displacement map of time-series file, referenced in space and time
+    Parameters: inps  : Namespace of input arguments
+                idx   : int, index of the date to read in inps.date_list
+                fname : str, time-series file, default is the 1st input file
+                overview : int, read from the overview downsampled by this factor
+    Returns:    data  : 2D np.array in size of (length, width) of inps.pix_box in display unit
+    """
+    fname = fname if fname else inps.timeseries_file[0]
+    box = inps.pix_box
+
+    # read the date of interest and the reference date
+    date_list = [inps.date_list[idx], inps.date_list[inps.ref_idx]]
+    if overview > 1:
+        data = readfile.read_overview(fname, overview, datasetName=date_list, box=box)
+    else:
+        data = readfile.read(fname, datasetName=date_list, box=box, print_msg=False)[0]
+    data = data.reshape(-1, data.shape[-2], data.shape[-1])
+    # slices are read in the order saved in file
+    sign = 1. if idx > inps.ref_idx else -1.
+    data = (data[-1] - data[0]) * sign
+
+    # reference in space
+    if overview > 1:
+        ref_box = (inps.ref_yx[1], inps.ref_yx[0], inps.ref_yx[1]+1, inps.ref_yx[0]+1)
+        ref_val = readfile.read(fname, datasetName=date_list, box=ref_box, print_msg=False)[0].flatten()
+        data -= (ref_val[-1] - ref_val[0]) * sign
+    else:
+        try:
+            data -= data[inps.ref_yx[0]-box[1], inps.ref_yx[1]-box[0]]
+        except IndexError:
+            pass
+
+    # display unit
+    data *= inps.unit_fac
+    return data
+
+
+def read_overview_stats4slice(inps, idx, fname=None):
+    """Read the statistics of one displacement map, as saved along with the overviews
+    Parameters: inps  : Namespace of input arguments
+                idx   : int, index of the date of interest in inps.date_list
+                fname : str, time-series file, default is the 1st input file
+    Returns:    stats : 1D np.ndarray in size of (4,) for min, max, p02, p98 in file unit,
+                        None if not available or not applicable, i.e. with subset,
+                        or re-referencing in space / time for display.
+    """
+    fname = fname if fname else inps.timeseries_file[0]
+    atr = readfile.read_attribute(fname)
+    box = (0, 0, int(atr['WIDTH']), int(atr['LENGTH']))
+    if (idx == inps.ref_idx
+            or inps.date_list[inps.ref_idx] != atr.get('REF_DATE', None)
+            or tuple(inps.pix_box) != box
+            or 'REF_Y' not in atr.keys()
+            or list(inps.ref_yx) != [int(atr['REF_Y']), int(atr['REF_X'])]
+            or not readfile.get_overview_factors(fname)):
+        return None
+    stats = readfile.read_overview_stats(fname, inps.date_list[idx])
+    return stats[0] if stats is not None else None
+
+
 def read_timeseries_data(inps):
-    """Read data of time-series files
+    """Read data of time-series files needed for the initial display.
+
+    Only the displayed slice and the last slice of the 1st file are read here,
+    point time-series are read on demand via timeseriesPointReader.
+
     Parameters: inps : Namespace of input arguments
-    Returns:    ts_data : list of 3D np.array in size of (num_date, length, width)
+    Returns:    ts_readers : list of timeseriesPointReader objects, one for each file
                 mask : 2D np.array in size of (length, width)
                 inps : Namespace of input arguments
     """
-    # read list of 3D time-series
-    ts_data = []
+    # point time-series reader for each file
+    ts_readers = []
     for fname in inps.timeseries_file:
-        vprint('reading timeseries from file {} ...'.format(fname))
-        data, atr = readfile.read(fname, datasetName=inps.date_list, box=inps.pix_box)
-        try:
-            ref_phase = data[:, inps.ref_yx[0]-inps.pix_box[1], inps.ref_yx[1]-inps.pix_box[0]]
-            data -= np.tile(ref_phase.reshape(-1, 1, 1), (1, data.shape[-2], data.shape[-1]))
-            vprint('reference to pixel: {}'.format(inps.ref_yx))
-        except:
-            pass
-        vprint('reference to date: {}'.format(inps.date_list[inps.ref_idx]))
-        data -= np.tile(data[inps.ref_idx, :, :], (inps.num_date, 1, 1))
-
-        # Display Unit
-        (data,
-         inps.disp_unit,
-         inps.unit_fac) = pp.scale_data2disp_unit(data,
-                                                  metadata=atr,
-                                                  disp_unit=inps.disp_unit)
-        ts_data.append(data)
+        ts_readers.append(timeseriesPointReader(fname, inps.date_list))
+    vprint('reference to pixel: {}'.format(inps.ref_yx))
+    vprint('reference to date: {}'.format(inps.date_list[inps.ref_idx]))
 
     # Mask file: input mask file + non-zero ts pixels - ref_point
-    mask = np.ones(ts_data[0].shape[-2:], np.bool_)
+    box = inps.pix_box
+    mask = np.ones((box[3]-box[1], box[2]-box[0]), np.bool_)
     msk = pp.read_mask(inps.timeseries_file[0],
                        mask_file=inps.mask_file,
                        datasetName='displacement',
                        box=inps.pix_box,
                        print_msg=inps.print_msg)[0]
-    mask[msk == 0.] = False
+    if msk is not None:
+        mask[msk == 0.] = False
     del msk
 
-    ts_stack = np.sum(ts_data[0], axis=0)
-    mask[ts_stack == 0.] = False
-    mask[np.isnan(ts_stack)] = False
-    del ts_stack
+    # use the last acquisition to identify no-data pixels
+    vprint('reading timeseries from file {} ...'.format(inps.timeseries_file[0]))
+    data = readfile.read(inps.timeseries_file[0], datasetName=inps.date_list[-1], box=box)[0]
+    data = data.reshape(mask.shape)
+    mask[data == 0.] = False
+    mask[np.isnan(data)] = False
+    del data
 
     #do not mask the reference point
     try:
@@ -354,40 +455,70 @@ def read_timeseries_data(inps):
     except:
         pass
 
-    #vprint('masking data')
-    #ts_mask = np.tile(mask, (inps.num_date, 1, 1))
-    #for i in range(len(ts_data)):
-    #    ts_data[i][ts_mask == 0] = np.nan
-    #    try:
-    #        ts_data[i][:, inps.ref_yx[0], inps.ref_yx[1]] = 0.   # keep value on reference pixel
-    #    except:
-    #        pass
-    #del ts_mask
-
     # default vlim
-    inps.dlim = [np.nanmin(ts_data[0]), np.nanmax(ts_data[0])]
-    ts_data_mli = multilook_data(np.squeeze(ts_data[0]), 10, 10)
-    if not inps.vlim:
-        inps.vlim = [np.nanmin(ts_data_mli[inps.ex_flag != 0]),
-                     np.nanmax(ts_data_mli[inps.ex_flag != 0])]
+    data = read_timeseries_slice(inps, inps.idx)
+    stats = read_overview_stats4slice(inps, inps.idx)
+    if stats is not None:
+        # min / max and 2nd / 98th percentiles of the full resolution data
+        inps.dlim = sorted([stats[0] * inps.unit_fac, stats[1] * inps.unit_fac])
+        if not inps.vlim:
+            inps.vlim = sorted([stats[2] * inps.unit_fac, stats[3] * inps.unit_fac])
+    else:
+        inps.dlim = [np.nanmin(data), np.nanmax(data)]
+        if not inps.vlim:
+            data_mli = multilook_data(data, 10, 10)
+            inps.vlim = [np.nanmin(data_mli), np.nanmax(data_mli)]
     vprint('data    range: {} {}'.format(inps.dlim, inps.disp_unit))
     vprint('display range: {} {}'.format(inps.vlim, inps.disp_unit))
 
-    # default ylim
+    # default ylim: based on the displacement of the last acquisition not excluded, of all files
     num_file = len(inps.timeseries_file)
     if not inps.ylim:
-        ts_data_mli = multilook_data(np.squeeze(ts_data[-1]), 4, 4)
-        if inps.zero_first:
-            ts_data_mli -= np.tile(ts_data_mli[inps.zero_idx, :, :], (inps.num_date, 1, 1))
-        ymin, ymax = (np.nanmin(ts_data_mli[inps.ex_flag != 0]),
-                      np.nanmax(ts_data_mli[inps.ex_flag != 0]))
+        idx = np.where(inps.ex_flag)[0]
+        idx = idx[-1] if idx.size > 0 else inps.num_date - 1
+        ymin, ymax = 0., 0.
+        for fname in inps.timeseries_file:
+            # read from the overview if available
+            ov_factors = [i for i in readfile.get_overview_factors(fname) if i <= 4]
+            ov_factor = max(ov_factors) if ov_factors else 1
+            data_mli = read_timeseries_slice(inps, idx, fname=fname, overview=ov_factor)
+            if inps.zero_first and inps.zero_idx != inps.ref_idx:
+                data_mli -= read_timeseries_slice(inps, inps.zero_idx, fname=fname, overview=ov_factor)
+            if ov_factor == 1:
+                data_mli = multilook_data(data_mli, 4, 4)
+            ymin = min(ymin, np.nanmin(data_mli))
+            ymax = max(ymax, np.nanmax(data_mli))
         ybuffer = (ymax - ymin) * 0.05
         inps.ylim = [ymin - ybuffer, ymax + ybuffer]
         if inps.offset:
             inps.ylim[1] += inps.offset * (num_file - 1)
-    del ts_data_mli
+    del data
+
+    return ts_readers, mask, inps
+
+
+def read_point_timeseries(ts_reader, yx, inps):
+    """Read the displacement time-series of one pixel, referenced in space and time
+    Parameters: ts_reader : timeseriesPointReader object
+                yx        : list of 2 int, pixel coordinate in the whole file
+                inps      : Namespace of input arguments
+    Returns:    dis_ts    : 1D np.array in size of (num_date,) in display unit
+    """
+    dis_ts = ts_reader.read(yx[0], yx[1])
+
+    # reference in space
+    try:
+        dis_ts -= ts_reader.read(inps.ref_yx[0], inps.ref_yx[1])
+    except (IndexError, ValueError):
+        pass
+
+    # reference in time
+    dis_ts -= dis_ts[inps.ref_idx]
 
-    return ts_data, mask, inps
+    # display unit
+    unit_fac = pp.scale_data2disp_unit(metadata=ts_reader.metadata, disp_unit=inps.disp_unit)[2]
+    dis_ts *= unit_fac
+    return dis_ts
 
 
 def plot_ts_errorbar(ax, dis_ts, inps, ppar):
@@ -572,15 +703,15 @@ class timeseriesViewer():
 
 
     def plot(self):
-        # read 3D time-series
-        self.ts_data, self.mask = read_timeseries_data(self)[0:2]
+        # read the displayed slice and prepare point time-series readers
+        self.ts_readers, self.mask = read_timeseries_data(self)[0:2]
 
         # Figure 1 - Cumulative Displacement Map
         self.fig_img = plt.figure(self.figname_img, figsize=self.figsize_img)
 
         # Figure 1 - Axes 1 - Displacement Map
         self.ax_img = self.fig_img.add_axes([0.125, 0.25, 0.75, 0.65])
-        img_data = np.array(self.ts_data[0][self.idx, :, :])  ####################
+        img_data = read_timeseries_slice(self, self.idx)
         img_data[self.mask == 0] = np.nan
         self.plot_init_image(img_data)
 
@@ -673,7 +804,7 @@ class timeseriesViewer():
         self.ax_img.set_title('N = {n}, Time = {t}'.format(n=idx, t=disp_date),
                               fontsize=self.font_size)
         # read data
-        data_img = np.array(self.ts_data[0][idx, :, :])
+        data_img = read_timeseries_slice(self, idx)
         data_img[self.mask == 0] = np.nan
         if self.wrap:
             if self.disp_unit_img == 'radian':
@@ -693,7 +824,7 @@ class timeseriesViewer():
         self.ax_pts.cla()
 
         # plot scatter in different size for different files
-        num_file = len(self.ts_data)
+        num_file = len(self.ts_readers)
         if   num_file <= 2: ms_step = 4
         elif num_file == 3: ms_step = 3
         elif num_file == 4: ms_step = 2
@@ -704,7 +835,7 @@ class timeseriesViewer():
         x = yx[1] - self.pix_box[0]
         for i in range(num_file-1, -1, -1):
             # get displacement data
-            d_tsi = self.ts_data[i][:, y, x]
+            d_tsi = read_point_timeseries(self.ts_readers[i], yx, self)
             if self.zero_first:
                 d_tsi -= d_tsi[self.zero_idx]
             d_ts.append(d_tsi)
@@ -737,7 +868,7 @@ class timeseriesViewer():
             self.ax_pts.yaxis.set_label_position("right")
 
         # legend
-        if len(self.ts_data) > 1:
+        if len(self.ts_readers) > 1:
             self.ax_pts.legend()
 
         self.fig_pts.canvas.draw()
@@ -786,7 +917,7 @@ class timeseriesViewer():
                                       fontsize=self.font_size)
 
                 # read data
-                data_img = np.array(self.ts_data[0][idx, :, :])
+                data_img = read_timeseries_slice(self, idx)
                 data_img[self.mask == 0] = np.nan
                 if self.wrap:
                     if self.disp_unit_img == 'radian':
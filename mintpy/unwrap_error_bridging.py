@@ -217,6 +217,7 @@ def run_unwrap_error_bridge(ifgram_file, water_mask_file, ramp_type=None, radius
         if dsNameOut in f.keys():
             ds = f[dsNameOut]
             print('access /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
+            writefile.remove_derived_datasets(f, dsNameOut)
         else:
             ds = f.create_dataset(dsNameOut,
                                   shape_out,
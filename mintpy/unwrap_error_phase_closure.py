@@ -24,7 +24,7 @@ except ImportError:
 
 from mintpy.objects import ifgramStack
 from mintpy.objects.conncomp import connectComponent
-from mintpy.utils import ptime, readfile, utils as ut, plot as pp
+from mintpy.utils import ptime, readfile, writefile, utils as ut, plot as pp
 from mintpy.utils.solvers import l1regls
 from mintpy import ifgram_inversion as ifginv
 
@@ -156,7 +156,7 @@ def get_number_of_nonzero_closure_phase(ifgram_file, dsName='unwrapPhase', step=
     length, width = stack_obj.length, stack_obj.width
     date12_list = stack_obj.get_date12_list(dropIfgram=True)
     num_ifgram = len(date12_list)
-    C = stack_obj.get_design_matrix4triplet(date12_list)
+    C = stack_obj.get_design_matrix4triplet(date12_list, sparse=True)
     ref_phase = stack_obj.get_reference_phase(unwDatasetName=dsName, dropIfgram=True).reshape(num_ifgram, -1)
 
     # calculate number of nonzero closure phase
@@ -172,7 +172,7 @@ def get_number_of_nonzero_closure_phase(ifgram_file, dsName='unwrapPhase', step=
                                        unwDatasetName=dsName,
                                        dropIfgram=True,
                                        print_msg=False).reshape(num_ifgram, -1)
-        closure_pha = np.dot(C, unw)
+        closure_pha = C.dot(unw)
         cint = np.round((closure_pha - ut.wrap(closure_pha)) / (2.*np.pi))
         closure_int[r0:r1, :] = np.sum(cint != 0, axis=0).reshape(-1, width)
         prog_bar.update(i+1, every=1)
@@ -204,6 +204,7 @@ def write_hdf5_file_patch(ifgram_file, data, box=None, dsName='unwrapPhase_phase
     if dsName in f.keys():
         print('update '+msg)
         ds = f[dsName]
+        writefile.remove_derived_datasets(f, dsName)
     else:
         print('create '+msg)
         ds = f.create_dataset(dsName, (num_ifgram, num_row, num_col),
@@ -342,6 +343,7 @@ def run_unwrap_error_phase_closure(ifgram_file, common_regions, water_mask_file=
     if dsNameOut in f.keys():
         ds = f[dsNameOut]
         print('access /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
+        writefile.remove_derived_datasets(f, dsNameOut)
     else:
         ds = f.create_dataset(dsNameOut,
                               shape_out,
@@ -0,0 +1,420 @@
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+# Block-streaming engine for map-style file operators, e.g. multilook / spatial_filter /
+# mask / image_math / add / diff, to process files of any size in constant memory.
+# Recommend import:
+#   from mintpy.utils import blockwise
+
+
+import os
+import collections
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from mintpy.objects import open_store, is_zarr_file
+from mintpy.utils import ptime, readfile, writefile
+
+
+def get_block_list(shape, num_file=1, lks_y=1, halo=0, split_z=True, max_memory=2, num_worker=1):
+    """Split 2D/3D dataset into blocks of slices and rows for processing in constant memory.
+    Parameters: shape      : tuple of 2/3 int, dataset shape in (num, length, width) or (length, width)
+                num_file   : int, number of input files read for each block
+                lks_y      : int, number of looks in y direction, block rows are aligned to it
+                halo       : int, number of extra rows read on both sides of a block,
+                             None to process the full rows of 2D slices at once
+                split_z    : bool, split the slices into blocks or not,
+                             False for operators along the 1st dimension, e.g. temporal filter
+                max_memory : float, maximum memory in GB for each block
+                num_worker : int, number of parallel workers, there is at least one block per worker
+    Returns:    block_list : list of [z0, z1, y0, y1] in the input coordinates, halo excluded
+    """
+    num_slice = shape[0] if len(shape) == 3 else 1
+    length, width = shape[-2:]
+    length = length // lks_y * lks_y
+
+    # size of one row of one slice in bytes, for the inputs and a few float64 copies in the kernel
+    row_size = width * 8 * (num_file + 3)
+    max_size = max_memory * 1024**3
+
+    if halo is None:
+        step_y = length
+        step_z = int(max_size / (row_size * length))
+    else:
+        step_z = num_slice
+        halo = int(halo)
+        step_y = int(max_size / (row_size * num_slice)) - 2 * halo
+        min_step_y = max(lks_y, 2 * halo, 32)
+        if step_y < min_step_y and split_z:
+            # split in slices as well, if one block of all slices is too large
+            step_y = min_step_y
+            step_z = int(max_size / (row_size * (step_y + 2 * halo)))
+    step_z = max(1, min(step_z, num_slice)) if split_z else num_slice
+    step_y = max(1, min(step_y, length))
+
+    # at least one block per worker: split slices first, then rows
+    if num_worker > 1:
+        num_block = int(np.ceil(num_slice / step_z)) * int(np.ceil(length / step_y))
+        if num_block < num_worker:
+            if num_slice >= num_worker and split_z:
+                step_z = min(step_z, int(np.ceil(num_slice / num_worker)))
+            elif halo is not None:
+                step_y = min(step_y, int(np.ceil(length / num_worker)))
+    step_y = max(lks_y, step_y // lks_y * lks_y)
+
+    block_list = []
+    for z0 in range(0, num_slice, step_z):
+        for y0 in range(0, length, step_y):
+            block_list.append([z0, min(z0 + step_z, num_slice),
+                               y0, min(y0 + step_y, length)])
+    return block_list
+
+
+def prefetch(func, args_list, depth=1):
+    """Iterate over func(*args) for each args in args_list, with the next items run on a background
+    thread while the current one is consumed, to overlap reading (and decompressing) the next block
+    with computing the current one. The number of items in memory is bounded by depth + 1.
+
+    Parameters: func      : callable, e.g. read one block of data from file(s)
+                args_list : list of tuple, arguments of func for each item
+                depth     : int, number of items to run ahead, 0 to run in sequence without thread
+    Returns:    generator of func(*args), in the order of args_list
+    Example:    for box, data in zip(box_list, blockwise.prefetch(read_box, [(fname, b) for b in box_list])):
+                    result = invert(data)
+    """
+    if depth < 1:
+        for args in args_list:
+            yield func(*args)
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        yield from map_bounded(pool, func, args_list, depth=depth)
+
+
+def map_bounded(pool, func, args_list, depth):
+    """Iterate over func(*args) for each args in args_list run on the executor, with at most depth
+    items submitted ahead of the consumer. Unlike Executor.map(), which submits all items at once,
+    the memory of the pending arguments / results is bounded by depth, regardless of the number of items.
+
+    Parameters: pool      : concurrent.futures.Executor, e.g. ProcessPoolExecutor
+                func      : callable, picklable for ProcessPoolExecutor
+                args_list : iterable of tuple, arguments of func for each item
+                depth     : int, maximum number of items submitted, e.g. 2 * num_worker
+    Returns:    generator of func(*args), in the order of args_list
+    """
+    args_iter = iter(args_list)
+    futures = collections.deque()
+    try:
+        for args in args_iter:
+            futures.append(pool.submit(func, *args))
+            if len(futures) >= depth:
+                break
+        while futures:
+            result = futures.popleft().result()
+            # submit the next item before handing over the current one
+            for args in args_iter:
+                futures.append(pool.submit(func, *args))
+                break
+            yield result
+    finally:
+        # stop running ahead if the consumer quits early
+        for future in futures:
+            future.cancel()
+
+
+class AsyncWriter:
+    """Run write calls on a background thread in the order of submission, with a bounded queue,
+    to overlap writing the previous block with computing the current one.
+    Once a call fails, the calls queued after it are skipped, e.g. a journal entry after a failed write.
+    With max_pending=0, calls are run in sequence without thread, e.g. for MPI-IO calls.
+
+    Example:    with blockwise.AsyncWriter() as writer:
+                    for box in box_list:
+                        data = invert(box)
+                        writer.submit(write_box, out_file, data, box)
+    """
+    def __init__(self, max_pending=2):
+        self.max_pending = max(0, int(max_pending))
+        self.pool = ThreadPoolExecutor(max_workers=1) if self.max_pending > 0 else None
+        self.futures = collections.deque()
+        self.failed = False
+
+    def _run(self, func, *args, **kwargs):
+        if self.failed:
+            return None
+        try:
+            return func(*args, **kwargs)
+        except:
+            self.failed = True
+            raise
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs), waiting for the oldest call if the queue is full.
+        Errors of the finished calls are raised here.
+        """
+        if self.pool is None:
+            self._run(func, *args, **kwargs)
+            return
+        while len(self.futures) >= self.max_pending:
+            self.futures.popleft().result()
+        self.futures.append(self.pool.submit(self._run, func, *args, **kwargs))
+
+    def close(self):
+        """Wait for all queued calls and raise their errors, if any."""
+        try:
+            while self.futures:
+                self.futures.popleft().result()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # finish the queued writes, but do not mask the original error
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+
+
+def read_block(fname, datasetName, block):
+    """Read block of 2D/3D dataset from file.
+    Parameters: fname       : str, path of the input file
+                datasetName : str, dataset name, the only dataset is read if the file has one dataset
+                block       : list of 4/6 int, for [y0, y1, x0, x1] / [z0, z1, y0, y1, x0, x1]
+    Returns:    data        : 2D/3D np.ndarray
+    """
+    ds_list = readfile.get_dataset_list(fname)
+    if datasetName not in ds_list:
+        if len(ds_list) != 1:
+            raise ValueError('dataset {} not found in file {}'.format(datasetName, fname))
+        datasetName = ds_list[0]
+
+    fext = os.path.splitext(fname)[1].lower()
+    if fext in ['.h5', '.he5', '.zarr']:
+        with open_store(fname, 'r') as f:
+            ds = f[datasetName]
+            if ds.ndim == 3:
+                data = ds[block[0]:block[1], block[2]:block[3], block[4]:block[5]]
+            else:
+                data = ds[block[-4]:block[-3], block[-2]:block[-1]]
+    else:
+        box = (block[-2], block[-4], block[-1], block[-3])
+        if len(ds_list) == 1:
+            datasetName = None
+        data = readfile.read(fname, datasetName=datasetName, box=box, print_msg=False)[0]
+    return data
+
+
+def read_block_list(fnames, datasetName, block):
+    """Read the same block from all input files."""
+    return [read_block(fname, datasetName, block) for fname in fnames]
+
+
+def run_block(func, fnames, datasetName, block):
+    """Read block from all input files and run the kernel function on it."""
+    data_list = read_block_list(fnames, datasetName, block)
+    return func(data_list, block)
+
+
+def run_block2store(func, fnames, datasetName, block, out_file, out_block, trim):
+    """Read block from all input files, run the kernel function on it and write the result
+    into the dataset of the same name in the output Zarr store, for parallel workers.
+    Parameters: out_block : list of 2/4 int, [(z0, z1,) y0, y1] of the block in the output
+                trim      : tuple of 3 int, (y0, y1, width) of the kernel output to write, i.e. without halo
+    """
+    data = run_block(func, fnames, datasetName, block)
+    ty0, ty1, out_width = trim
+    with open_store(out_file, 'a') as f:
+        write_block(f[datasetName], data[..., ty0:ty1, :out_width], out_block)
+    return None
+
+
+def write_block(ds, data, block):
+    """Write block of data into 2D/3D dataset (h5py.Dataset or np.ndarray) in [(z0, z1,) y0, y1]."""
+    if len(block) == 4:
+        ds[block[0]:block[1], block[2]:block[3], :] = data
+    else:
+        ds[block[0]:block[1], :] = data
+
+
+def process_file(in_files, out_file, func, datasetNames=None, metadata=None, ref_file=None, lks=(1, 1),
+                 halo=0, split_z=True, skip_datasets=None, compression=None, max_memory=2, num_worker=1,
+                 print_msg=True):
+    """Apply a map-style operator on all 2D/3D datasets of the input file(s) block by block.
+    Each block is read from all input files, processed by the kernel function, then written into the
+    output file laid out in advance, so that the memory usage is bounded by max_memory, regardless of
+    the file size. Blocks are processed in parallel by num_worker processes.
+
+    Parameters: in_files     : (list of) str, input files with the same size and dataset structure
+                out_file     : str, output file
+                func         : callable kernel in func(data_list, block) --> data, with
+                               data_list - list of 2D/3D np.ndarray of the block, one for each input file
+                               block     - list of 4/6 int, [(z0, z1,) y0, y1, x0, x1] of the block read,
+                                           including halo, in the input coordinates
+                               data      - 2D/3D np.ndarray, in the size of block rows / cols divided by lks
+                               It has to be picklable for num_worker > 1, e.g. a module level function
+                               or functools.partial of it.
+                datasetNames : list of str, datasets to process, default is all 2D/3D datasets of in_files[0]
+                metadata     : dict, attributes of the output file, default is from ref_file or in_files[0]
+                ref_file     : str, reference file to copy the auxliary datasets (date / bperp / ...) from
+                lks          : tuple of 2 int, number of looks in (y, x) direction of the output
+                halo         : int, number of extra rows needed on both sides of a block by the kernel,
+                               e.g. kernel radius of spatial filter, which are trimmed from the kernel output.
+                               None to process the full rows of 2D slices at once
+                split_z      : bool, split the slices of 3D datasets into blocks or not,
+                               False for operators along the 1st dimension, e.g. temporal filter
+                skip_datasets: list of str, datasets to copy without applying the kernel
+                compression  : str, compression of the output HDF5 datasets
+                max_memory   : float, maximum memory in GB for each block
+                num_worker   : int, number of parallel processes
+    Returns:    out_file     : str
+    Example:    def add_block(data_list, block):
+                    return data_list[0] + data_list[1]
+                blockwise.process_file(['timeseries.h5', 'ERA5.h5'], 'timeseries_ERA5.h5', add_block,
+                                       ref_file='timeseries.h5')
+    """
+    if isinstance(in_files, str):
+        in_files = [in_files]
+    lks_y, lks_x = [int(i) for i in lks]
+    skip_datasets = skip_datasets if skip_datasets else []
+
+    if not metadata:
+        metadata = readfile.read_attribute(ref_file if ref_file else in_files[0])
+    atr = readfile.read_attribute(in_files[0])
+    length, width = int(atr['LENGTH']), int(atr['WIDTH'])
+    out_length, out_width = length // lks_y, width // lks_x
+    if not datasetNames:
+        datasetNames = readfile.get_dataset_list(in_files[0])
+
+    # output file
+    fext = os.path.splitext(out_file)[1].lower()
+    is_hdf5 = fext in ['.h5', '.he5', '.zarr']
+    if is_hdf5:
+        if compression is None and ref_file:
+            compression = readfile.get_hdf5_compression(ref_file)
+        writefile.layout_hdf5(out_file, metadata=metadata, ref_file=ref_file,
+                              compression=compression, print_msg=print_msg)
+        fo = open_store(out_file, 'a')
+    else:
+        # binary file of 2D dataset(s): blocks are assembled in memory and written at the end
+        dsDict = dict()
+
+    pool = ProcessPoolExecutor(max_workers=num_worker) if num_worker > 1 else None
+    try:
+        maxDigit = max([len(i) for i in datasetNames])
+        for dsName in datasetNames:
+            shape = get_dataset_shape(in_files[0], dsName, atr)
+            out_shape = shape[:-2] + (out_length, out_width)
+            ds_func = run_copy if dsName in skip_datasets else func
+            ds_halo = 0 if dsName in skip_datasets else halo
+            block_list = get_block_list(shape,
+                                        num_file=len(in_files),
+                                        lks_y=lks_y,
+                                        halo=ds_halo,
+                                        split_z=split_z,
+                                        max_memory=max_memory,
+                                        num_worker=num_worker)
+            if print_msg:
+                print('processing {d:<{w}} in {s} in {n} blocks ...'.format(
+                    d=dsName, w=maxDigit, s=shape, n=len(block_list)))
+
+            # read blocks with halo and full width
+            read_blocks = []
+            for z0, z1, y0, y1 in block_list:
+                ry0 = max(0, y0 - ds_halo) if ds_halo is not None else 0
+                ry1 = min(length, y1 + ds_halo) if ds_halo is not None else length
+                rblock = [ry0, ry1, 0, width]
+                if len(shape) == 3:
+                    rblock = [z0, z1] + rblock
+                read_blocks.append(rblock)
+
+            def out_box(i):
+                z0, z1, y0, y1 = block_list[i]
+                ry0 = read_blocks[i][-4]
+                return (z0, z1), (y0 // lks_y, y1 // lks_y), ((y0 - ry0) // lks_y, (y1 - ry0) // lks_y)
+
+            # run and write in the order of blocks
+            prog_bar = ptime.progressBar(maxValue=len(block_list), print_msg=print_msg)
+            if pool and is_zarr_file(out_file):
+                # Zarr store allows concurrent writers: workers write their blocks into it directly,
+                # instead of sending them back, once the dataset is created with the 1st block
+                def run_blocks():
+                    yield run_block(ds_func, in_files, dsName, read_blocks[0])
+                    args_list = []
+                    for i in range(1, len(read_blocks)):
+                        (z0, z1), (oy0, oy1), (ty0, ty1) = out_box(i)
+                        out_block = [z0, z1, oy0, oy1] if len(out_shape) == 3 else [oy0, oy1]
+                        args_list.append((ds_func, in_files, dsName, read_blocks[i],
+                                          out_file, out_block, (ty0, ty1, out_width)))
+                    yield from map_bounded(pool, run_block2store, args_list, depth=2*num_worker)
+                results = run_blocks()
+            elif pool:
+                # at most 2 blocks per worker in flight, to bound the memory of the pending results
+                results = map_bounded(pool, run_block,
+                                      [(ds_func, in_files, dsName, b) for b in read_blocks],
+                                      depth=2*num_worker)
+            else:
+                # read the next block on a background thread while the current one is processed
+                data_lists = prefetch(read_block_list, [(in_files, dsName, b) for b in read_blocks])
+                results = (ds_func(data_list, b) for data_list, b in zip(data_lists, read_blocks))
+
+            # write the previous block on a background thread while the current one is processed
+            ds = None
+            with AsyncWriter() as writer:
+                for i, data in enumerate(results):
+                    if data is None:
+                        # written by the worker already
+                        prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
+                        continue
+                    (z0, z1), (oy0, oy1), (ty0, ty1) = out_box(i)
+                    data = data[..., ty0:ty1, :out_width]
+
+                    # create output dataset with the data type of the kernel output
+                    if ds is None:
+                        if is_hdf5:
+                            if print_msg:
+                                print('create dataset /{d:<{w}} of {t:<10} in size of {s:<20} '
+                                      'with compression={c}'.format(d=dsName, w=maxDigit, t=str(data.dtype),
+                                                                    s=str(out_shape), c=compression))
+                            ds = fo.create_dataset(dsName, shape=out_shape, dtype=data.dtype,
+                                                   chunks=True, compression=compression)
+                        else:
+                            ds = np.zeros(out_shape, dtype=data.dtype)
+                            dsDict[dsName] = ds
+
+                    oblock = [z0, z1, oy0, oy1] if len(out_shape) == 3 else [oy0, oy1]
+                    writer.submit(write_block, ds, data, oblock)
+                    prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
+            prog_bar.close()
+    finally:
+        if pool:
+            pool.shutdown()
+        if is_hdf5:
+            fo.close()
+
+    if is_hdf5:
+        readfile.clear_metadata_cache(out_file)
+        if print_msg:
+            print('finished writing to {}'.format(out_file))
+    else:
+        writefile.write(dsDict, out_file=out_file, metadata=metadata)
+    return out_file
+
+
+def run_copy(data_list, block):
+    return data_list[0]
+
+
+def get_dataset_shape(fname, datasetName, atr=None):
+    """Get the shape of 2D/3D dataset without reading it."""
+    atr = atr if atr else readfile.read_attribute(fname)
+    shape = (int(atr['LENGTH']), int(atr['WIDTH']))
+    if os.path.splitext(fname)[1].lower() in ['.h5', '.he5', '.zarr']:
+        with open_store(fname, 'r') as f:
+            shape = f[datasetName].shape
+    return tuple(shape)
@@ -0,0 +1,288 @@
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+# Write point features into MBTiles (SQLite) file of Mapbox Vector Tiles (MVT),
+# as a replacement of the GeoJSON + tippecanoe round trip for insarmaps.
+# Reference: https://github.com/mapbox/mbtiles-spec
+#            https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+# Recommend import:
+#   from mintpy.utils import mbtiles
+
+
+import os
+import gzip
+import json
+import sqlite3
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+MVT_VERSION = 2
+MVT_POINT = 1
+# geometry command integer of MoveTo with count of 1
+MVT_MOVETO_ONE = (1 & 0x7) | (1 << 3)
+
+
+################################## protobuf encoding ##################################
+def encode_varint(value):
+    """Encode non-negative integer into protobuf base 128 varint bytes"""
+    out = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def encode_key(field, wire_type):
+    return encode_varint((field << 3) | wire_type)
+
+
+def encode_bytes(field, payload):
+    """Encode length-delimited field"""
+    return encode_key(field, 2) + encode_varint(len(payload)) + payload
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+## Vectorized encoding: a column of messages is represented as a 2D np.ndarray of uint8
+## with a mask of the same shape, where the valid bytes of each row form one message.
+def varint_column(values):
+    """Encode 1D array of non-negative integers into column of varint bytes"""
+    values = np.asarray(values, dtype=np.uint64).reshape(-1, 1)
+    shifts = np.arange(0, 70, 7, dtype=np.uint64).reshape(1, -1)
+    groups = ((values >> shifts) & np.uint64(0x7f)).astype(np.uint8)
+    num_byte = np.maximum(1, np.sum((values >> shifts) > 0, axis=1, keepdims=True))
+    mask = np.arange(10).reshape(1, -1) < num_byte
+    # continuation bit for all but the last byte
+    cont = np.arange(10).reshape(1, -1) < (num_byte - 1)
+    groups[cont] |= 0x80
+    return groups, mask
+
+
+def bytes_column(data, num):
+    """Column of constant bytes, or list of bytes of each row"""
+    if isinstance(data, bytes):
+        arr = np.frombuffer(data, dtype=np.uint8)
+        return np.tile(arr, (num, 1)), np.ones((num, arr.size), dtype=np.bool_)
+    max_len = max([len(i) for i in data] + [0])
+    arr = np.zeros((num, max_len), dtype=np.uint8)
+    mask = np.zeros((num, max_len), dtype=np.bool_)
+    for i, b in enumerate(data):
+        arr[i, :len(b)] = np.frombuffer(b, dtype=np.uint8)
+        mask[i, :len(b)] = True
+    return arr, mask
+
+
+def concat_columns(columns):
+    return np.hstack([i[0] for i in columns]), np.hstack([i[1] for i in columns])
+
+
+def length_delimited_column(field, column):
+    """Wrap each message of the column into a length-delimited field"""
+    num = column[0].shape[0]
+    return concat_columns([bytes_column(encode_key(field, 2), num),
+                           varint_column(np.sum(column[1], axis=1)),
+                           column])
+
+
+def value_column(values):
+    """Encode 1D array of property values into column of MVT Value message"""
+    values = np.asarray(values)
+    num = values.size
+    if values.dtype == np.bool_:
+        column = concat_columns([bytes_column(encode_key(7, 0), num),
+                                 varint_column(values.astype(np.uint64))])
+    elif np.issubdtype(values.dtype, np.integer):
+        if np.all(values >= 0):
+            column = concat_columns([bytes_column(encode_key(5, 0), num),
+                                     varint_column(values)])
+        else:
+            column = concat_columns([bytes_column(encode_key(6, 0), num),
+                                     varint_column(zigzag(values.astype(np.int64)).view(np.uint64))])
+    elif np.issubdtype(values.dtype, np.floating):
+        data = values.astype('<f8').view(np.uint8).reshape(num, 8)
+        column = concat_columns([bytes_column(encode_key(3, 1), num),
+                                 (data, np.ones(data.shape, dtype=np.bool_))])
+    else:
+        column = bytes_column([encode_bytes(1, str(i).encode('utf-8')) for i in values], num)
+    return column
+
+
+def encode_tile(layer_name, xs, ys, properties, extent=4096, ids=None):
+    """Encode points into one gzipped MVT tile with one layer.
+    Parameters: layer_name : str, name of the vector layer
+                xs/ys      : 1D np.ndarray of int, point coordinates in tile pixel
+                properties : dict of 1D np.ndarray, property values of each point
+                extent     : int, tile extent in pixel
+                ids        : 1D np.ndarray of int, feature id
+    Returns:    tile_data  : bytes, gzipped MVT tile
+    """
+    keys = list(properties.keys())
+    num_key = len(keys)
+    num = len(xs)
+    value_idx = np.arange(num, dtype=np.uint64) * num_key
+
+    # features
+    feature = []
+    if ids is not None:
+        feature += [bytes_column(encode_key(1, 0), num), varint_column(ids)]
+    tags = []
+    for j in range(num_key):
+        tags += [bytes_column(encode_varint(j), num), varint_column(value_idx + j)]
+    feature.append(length_delimited_column(2, concat_columns(tags)))
+    feature.append(bytes_column(encode_key(3, 0) + encode_varint(MVT_POINT), num))
+    geometry = concat_columns([bytes_column(encode_varint(MVT_MOVETO_ONE), num),
+                               varint_column(zigzag(np.asarray(xs, dtype=np.int64))),
+                               varint_column(zigzag(np.asarray(ys, dtype=np.int64)))])
+    feature.append(length_delimited_column(4, geometry))
+    data, mask = length_delimited_column(2, concat_columns(feature))
+    features = data[mask].tobytes()
+
+    # values, in the order of feature then key
+    values = concat_columns([length_delimited_column(4, value_column(properties[key])) for key in keys])
+    data, mask = values
+    values = data[mask].tobytes()
+
+    layer = encode_key(15, 0) + encode_varint(MVT_VERSION)
+    layer += encode_bytes(1, layer_name.encode('utf-8'))
+    layer += features
+    layer += b''.join(encode_bytes(3, key.encode('utf-8')) for key in keys)
+    layer += values
+    layer += encode_key(5, 0) + encode_varint(extent)
+    return gzip.compress(encode_bytes(3, layer), compresslevel=6)
+
+
+################################## tiling ##################################
+def lonlat2tile_xy(lons, lats, zoom):
+    """Convert longitude / latitude into the fractional tile index at zoom level in Web Mercator."""
+    num_tile = 2 ** zoom
+    lat_rad = np.deg2rad(np.clip(lats, -85.0511, 85.0511))
+    x = (np.asarray(lons) + 180.) / 360. * num_tile
+    y = (1. - np.log(np.tan(lat_rad) + 1. / np.cos(lat_rad)) / np.pi) / 2. * num_tile
+    return x, y
+
+
+def encode_tiles(layer_name, tile_list, extent):
+    """Encode a list of (zoom, col, row, xs, ys, properties, ids) into (zoom, col, tms_row, tile_data)"""
+    out = []
+    for zoom, col, row, xs, ys, properties, ids in tile_list:
+        tile_data = encode_tile(layer_name, xs, ys, properties, extent=extent, ids=ids)
+        out.append((zoom, col, 2 ** zoom - 1 - row, tile_data))
+    return out
+
+
+def split_into_tiles(lons, lats, properties, zoom, extent, ids=None):
+    """Group points into tiles at zoom level, with one point per tile pixel.
+    Returns:    tile_list : list of (zoom, col, row, xs, ys, properties, ids), empty if no point
+    """
+    if np.size(lons) == 0:
+        return []
+
+    x, y = lonlat2tile_xy(lons, lats, zoom)
+    col, row = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+    px = np.floor((x - col) * extent).astype(np.int64)
+    py = np.floor((y - row) * extent).astype(np.int64)
+
+    # keep the 1st point of each tile pixel, as there is no gain to show more
+    num_tile = 2 ** zoom
+    pixel_id = ((row * num_tile + col) * extent + py) * extent + px
+    pixel_id, idx = np.unique(pixel_id, return_index=True)
+    idx = np.sort(idx)
+
+    # sort by tile
+    tile_id = row[idx] * num_tile + col[idx]
+    order = np.argsort(tile_id, kind='stable')
+    idx, tile_id = idx[order], tile_id[order]
+    bounds = np.flatnonzero(np.diff(tile_id)) + 1
+    tile_list = []
+    for tile_idx in np.split(idx, bounds):
+        i0 = tile_idx[0]
+        tile_list.append((zoom, int(col[i0]), int(row[i0]), px[tile_idx], py[tile_idx],
+                          {key: value[tile_idx] for key, value in properties.items()},
+                          ids[tile_idx] if ids is not None else None))
+    return tile_list
+
+
+def write_mbtiles(out_file, lons, lats, properties, layer_name='points', min_zoom=0, max_zoom=14,
+                  extent=4096, max_zoom_extent=512, ids=None, num_worker=1, print_msg=True):
+    """Write points into MBTiles file of vector tiles at multiple zoom levels.
+
+    Tiles are encoded by parallel workers, and inserted zoom by zoom in bulk transactions.
+    At each zoom level, only the first point of each tile pixel is kept.
+
+    Parameters: out_file   : str, path of the output MBTiles file
+                lons/lats  : 1D np.ndarray in float, point coordinates in degrees
+                properties : dict of 1D np.ndarray, property values of each point, e.g. {'m': slope, 'p': point_num}
+                layer_name : str, name of the vector layer
+                min/max_zoom : int, zoom levels to write
+                extent     : int, tile extent for zoom levels below max_zoom
+                max_zoom_extent : int, tile extent for the max zoom level
+                ids        : 1D np.ndarray of int, feature id
+                num_worker : int, number of parallel workers to encode tiles
+    Returns:    out_file   : str
+    Example:    write_mbtiles('KyushuT73.mbtiles', lons, lats, {'m': slope, 'p': point_num},
+                              layer_name='chunk_1', min_zoom=0, max_zoom=14, num_worker=4)
+    """
+    lons, lats = np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64)
+    if os.path.isfile(out_file):
+        os.remove(out_file)
+
+    con = sqlite3.connect(out_file)
+    con.execute('CREATE TABLE metadata (name text, value text)')
+    con.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)')
+
+    # metadata
+    fields = {key: 'Number' if np.issubdtype(np.asarray(value).dtype, np.number) else 'String'
+              for key, value in properties.items()}
+    bounds = [np.min(lons), np.min(lats), np.max(lons), np.max(lats)] if lons.size > 0 else [-180, -85, 180, 85]
+    metadata = {
+        'name'    : os.path.splitext(os.path.basename(out_file))[0],
+        'format'  : 'pbf',
+        'type'    : 'overlay',
+        'version' : '2',
+        'minzoom' : str(min_zoom),
+        'maxzoom' : str(max_zoom),
+        'bounds'  : ','.join(str(i) for i in bounds),
+        'center'  : '{},{},{}'.format((bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2, max_zoom),
+        'json'    : json.dumps({'vector_layers': [{'id'      : layer_name,
+                                                   'fields'  : fields,
+                                                   'minzoom' : min_zoom,
+                                                   'maxzoom' : max_zoom}]}),
+    }
+    con.executemany('INSERT INTO metadata VALUES (?, ?)', list(metadata.items()))
+    con.commit()
+
+    # tiles
+    with ProcessPoolExecutor(max_workers=num_worker) as pool:
+        for zoom in range(min_zoom, max_zoom + 1):
+            zoom_extent = max_zoom_extent if zoom == max_zoom else extent
+            tile_list = split_into_tiles(lons, lats, properties, zoom, zoom_extent, ids=ids)
+
+            # split tiles into about 4 batches per worker
+            num_batch = min(len(tile_list), num_worker * 4)
+            batches = [tile_list[i::num_batch] for i in range(num_batch)]
+            futures = [pool.submit(encode_tiles, layer_name, batch, zoom_extent) for batch in batches]
+
+            with con:
+                for future in futures:
+                    rows = future.result()
+                    con.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', rows)
+            num_point = sum(len(tile[3]) for tile in tile_list)
+            if print_msg:
+                print('zoom {:2d}: write {:6d} tiles with {:9d} points'.format(zoom, len(tile_list), num_point))
+
+    con.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+    con.execute('CREATE UNIQUE INDEX name ON metadata (name)')
+    con.commit()
+    con.close()
+    if print_msg:
+        print('finished writing to {}'.format(out_file))
+    return out_file
@@ -13,8 +13,6 @@ import itertools
 import h5py
 import numpy as np
 from scipy import sparse
-from matplotlib import dates as mdates, pyplot as plt
-from matplotlib.tri import Triangulation
 from mintpy.objects import ifgramStack, sensor
 from mintpy.utils import ptime, readfile
 
@@ -335,6 +333,7 @@ def simulate_coherence(date12_list, baseline_file='bl_list.txt', sensor_name='En
     if display:
         print(('critical perp baseline: %.f m' % pbase_c))
         cohs_mat = coherence_matrix(date12_list, cohs)
+        import matplotlib.pyplot as plt
         plt.figure()
         plt.imshow(cohs_mat, vmin=0.0, vmax=1.0, cmap='jet')
         plt.xlabel('Image number')
@@ -667,6 +666,7 @@ def select_pairs_delaunay(date_list, pbase_list, norm=True, date12_format='YYMMD
         tbase_list = [tbase*temp2perp_scale for tbase in tbase_list]
 
     # Generate Delaunay Triangulation
+    from matplotlib.tri import Triangulation
     date12_idx_list = Triangulation(tbase_list, pbase_list).edges.tolist()
     date12_idx_list = [sorted(idx) for idx in sorted(date12_idx_list)]
 
@@ -25,10 +25,6 @@ from matplotlib import (
 from matplotlib.colors import LinearSegmentedColormap
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
-import pyproj
-from cartopy import crs as ccrs
-from cartopy.mpl import geoaxes, ticker as cticker
-
 from mintpy.objects import timeseriesKeyNames, timeseriesDatasetNames
 from mintpy.objects.colors import ColormapExt
 from mintpy.objects.coord import coordinate
@@ -1178,6 +1174,9 @@ def plot_dem_background(ax, geo_box=None, dem_shade=None, dem_contour=None, dem_
     extent = (pix_box[0]-0.5, pix_box[2]-0.5,
               pix_box[3]-0.5, pix_box[1]-0.5) #(left, right, bottom, top) in data coordinates
 
+    if geo_box is not None:
+        from cartopy.mpl import geoaxes
+
     # plot shaded relief
     if dem_shade is not None:
         # geo coordinates
@@ -1707,7 +1706,7 @@ def auto_lalo_sequence(geo_box, lalo_step=None, lalo_max_num=4, step_candidate=[
 
 def draw_lalo_label(geo_box, ax=None, lalo_step=None, lalo_loc=[1, 0, 0, 1], lalo_max_num=4,
                     font_size=12, xoffset=None, yoffset=None, yrotate='horizontal',
-                    projection=ccrs.PlateCarree(), print_msg=True):
+                    projection=None, print_msg=True):
     """Auto draw lat/lon label/tick based on coverage from geo_box
     Parameters: geo_box   : 4-tuple of float, defining UL_lon, UL_lat, LR_lon, LR_lat coordinate
                 ax        : CartoPy axes.
@@ -1715,14 +1714,22 @@ def draw_lalo_label(geo_box, ax=None, lalo_step=None, lalo_loc=[1, 0, 0, 1], lal
                 lalo_loc  : list of 4 bool, positions where the labels are drawn as in [left, right, top, bottom]
                             default: [1,0,0,1]
                 lalo_max_num : int
+                projection : cartopy.crs object, default is PlateCarree
                 ...
     Example:    geo_box = (128.0, 37.0, 138.0, 30.0)
                 m.draw_lalo_label(geo_box)
     """
+    from cartopy import crs as ccrs
+    from cartopy.mpl import ticker as cticker
+
     # default ax
     if not ax:
         ax = plt.gca()
 
+    # default projection
+    if projection is None:
+        projection = ccrs.PlateCarree()
+
     # default lat/lon sequences
     lats, lons, lalo_step, digit = auto_lalo_sequence(geo_box, lalo_step=lalo_step, lalo_max_num=lalo_max_num)
     if print_msg:
@@ -1761,6 +1768,7 @@ def draw_scalebar(ax, geo_box, loc=[0.2, 0.2, 0.1], labelpad=0.05, font_size=12,
     Example:    from mintpy.utils import plot as pp
                 pp.draw_scale_bar(ax, geo_box)
     """
+    import pyproj
     if not ax:
         ax = plt.gca()
 
@@ -12,7 +12,6 @@ import re
 import warnings
 import xml.etree.ElementTree as ET
 
-import h5py
 import json
 import numpy as np
 
@@ -25,7 +24,13 @@ from mintpy.objects import (
     ifgramStack,
     timeseriesDatasetNames,
     timeseries,
-    HDFEOS
+    HDFEOS,
+    PIXEL_MAJOR_GROUP,
+    STATS_CACHE_GROUP,
+    read_3d_dataset,
+    open_store,
+    DATASET_CLASSES,
+    GROUP_CLASSES,
 )
 
 
@@ -164,6 +169,61 @@ ENVI_BYTE_ORDER = {
 
 
 
+#########################################################################
+## Metadata cache for HDF5 files
+## attributes / slice list / dataset list are memoized per process and keyed on
+## the file signature (path, mtime, size), so that repeated reads of the same file
+## (e.g. per dataset in view / geocode / subset) do not re-open it every time.
+## The cache is invalidated automatically if the file is modified and explicitly
+## by writefile / ut.add_attribute via clear_metadata_cache().
+
+METADATA_CACHE_SIZE = 128
+_metadata_cache = dict()
+
+
+def _get_file_signature(fname):
+    fname = os.path.abspath(fname)
+    fstat = os.stat(fname)
+    if os.path.isdir(fname):
+        # Zarr directory store: metadata is in the .zattrs / .zgroup files of the root
+        fstat = max([os.stat(os.path.join(fname, i)) for i in ['.zattrs', '.zgroup']
+                     if os.path.isfile(os.path.join(fname, i))] + [fstat],
+                    key=lambda x: x.st_mtime_ns)
+    return (fname, fstat.st_mtime_ns, fstat.st_size)
+
+
+def get_cached_metadata(fname, key):
+    """Get the cached value of key for input file, return None if not cached or out-of-date."""
+    fsig = _get_file_signature(fname)
+    fcache = _metadata_cache.get(fsig[0], None)
+    if fcache is None or fcache['signature'] != fsig:
+        return None
+    return fcache.get(key, None)
+
+
+def set_cached_metadata(fname, key, value):
+    """Cache the value of key for input file."""
+    fsig = _get_file_signature(fname)
+    fcache = _metadata_cache.get(fsig[0], None)
+    if fcache is None or fcache['signature'] != fsig:
+        # drop the oldest file if the cache is full
+        if fsig[0] not in _metadata_cache and len(_metadata_cache) >= METADATA_CACHE_SIZE:
+            _metadata_cache.pop(next(iter(_metadata_cache)))
+        fcache = {'signature' : fsig}
+        _metadata_cache[fsig[0]] = fcache
+    fcache[key] = value
+    return value
+
+
+def clear_metadata_cache(fname=None):
+    """Remove the cached metadata of input file, or of all files if fname is None."""
+    if fname is None:
+        _metadata_cache.clear()
+    else:
+        _metadata_cache.pop(os.path.abspath(fname), None)
+    return
+
+
 #########################################################################
 def read(fname, box=None, datasetName=None, print_msg=True):
     """Read one dataset and its attributes from input file.
@@ -199,7 +259,7 @@ def read(fname, box=None, datasetName=None, print_msg=True):
 
     # Read Data
     fext = os.path.splitext(os.path.basename(fname))[1].lower()
-    if fext in ['.h5', '.he5']:
+    if fext in ['.h5', '.he5', '.zarr']:
         data = read_hdf5_file(fname, datasetName=datasetName, box=box)
     else:
         data, atr = read_binary_file(fname, datasetName=datasetName, box=box)
@@ -207,7 +267,7 @@ def read(fname, box=None, datasetName=None, print_msg=True):
 
 
 #########################################################################
-def read_hdf5_file(fname, datasetName=None, box=None):
+def read_hdf5_file(fname, datasetName=None, box=None, overview=1):
     """
     Parameters: fname : str, name of HDF5 file to read
                 datasetName : str or list of str, dataset name in root level with/without date info
@@ -224,6 +284,8 @@ def read_hdf5_file(fname, datasetName=None, box=None):
                     'igram-20150215_20150227'
                     ...
                 box : 4-tuple of int area to read, defined in (x0, y0, x1, y1) in pixel coordinate
+                overview : int, read from the overview downsampled by this factor, as written by
+                    writefile.write_overview(). The output is in size of box // overview.
     Returns:    data : 2D/3D array
                 atr : dict, metadata
     """
@@ -248,7 +310,7 @@ def read_hdf5_file(fname, datasetName=None, box=None):
     inputDateList = [i.replace(dsFamily,'').replace('-','') for i in datasetName]
 
     # read hdf5
-    with h5py.File(fname, 'r') as f:
+    with open_store(fname, 'r') as f:
         # get dataset object
         dsNames = [i for i in [datasetName[0], dsFamily] if i in f.keys()]
         dsNamesOld = [i for i in slice_list if '/{}'.format(datasetName[0]) in i] # support for old mintpy files
@@ -259,6 +321,17 @@ def read_hdf5_file(fname, datasetName=None, box=None):
         else:
             raise ValueError('input dataset {} not found in file {}'.format(datasetName, fname))
 
+        # overview dataset
+        if overview > 1:
+            ov_name = 'overview/{}{}'.format(overview, ds.name)
+            if ov_name not in f:
+                raise ValueError('overview {} not found in file {}'.format(ov_name, fname))
+            ds = f[ov_name]
+            x0, y0 = box[0] // overview, box[1] // overview
+            box = (x0, y0,
+                   x0 + (box[2] - box[0]) // overview,
+                   y0 + (box[3] - box[1]) // overview)
+
         # 2D dataset
         if ds.ndim == 2:
             data = ds[box[1]:box[3], box[0]:box[2]]
@@ -276,7 +349,7 @@ def read_hdf5_file(fname, datasetName=None, box=None):
                     slice_flag[date_list.index(d)] = True
 
             # read data
-            data = ds[slice_flag, box[1]:box[3], box[0]:box[2]]
+            data = read_3d_dataset(f, ds, slice_flag, box)
             data = np.squeeze(data)
     return data
 
@@ -454,9 +527,13 @@ def get_slice_list(fname):
 
     global slice_list
     # HDF5 Files
-    if fext in ['.h5', '.he5']:
-        with h5py.File(fname, 'r') as f:
-            d1_list = [i for i in f.keys() if isinstance(f[i], h5py.Dataset)]
+    if fext in ['.h5', '.he5', '.zarr']:
+        slice_list = get_cached_metadata(fname, 'slice_list')
+        if slice_list is not None:
+            return list(slice_list)
+
+        with open_store(fname, 'r') as f:
+            d1_list = [i for i in f.keys() if isinstance(f[i], DATASET_CLASSES)]
         if k == 'timeseries' and k in d1_list:
             obj = timeseries(fname)
             obj.open(print_msg=False)
@@ -492,14 +569,16 @@ def get_slice_list(fname):
             length, width = int(atr['LENGTH']), int(atr['WIDTH'])
             def get_hdf5_2d_dataset(name, obj):
                 global slice_list
-                if isinstance(obj, h5py.Dataset) and obj.shape[-2:] == (length, width):
+                if (isinstance(obj, DATASET_CLASSES) and obj.shape[-2:] == (length, width)
+                        and not name.startswith(STATS_CACHE_GROUP+'/')):
                     if obj.ndim == 2:
                         slice_list.append(name)
                     else:
                         warnings.warn('file has un-defined {}D dataset: {}'.format(obj.ndim, name))
             slice_list = []
-            with h5py.File(fname, 'r') as f:
+            with open_store(fname, 'r') as f:
                 f.visititems(get_hdf5_2d_dataset)
+        set_cached_metadata(fname, 'slice_list', list(slice_list))
 
     # Binary Files
     else:
@@ -524,16 +603,22 @@ def get_dataset_list(fname, datasetName=None):
     fext = fext.lower()
 
     global ds_list
-    if fext in ['.h5', '.he5']:
+    if fext in ['.h5', '.he5', '.zarr']:
+        ds_list = get_cached_metadata(fname, 'dataset_list')
+        if ds_list is not None:
+            return list(ds_list)
+
         atr = read_attribute(fname)
         length, width = int(atr['LENGTH']), int(atr['WIDTH'])
         def get_hdf5_dataset(name, obj):
             global ds_list
-            if isinstance(obj, h5py.Dataset) and obj.shape[-2:] == (length, width):
+            if (isinstance(obj, DATASET_CLASSES) and obj.shape[-2:] == (length, width)
+                    and not name.startswith(STATS_CACHE_GROUP+'/')):
                 ds_list.append(name)
         ds_list = []
-        with h5py.File(fname, 'r') as f:
+        with open_store(fname, 'r') as f:
             f.visititems(get_hdf5_dataset)
+        set_cached_metadata(fname, 'dataset_list', list(ds_list))
 
     elif fext in ['.trans', '.utm_to_rdc']:
         ds_list = ['rangeCoord', 'azimuthCoord']
@@ -547,16 +632,109 @@ def get_dataset_list(fname, datasetName=None):
 def get_hdf5_compression(fname):
     """Get the compression type of input HDF5 file"""
     ext = os.path.splitext(fname)[1].lower()
-    if ext not in ['.h5','.he5']:
+    if ext not in ['.h5', '.he5', '.zarr']:
         return None
 
     compression = None
     ds_name = get_dataset_list(fname)[0]
-    with h5py.File(fname, 'r') as f:
+    with open_store(fname, 'r') as f:
         compression = f[ds_name].compression
     return compression
 
 
+def get_overview_factors(fname, datasetName=None):
+    """Get the list of downsampling factors of the overviews in HDF5 file
+    Parameters: fname : str, path of HDF5 file
+                datasetName : str, dataset name (family) of interest, e.g. unwrapPhase
+    Returns:    factors : list of int in ascending order, e.g. [2, 4, 8], empty if no overview
+    """
+    fext = os.path.splitext(fname)[1].lower()
+    if fext not in ['.h5', '.he5', '.zarr']:
+        return []
+
+    dsName = datasetName.split('-')[0] if datasetName else None
+    factors = get_cached_metadata(fname, ('overview_factors', dsName))
+    if factors is not None:
+        return list(factors)
+
+    factors = []
+    with open_store(fname, 'r') as f:
+        if 'overview' in f.keys():
+            for key in [i for i in f['overview'].keys() if i.isdigit()]:
+                names = []
+                f['overview'][key].visit(names.append)
+                if not dsName or any(i == dsName or i.endswith('/'+dsName) for i in names):
+                    factors.append(int(key))
+    factors = sorted(factors)
+    set_cached_metadata(fname, ('overview_factors', dsName), list(factors))
+    return factors
+
+
+def read_overview(fname, overview, datasetName=None, box=None):
+    """Read data from the overview of HDF5 file, as written by writefile.write_overview()
+    Parameters: fname : str, path of HDF5 file
+                overview : int, downsampling factor of the overview to read
+                datasetName : str or list of str, slice names, same as read()
+                box : 4-tuple of int, area to read in (x0, y0, x1, y1) in full resolution pixel coordinate
+    Returns:    data : 2D/3D array in size of box // overview
+    Examples:   data = read_overview('ifgramStack.h5', 4, datasetName='unwrapPhase')
+    """
+    if not box:
+        atr = read_attribute(fname)
+        box = (0, 0, int(atr['WIDTH']), int(atr['LENGTH']))
+    return read_hdf5_file(fname, datasetName=datasetName, box=box, overview=overview)
+
+
+def read_overview_stats(fname, datasetName):
+    """Read the statistics of the full resolution data saved along with the overviews
+    Parameters: fname : str, path of HDF5 file
+                datasetName : str or list of str, dataset name (family) for all its slices,
+                    e.g. unwrapPhase, timeseries, or slice names, same as read(),
+                    e.g. unwrapPhase-20200101_20200113, timeseries-20200101, 20200101
+    Returns:    stats : 2D np.ndarray in size of (num_slice, 4) for min, max,
+                    2nd and 98th percentiles of the non-zero values of each slice;
+                    None if not available.
+    Examples:   stats = read_overview_stats('ifgramStack.h5', 'unwrapPhase')
+                stats = read_overview_stats('timeseries.h5', ['20200101', '20200113'])
+    """
+    fext = os.path.splitext(fname)[1].lower()
+    if fext not in ['.h5', '.he5', '.zarr']:
+        return None
+
+    # slices of interest
+    names = [datasetName] if isinstance(datasetName, str) else list(datasetName)
+    slice_list = get_slice_list(fname)
+    if len(names) == 1 and names[0] in [i.split('-')[0] for i in slice_list]:
+        dsName = names[0]
+        slices = [i for i in slice_list if i.split('-')[0] == dsName]
+    else:
+        slices = []
+        for name in names:
+            matches = [i for i in slice_list if i == name or i.endswith('-'+name)]
+            if len(matches) != 1:
+                return None
+            slices.append(matches[0])
+        dsName = slices[0].split('-')[0]
+        if any(i.split('-')[0] != dsName for i in slices):
+            return None
+
+    dsNames = [i for i in get_dataset_list(fname) if i == dsName or i.endswith('/'+dsName)]
+    if not dsNames:
+        return None
+
+    with open_store(fname, 'r') as f:
+        stats_name = 'overview/stats/{}'.format(dsNames[0])
+        if stats_name not in f:
+            return None
+        stats = f[stats_name][:]
+
+    # rows of the slices of interest, in the order of all slices of the dataset
+    ds_slices = [i for i in slice_list if i.split('-')[0] == dsName]
+    if stats.shape[0] != len(ds_slices):
+        return None
+    return stats[[ds_slices.index(i) for i in slices]]
+
+
 #########################################################################
 def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None):
     """Read attributes of input file into a dictionary
@@ -572,16 +750,24 @@ def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None)
     """
     fbase, fext = os.path.splitext(os.path.basename(fname))
     fext = fext.lower()
-    if not os.path.isfile(fname):
+    if not os.path.isfile(fname) and not (fext == '.zarr' and os.path.isdir(fname)):
         msg = 'input file not existed: {}\n'.format(fname)
         msg += 'current directory: '+os.getcwd()
         raise Exception(msg)
 
+    # HDF5 files: check metadata cache first
+    use_cache = fext in ['.h5', '.he5', '.zarr'] and metafile_ext is None
+    if use_cache:
+        cache_key = ('attribute', datasetName, standardize)
+        atr = get_cached_metadata(fname, cache_key)
+        if atr is not None:
+            return dict(atr)
+
     # HDF5 files
-    if fext in ['.h5', '.he5']:
-        f = h5py.File(fname, 'r')
-        g1_list = [i for i in f.keys() if isinstance(f[i], h5py.Group)]
-        d1_list = [i for i in f.keys() if isinstance(f[i], h5py.Dataset) and f[i].ndim >= 2]
+    if fext in ['.h5', '.he5', '.zarr']:
+        f = open_store(fname, 'r')
+        g1_list = [i for i in f.keys() if isinstance(f[i], GROUP_CLASSES)]
+        d1_list = [i for i in f.keys() if isinstance(f[i], DATASET_CLASSES) and f[i].ndim >= 2]
 
         # FILE_TYPE - k
         py2_mintpy_stack_files = ['interferograms', 'coherence', 'wrapped'] #obsolete mintpy format
@@ -650,7 +836,8 @@ def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None)
             global ds_list
             def get_hdf5_dataset(name, obj):
                 global ds_list
-                if isinstance(obj, h5py.Dataset) and obj.ndim >= 2:
+                if (isinstance(obj, DATASET_CLASSES) and obj.ndim >= 2
+                        and not name.startswith(('overview/', PIXEL_MAJOR_GROUP+'/', STATS_CACHE_GROUP+'/'))):
                     ds_list.append(obj)
             ds_list = []
             f.visititems(get_hdf5_dataset)
@@ -755,6 +942,9 @@ def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None)
 
     if standardize:
         atr = standardize_metadata(atr)
+
+    if use_cache:
+        set_cached_metadata(fname, cache_key, dict(atr))
     return atr
 
 
@@ -1042,7 +1232,7 @@ def attribute_gamma2roipac(par_dict_in):
 #########################################################################
 def read_binary(fname, shape, box=None, data_type='float32', byte_order='l',
                 num_band=1, band_interleave='BIL', band=1, cpx_band='phase'):
-    """Read binary file using np.fromfile
+    """Read binary file using np.memmap, only the bytes within box are read from disk
     Parameters: fname : str, path/name of data file to read
                 shape : tuple of 2 int in (length, width)
                 box   : tuple of 4 int in (x0, y0, x1, y1)
@@ -1086,34 +1276,38 @@ def read_binary(fname, shape, box=None, data_type='float32', byte_order='l',
         data_type = '>{}{}'.format(letter, digit)
 
     # read data
-    #data = np.fromfile(fname,
-    #                   dtype=data_type,
-    #                   count=box[3]*width).reshape(-1, width)
-    #data = data[box[1]:box[3],
-    #            box[0]:box[2]]
+    # memory-map the file and copy out the rows/columns within box only,
+    # so that reading a small area does not load the whole file into memory
     band_interleave = band_interleave.upper()
+    itemsize = np.dtype(data_type).itemsize
+    num_row = box[3] - box[1]
     if band_interleave == 'BIL':
-        data = np.fromfile(fname,
-                           dtype=data_type,
-                           count=box[3]*width*num_band).reshape(-1, width*num_band)
-        data = data[box[1]:box[3],
-                    width*(band-1)+box[0]:width*(band-1)+box[2]]
+        data = np.memmap(fname,
+                         dtype=data_type,
+                         mode='r',
+                         offset=box[1]*width*num_band*itemsize,
+                         shape=(num_row, width*num_band))
+        data = data[:, width*(band-1)+box[0]:width*(band-1)+box[2]]
 
     elif band_interleave == 'BIP':
-        data = np.fromfile(fname,
-                           dtype=data_type,
-                           count=box[3]*width*num_band).reshape(-1, width*num_band)
-        data = data[box[1]:box[3],
-                    np.arange(box[0], box[2])*num_band+band-1]
+        data = np.memmap(fname,
+                         dtype=data_type,
+                         mode='r',
+                         offset=box[1]*width*num_band*itemsize,
+                         shape=(num_row, width, num_band))
+        data = data[:, box[0]:box[2], band-1]
 
     elif band_interleave == 'BSQ':
-        data = np.fromfile(fname,
-                           dtype=data_type,
-                           count=(box[3]+length*(band-1))*width).reshape(-1, width)
-        data = data[length*(band-1)+box[1]:length*(band-1)+box[3],
-                    box[0]:box[2]]
+        data = np.memmap(fname,
+                         dtype=data_type,
+                         mode='r',
+                         offset=(length*(band-1)+box[1])*width*itemsize,
+                         shape=(num_row, width))
+        data = data[:, box[0]:box[2]]
     else:
         raise ValueError('unrecognized band interleaving:', band_interleave)
+    # copy into memory and release the file handle
+    data = np.array(data)
 
     # adjust output band for complex data
     if data_type.replace('>', '').startswith('c'):
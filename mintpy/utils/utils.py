@@ -12,7 +12,6 @@ import glob
 import shutil
 import errno
 import numpy as np
-from scipy.ndimage import map_coordinates
 
 from mintpy.objects import (
     geometryDatasetNames,
@@ -245,8 +244,10 @@ def transect_yx(z, atr, start_yx, end_yx, interpolation='nearest'):
     if interpolation.lower() == 'nearest':
         z_line = z[np.rint(ys).astype(np.int), np.rint(xs).astype(np.int)]
     elif interpolation.lower() == 'cubic':
+        from scipy.ndimage import map_coordinates
         z_line = map_coordinates(z, np.vstack((ys, xs)), order=3)
     elif interpolation.lower() == 'bilinear':
+        from scipy.ndimage import map_coordinates
         z_line = map_coordinates(z, np.vstack((ys, xs)), order=2)
     else:
         print('Un-recognized interpolation method: '+interpolation)
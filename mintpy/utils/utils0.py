@@ -10,9 +10,6 @@
 
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-import multiprocessing
-from scipy import ndimage
 
 
 #################################### InSAR ##########################################
@@ -442,6 +439,7 @@ def get_largest_conn_component(mask_in, min_num_pixel=1e4, display=False):
                 display : bool, display the result or not.
     Returns:    mask_out : 2D np.array in np.bool_ format
     """
+    from scipy import ndimage
     mask_out = np.zeros(mask_in.shape, np.bool_)
     labels, n_features = ndimage.label(mask_in)
     num_pixel = np.max(np.bincount(labels.flatten())[1:])
@@ -451,6 +449,7 @@ def get_largest_conn_component(mask_in, min_num_pixel=1e4, display=False):
     max_label = np.argmax(np.bincount(labels.flatten())[1:]) + 1
     mask_out = labels == max_label
     if display:
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots(nrows=1, ncols=3, figsize=[15, 5])
         ax[0].imshow(mask_in)
         ax[1].imshow(mask_out)
@@ -481,6 +480,7 @@ def min_region_distance(mask1, mask2, display=False):
     min_dist = dist[idx_min]
 
     if display:
+        import matplotlib.pyplot as plt
         plt.figure()
         plt.imshow(mask1 * 1 + mask2 * 2)
         plt.plot([xy1[0], xy2[0]], [xy1[1], xy2[1]], '-o')
@@ -578,6 +578,7 @@ def check_parallel(file_num=1, print_msg=True, maxParallelNum=8):
         return 1, enable_parallel, None, None
 
     # Find proper number of cores for parallel processing
+    import multiprocessing
     num_cores = min(multiprocessing.cpu_count(), file_num, maxParallelNum)
     if num_cores <= 1:
         enable_parallel = False
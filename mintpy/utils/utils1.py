@@ -13,8 +13,18 @@ import time
 import glob
 import h5py
 import numpy as np
-from mintpy.objects import deramp, ifgramStack, timeseries, geometryDatasetNames
-from mintpy.utils import ptime, readfile, writefile
+from functools import partial
+from mintpy.objects import (
+    deramp,
+    get_design_matrix4ramp,
+    get_normal_equation4ramp,
+    estimate_ramp_coeff,
+    get_ramp,
+    ifgramStack,
+    timeseries,
+    geometryDatasetNames,
+)
+from mintpy.utils import blockwise, ptime, readfile, writefile
 from mintpy.utils.utils0 import *
 
 
@@ -34,12 +44,97 @@ def get_center_lat_lon(geom_file, box=None):
 
 
 #################################### Data Operation ###################################
-def get_residual_std(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_type='quadratic'):
+def get_residual_stats(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_type='quadratic', max_memory=2):
+    """Calculate deramped Root Mean Square and standard deviation in space for each epoch of input
+    timeseries file, in one pass of the file block by block, without writing the deramped file.
+
+    The ramp is estimated as in run_deramp(), from the normal equation accumulated block by block.
+    The statistics of the residual r = d - G*x are derived from the sums accumulated in the same pass:
+        sum(r)   = sum(d) - sum(G)*x
+        sum(r^2) = sum(d^2) - 2 x^T G^T d + x^T G^T G x
+    with G^T G and G^T d of the valid pixels of each epoch within the mask.
+
+    Parameters: timeseries_resid_file : str, timeseries HDF5 file, e.g. timeseriesResidual.h5
+                mask_file  : str, mask file, e.g. maskTempCoh.h5
+                ramp_type  : str, ramp type, e.g. linear, quadratic, no for do not remove ramp
+                max_memory : float, maximum memory in GB for each block
+    Returns:    rms_list   : 1D np.ndarray of float, Root Mean Square of each epoch
+                std_list   : 1D np.ndarray of float, standard deviation of each epoch
+                date_list  : list of string in YYYYMMDD format, corresponding dates
+    Example:    rms_list, std_list, date_list = ut.get_residual_stats('timeseriesResidual.h5', 'maskTempCoh.h5')
+    """
+    obj = timeseries(timeseries_resid_file)
+    obj.open(print_msg=False)
+    length, width = obj.length, obj.width
+    shape = (obj.numDate, length, width)
+
+    if mask_file and os.path.isfile(mask_file):
+        print('read mask from file: '+mask_file)
+        mask = readfile.read(mask_file, datasetName='mask')[0] != 0
+    else:
+        mask = np.ones((length, width), dtype=np.bool_)
+
+    # accumulate the normal equations of ramp estimation (common mask, as in run_deramp)
+    # and of the residual statistics (valid pixels of each epoch)
+    num_pix, sum_d, sum_d2 = 0, 0., 0.
+    GtG, Gtd, flag = 0., 0., True
+    sGtG, sGtd = 0., 0.
+    block_list = blockwise.get_block_list(shape, split_z=False, max_memory=max_memory)
+    prog_bar = ptime.progressBar(maxValue=len(block_list))
+    for i, (z0, z1, y0, y1) in enumerate(block_list):
+        data = blockwise.read_block(timeseries_resid_file, 'timeseries', [z0, z1, y0, y1, 0, width])
+        data = data.reshape(obj.numDate, -1)
+        maski = mask[y0:y1, :].flatten()
+
+        dm = np.array(data[:, maski], dtype=np.float64)
+        num_pix += np.sum(~np.isnan(dm), axis=1)
+        sum_d += np.nansum(dm, axis=1)
+        sum_d2 += np.nansum(np.square(dm), axis=1)
+
+        if ramp_type != 'no':
+            G = get_design_matrix4ramp(ramp_type, (length, width), box=(0, y0, width, y1))
+            GtGi, Gtdi, flagi = get_normal_equation4ramp(data, maski, G, common_mask=True)
+            GtG += GtGi
+            Gtd += Gtdi
+            flag *= flagi
+
+            GtGi, Gtdi = get_normal_equation4ramp(data, maski, G, common_mask=False)[:2]
+            sGtG += GtGi
+            sGtd += Gtdi
+        prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
+    prog_bar.close()
+
+    # residual statistics
+    sum_r, sum_r2 = sum_d, sum_d2
+    if ramp_type != 'no':
+        X = estimate_ramp_coeff(GtG, Gtd, flag)
+
+        # reference in space: the last column of the design matrix is the constant term
+        if 'REF_Y' in obj.metadata.keys():
+            ref_y, ref_x = int(obj.metadata['REF_Y']), int(obj.metadata['REF_X'])
+            ref_G = get_design_matrix4ramp(ramp_type, (length, width), box=(ref_x, ref_y, ref_x+1, ref_y+1))
+            X[:, -1] -= np.dot(ref_G, X.T).flatten()
+
+        # pixels with zero value are not derampped and sum(G) is the last row of G^T G
+        sum_r = sum_d - np.einsum('nj,nj->n', sGtG[:, -1, :], X)
+        sum_r2 = (sum_d2 - 2 * np.einsum('nj,nj->n', X, sGtd)
+                  + np.einsum('ni,nij,nj->n', X, sGtG, X))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rms_list = np.sqrt(np.maximum(sum_r2 / num_pix, 0.))
+        std_list = np.sqrt(np.maximum(sum_r2 / num_pix - np.square(sum_r / num_pix), 0.))
+    return rms_list, std_list, obj.dateList
+
+
+def get_residual_std(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_type='quadratic',
+                     save_deramp=False, max_memory=2):
     """Calculate deramped standard deviation in space for each epoch of input timeseries file.
     Parameters: timeseries_resid_file - string, timeseries HDF5 file,
                     e.g. timeseries_ECMWF_demErrInvResid.h5
                 mask_file - string, mask file, e.g. maskTempCoh.h5
                 ramp_type - string, ramp type, e.g. linear, quadratic, no for do not remove ramp
+                save_deramp - bool, write the deramped timeseries file as well
+                max_memory - float, maximum memory in GB for each block
     Returns:    std_list  - list of float, standard deviation of deramped input timeseries file
                 date_list - list of string in YYYYMMDD format, corresponding dates
     Example:    import mintpy.utils.utils as ut
@@ -55,30 +150,46 @@ def get_residual_std(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_typ
     std_file = os.path.splitext(deramped_file)[0]+'_std.txt'
 
     # Get residual std text file
-    if run_or_skip(out_file=std_file, in_file=[deramped_file, mask_file], check_readable=False) == 'run':
-        if run_or_skip(out_file=deramped_file, in_file=timeseries_resid_file) == 'run':
-            if not os.path.isfile(timeseries_resid_file):
-                msg = 'Can not find input timeseries residual file: '+timeseries_resid_file
-                msg += '\nRe-run dem_error.py to generate it.'
-                raise Exception(msg)
-            else:
-                print('removing a {} ramp from file: {}'.format(ramp_type, timeseries_resid_file))
-                deramped_file = run_deramp(timeseries_resid_file,
-                                           ramp_type=ramp_type,
-                                           mask_file=mask_file,
-                                           out_file=deramped_file)
-        print('calculating residual standard deviation for each epoch from file: '+deramped_file)
-        std_file = timeseries(deramped_file).timeseries_std(maskFile=mask_file, outFile=std_file)
+    if run_or_skip(out_file=std_file, in_file=[timeseries_resid_file, mask_file], check_readable=False) == 'run':
+        if not os.path.isfile(timeseries_resid_file):
+            msg = 'Can not find input timeseries residual file: '+timeseries_resid_file
+            msg += '\nRe-run dem_error.py to generate it.'
+            raise Exception(msg)
+
+        if save_deramp and ramp_type != 'no':
+            print('removing a {} ramp from file: {}'.format(ramp_type, timeseries_resid_file))
+            run_deramp(timeseries_resid_file,
+                       ramp_type=ramp_type,
+                       mask_file=mask_file,
+                       out_file=deramped_file,
+                       max_memory=max_memory)
+
+        print('calculating residual standard deviation for each epoch from file: '+timeseries_resid_file)
+        std_list, date_list = get_residual_stats(timeseries_resid_file,
+                                                 mask_file=mask_file,
+                                                 ramp_type=ramp_type,
+                                                 max_memory=max_memory)[1:]
+
+        # Write text file
+        header = 'Standard Deviation in space for each acquisition of time-series\n'
+        header += 'Timeseries file: {}\n'.format(timeseries_resid_file)
+        header += 'Ramp type: {}\n'.format(ramp_type)
+        header += 'Mask file: {}\n'.format(mask_file)
+        header += 'Date\t\tSTD (m)'
+        np.savetxt(std_file, np.hstack((np.array(date_list).reshape(-1, 1), std_list.reshape(-1, 1))),
+                   fmt='%s', delimiter='\t', header=header)
+        print('save timeseries STD to text file: {}'.format(std_file))
 
     # Read residual std text file
-    print('read timeseries RMS from file: '+std_file)
+    print('read timeseries STD from file: '+std_file)
     fc = np.loadtxt(std_file, dtype=bytes).astype(str)
     std_list = fc[:, 1].astype(np.float).tolist()
     date_list = list(fc[:, 0])
     return std_list, date_list
 
 
-def get_residual_rms(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_type='quadratic'):
+def get_residual_rms(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_type='quadratic',
+                     save_deramp=False, max_memory=2):
     """Calculate deramped Root Mean Square in space for each epoch of input timeseries file.
     Parameters: timeseries_resid_file : string, 
                     timeseries HDF5 file, e.g. timeseries_ECMWF_demErrInvResid.h5
@@ -86,6 +197,10 @@ def get_residual_rms(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_typ
                     mask file, e.g. maskTempCoh.h5
                 ramp_type : string, 
                     ramp type, e.g. linear, quadratic, no for do not remove ramp
+                save_deramp : bool,
+                    write the deramped timeseries file as well
+                max_memory : float,
+                    maximum memory in GB for each block
     Returns:    rms_list : list of float,
                     Root Mean Square of deramped input timeseries file
                 date_list : list of string in YYYYMMDD format,
@@ -105,20 +220,35 @@ def get_residual_rms(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_typ
                             'rms_{}.txt'.format(os.path.splitext(deramped_file)[0]))
 
     # Get residual RMS text file
-    if run_or_skip(out_file=rms_file, in_file=[deramped_file, mask_file], check_readable=False) == 'run':
-        if run_or_skip(out_file=deramped_file, in_file=timeseries_resid_file) == 'run':
-            if not os.path.isfile(timeseries_resid_file):
-                msg = 'Can not find input timeseries residual file: '+timeseries_resid_file
-                msg += '\nRe-run dem_error.py to generate it.'
-                raise Exception(msg)
-            else:
-                print('removing a {} ramp from file: {}'.format(ramp_type, timeseries_resid_file))
-                deramped_file = run_deramp(timeseries_resid_file,
-                                           ramp_type=ramp_type,
-                                           mask_file=mask_file,
-                                           out_file=deramped_file)
-        print('Calculating residual RMS for each epoch from file: '+deramped_file)
-        rms_file = timeseries(deramped_file).timeseries_rms(maskFile=mask_file, outFile=rms_file)
+    if run_or_skip(out_file=rms_file, in_file=[timeseries_resid_file, mask_file], check_readable=False) == 'run':
+        if not os.path.isfile(timeseries_resid_file):
+            msg = 'Can not find input timeseries residual file: '+timeseries_resid_file
+            msg += '\nRe-run dem_error.py to generate it.'
+            raise Exception(msg)
+
+        if save_deramp and ramp_type != 'no':
+            print('removing a {} ramp from file: {}'.format(ramp_type, timeseries_resid_file))
+            run_deramp(timeseries_resid_file,
+                       ramp_type=ramp_type,
+                       mask_file=mask_file,
+                       out_file=deramped_file,
+                       max_memory=max_memory)
+
+        print('calculating residual RMS for each epoch from file: '+timeseries_resid_file)
+        rms_list, date_list = get_residual_stats(timeseries_resid_file,
+                                                 mask_file=mask_file,
+                                                 ramp_type=ramp_type,
+                                                 max_memory=max_memory)[0::2]
+
+        # Write text file
+        header = 'Root Mean Square in space for each acquisition of time-series\n'
+        header += 'Timeseries file: {}\n'.format(timeseries_resid_file)
+        header += 'Ramp type: {}\n'.format(ramp_type)
+        header += 'Mask file: {}\n'.format(mask_file)
+        header += 'Date\t\tRMS (m)'
+        np.savetxt(rms_file, np.hstack((np.array(date_list).reshape(-1, 1), rms_list.reshape(-1, 1))),
+                   fmt='%s', delimiter='\t', header=header)
+        print('save timeseries RMS to text file: {}'.format(rms_file))
 
     # Read residual RMS text file
     print('read timeseries residual RMS from file: '+rms_file)
@@ -516,6 +646,7 @@ def add_attribute(File, atr_new=dict(), print_msg=False):
             if print_msg:
                 print('{} = {}'.format(key, str(value)))
     f.close()
+    readfile.clear_metadata_cache(File)
     return File
 
 
@@ -659,14 +790,85 @@ def check_template_auto_value(templateDict, auto_file='../defaults/smallbaseline
     return templateDict
 
 
-def run_deramp(fname, ramp_type, mask_file=None, out_file=None, datasetName=None):
+def estimate_ramp_file(fname, datasetName, mask, ramp_type='linear', common_mask=False, max_memory=2):
+    """Estimate the ramp coefficients of each 2D matrix of a 2D/3D dataset, by accumulating the
+    normal equation block by block in rows, in constant memory.
+    Parameters: fname       : str, data file
+                datasetName : str, dataset name
+                mask        : 2D np.ndarray, mask of pixels used for ramp estimation
+                ramp_type   : str, name of ramp to be estimated
+                common_mask : bool, ignore pixels with NaN or zero value in the temporal mean for all slices,
+                              as in deramp() for 3D matrix, or in each slice separately
+                max_memory  : float, maximum memory in GB for each block
+    Returns:    X           : 2D np.ndarray in size of (num_slice, num_param), ramp coefficients
+    """
+    atr = readfile.read_attribute(fname)
+    shape = blockwise.get_dataset_shape(fname, datasetName, atr)
+    length, width = shape[-2:]
+    mask = mask != 0
+
+    # accumulate the normal equation, with all slices of each block for the common mask
+    block_list = blockwise.get_block_list(shape, split_z=False, max_memory=max_memory)
+    GtG, Gtd, flag = 0., 0., True
+    prog_bar = ptime.progressBar(maxValue=len(block_list))
+    for i, (z0, z1, y0, y1) in enumerate(block_list):
+        block = [y0, y1, 0, width]
+        if len(shape) == 3:
+            block = [z0, z1] + block
+        data = blockwise.read_block(fname, datasetName, block)
+        data = data.reshape(-1, (y1 - y0) * width)
+
+        G = get_design_matrix4ramp(ramp_type, (length, width), box=(0, y0, width, y1))
+        GtGi, Gtdi, flagi = get_normal_equation4ramp(data, mask[y0:y1, :].flatten(), G,
+                                                     common_mask=common_mask)
+        GtG += GtGi
+        Gtd += Gtdi
+        flag *= flagi
+        prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
+    prog_bar.close()
+
+    # solve the normal equation, with the gram matrix of the mask factorized once
+    X = estimate_ramp_coeff(GtG, Gtd, flag)
+    return X
+
+
+def deramp_block(data_list, block, coeff, ramp_type, shape, ref_yx=None):
+    """Remove the ramp from a block of 2D/3D matrix, for blockwise.process_file().
+    Parameters: data_list : list of one 2D/3D np.ndarray
+                block     : list of 4/6 int, [(z0, z1,) y0, y1, x0, x1] of the block
+                coeff     : 2D np.ndarray in size of (num_slice, num_param), ramp coefficients
+                ramp_type : str, name of ramp
+                shape     : tuple of 2 int, (length, width) of the whole image
+                ref_yx    : tuple of 2 int, reference pixel
+    Returns:    data      : 2D/3D np.ndarray, data after deramping
+    """
+    data = data_list[0]
+    y0, y1, x0, x1 = block[-4:]
+    X = coeff[block[0]:block[1], :] if data.ndim == 3 else coeff
+
+    G = get_design_matrix4ramp(ramp_type, shape, box=(x0, y0, x1, y1))
+    ref_G = None
+    if ref_yx:
+        ref_G = get_design_matrix4ramp(ramp_type, shape, box=(ref_yx[1], ref_yx[0], ref_yx[1]+1, ref_yx[0]+1))
+
+    dshape = data.shape
+    data = data.reshape(-1, (y1 - y0) * (x1 - x0))
+    data = data - get_ramp(X, G, data, ref_G=ref_G)
+    return data.reshape(dshape)
+
+
+def run_deramp(fname, ramp_type, mask_file=None, out_file=None, datasetName=None, max_memory=2, num_worker=1):
     """ Remove ramp from each 2D matrix of input file
-    Parameters: fname     : str, data file to be derampped
-                ramp_type : str, name of ramp to be estimated.
-                mask_file : str, file of mask of pixels used for ramp estimation
-                out_file  : str, output file name
-                datasetName : str, output dataset name, for ifgramStack file type only
-    Returns:    out_file  : str, output file name
+    The ramp is estimated from the normal equation accumulated block by block, then removed in a
+    second pass block by block, to handle file of any size in constant memory.
+    Parameters: fname      : str, data file to be derampped
+                ramp_type  : str, name of ramp to be estimated.
+                mask_file  : str, file of mask of pixels used for ramp estimation
+                out_file   : str, output file name
+                datasetName: str, output dataset name, for ifgramStack file type only
+                max_memory : float, maximum memory in GB for each block
+                num_worker : int, number of parallel processes in ramp removal, for timeseries only
+    Returns:    out_file   : str, output file name
     """
     print('remove {} ramp from file: {}'.format(ramp_type, fname))
     if not out_file:
@@ -675,46 +877,64 @@ def run_deramp(fname, ramp_type, mask_file=None, out_file=None, datasetName=None
 
     start_time = time.time()
     atr = readfile.read_attribute(fname)
+    length, width = int(atr['LENGTH']), int(atr['WIDTH'])
+    ref_yx = (int(atr['REF_Y']), int(atr['REF_X'])) if 'REF_Y' in atr.keys() else None
 
     # mask
-    if os.path.isfile(mask_file):
+    if mask_file and os.path.isfile(mask_file):
         mask = readfile.read(mask_file, datasetName='mask')[0]
         print('read mask file: '+mask_file)
     else:
-        mask = np.ones((int(atr['LENGTH']), int(atr['WIDTH'])))
+        mask = np.ones((length, width))
         print('use mask of the whole area')
 
     # deramping
     k = atr['FILE_TYPE']
     if k == 'timeseries':
-        print('reading data ...')
-        data = readfile.read(fname)[0]
         print('estimating phase ramp ...')
-        data = deramp(data, mask, ramp_type=ramp_type, metadata=atr)[0]
-        writefile.write(data, out_file, ref_file=fname)
+        X = estimate_ramp_file(fname, 'timeseries', mask, ramp_type,
+                               common_mask=True,
+                               max_memory=max_memory)
+        print('removing phase ramp ...')
+        blockwise.process_file(fname, out_file,
+                               partial(deramp_block, coeff=X, ramp_type=ramp_type,
+                                       shape=(length, width), ref_yx=ref_yx),
+                               datasetNames=['timeseries'],
+                               ref_file=fname,
+                               max_memory=max_memory,
+                               num_worker=num_worker)
 
     elif k == 'ifgramStack':
         obj = ifgramStack(fname)
         obj.open(print_msg=False)
         if not datasetName:
             datasetName = 'unwrapPhase'
+
+        print('estimating phase ramp ...')
+        X = estimate_ramp_file(fname, datasetName, mask, ramp_type,
+                               common_mask=False,
+                               max_memory=max_memory)
+
+        print('removing phase ramp ...')
         with h5py.File(fname, 'a') as f:
             ds = f[datasetName]
             dsNameOut = '{}_ramp'.format(datasetName)
             if dsNameOut in f.keys():
                 dsOut = f[dsNameOut]
                 print('access HDF5 dataset /{}'.format(dsNameOut))
+                writefile.remove_derived_datasets(f, dsNameOut)
             else:
                 dsOut = f.create_dataset(dsNameOut, shape=(obj.numIfgram, obj.length, obj.width),
                                          dtype=np.float32, chunks=True, compression=None)
                 print('create HDF5 dataset /{}'.format(dsNameOut))
 
-            prog_bar = ptime.progressBar(maxValue=obj.numIfgram)
-            for i in range(obj.numIfgram):
-                data = ds[i, :, :]
-                data = deramp(data, mask, ramp_type=ramp_type, metadata=atr)[0]
-                dsOut[i, :, :] = data
-                prog_bar.update(i+1, suffix='{}/{}'.format(i+1, obj.numIfgram))
+            block_list = blockwise.get_block_list(ds.shape, max_memory=max_memory)
+            prog_bar = ptime.progressBar(maxValue=len(block_list))
+            for i, (z0, z1, y0, y1) in enumerate(block_list):
+                block = [z0, z1, y0, y1, 0, width]
+                data = ds[z0:z1, y0:y1, :]
+                dsOut[z0:z1, y0:y1, :] = deramp_block([data], block, X, ramp_type, (length, width), ref_yx)
+                prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(block_list)))
             prog_bar.close()
             print('finished writing to file: {}'.format(fname))
 
@@ -10,8 +10,8 @@
 import os
 import h5py
 import numpy as np
-from mintpy.objects import timeseries
-from mintpy.utils import readfile
+from mintpy.objects import timeseries, open_store, is_zarr_file, DATASET_CLASSES
+from mintpy.utils import ptime, readfile
 
 
 def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None):
@@ -46,7 +46,7 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
 
     ext = os.path.splitext(out_file)[1].lower()
     # HDF5 File
-    if ext in ['.h5', '.he5']:
+    if ext in ['.h5', '.he5', '.zarr']:
         if compression is None and ref_file:
             compression = readfile.get_hdf5_compression(ref_file)
 
@@ -66,7 +66,7 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
                 os.remove(out_file)
 
             print('create HDF5 file: {} with w mode'.format(out_file))
-            with h5py.File(out_file, 'w') as f:
+            with open_store(out_file, 'w') as f:
                 # 1. Write input datasets
                 maxDigit = max([len(i) for i in list(datasetDict.keys())])
                 for dsName in datasetDict.keys():
@@ -83,13 +83,13 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
                                           compression=compression)
 
                 # 2. Write extra/auxliary datasets from ref_file
-                if ref_file and os.path.splitext(ref_file)[1] in ['.h5', '.he5']:
+                if ref_file and os.path.splitext(ref_file)[1] in ['.h5', '.he5', '.zarr']:
                     atr_ref = readfile.read_attribute(ref_file)
                     shape_ref = (int(atr_ref['LENGTH']), int(atr_ref['WIDTH']))
-                    with h5py.File(ref_file, 'r') as fr:
+                    with open_store(ref_file, 'r') as fr:
                         dsNames = [i for i in fr.keys()
                                    if (i not in list(datasetDict.keys())
-                                       and isinstance(fr[i], h5py.Dataset) 
+                                       and isinstance(fr[i], DATASET_CLASSES) 
                                        and fr[i].shape[-2:] != shape_ref)]
                         maxDigit = max([len(i) for i in dsNames]+[maxDigit])
                         for dsName in dsNames:
@@ -110,6 +110,8 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
                     f.attrs[key] = str(value)
                 print('finished writing to {}'.format(out_file))
 
+        readfile.clear_metadata_cache(out_file)
+
     # ISCE / ROI_PAC GAMMA / Image product
     else:
         key_list = list(datasetDict.keys())
@@ -162,6 +164,79 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
     return out_file
 
 
+def layout_hdf5(fname, ds_name_dict=None, metadata=None, ref_file=None, compression=None, print_msg=True):
+    """Create HDF5 file with metadata and empty 2D/3D datasets, to be filled block by block.
+    Parameters: fname : str, output file name
+                ds_name_dict : dict of [dtype, shape] for each dataset to create, e.g.:
+                    {'timeseries' : [np.float32, (80, 200, 300)],
+                     'height'     : [np.float32, (200, 300)]}
+                metadata : dict of attributes, default is the metadata of ref_file
+                ref_file : str, reference HDF5 file to copy the auxliary datasets,
+                    i.e. datasets not in size of (LENGTH, WIDTH) such as date / bperp / dropIfgram
+                compression : str, compression of the 2D/3D datasets, None, "lzf", "gzip"
+    Returns:    fname : str
+    Example:    layout_hdf5('timeseries_msk.h5', {'timeseries': [np.float32, (80, 200, 300)]},
+                            ref_file='timeseries.h5')
+    """
+    ds_name_dict = ds_name_dict if ds_name_dict else dict()
+    if metadata:
+        meta = {key: value for key, value in metadata.items()}
+    elif ref_file:
+        meta = readfile.read_attribute(ref_file)
+    else:
+        raise ValueError('No metadata or reference file input.')
+
+    if os.path.isfile(fname):
+        if print_msg:
+            print('delete exsited file: {}'.format(fname))
+        os.remove(fname)
+
+    if print_msg:
+        print('create HDF5 file: {} with w mode'.format(fname))
+    with open_store(fname, 'w') as f:
+        # 1. empty 2D/3D datasets
+        maxDigit = max([len(i) for i in ds_name_dict.keys()] + [0])
+        for dsName, (dtype, shape) in ds_name_dict.items():
+            if print_msg:
+                print(('create dataset /{d:<{w}} of {t:<10} in size of {s:<20} '
+                       'with compression={c}').format(d=dsName,
+                                                      w=maxDigit,
+                                                      t=np.dtype(dtype).name,
+                                                      s=str(tuple(shape)),
+                                                      c=compression))
+            f.create_dataset(dsName,
+                             shape=shape,
+                             dtype=dtype,
+                             chunks=True,
+                             compression=compression)
+
+        # 2. extra/auxliary datasets from ref_file
+        if ref_file and os.path.splitext(ref_file)[1] in ['.h5', '.he5', '.zarr']:
+            atr_ref = readfile.read_attribute(ref_file)
+            shape_ref = (int(atr_ref['LENGTH']), int(atr_ref['WIDTH']))
+            with open_store(ref_file, 'r') as fr:
+                dsNames = [i for i in fr.keys()
+                           if (i not in ds_name_dict.keys()
+                               and isinstance(fr[i], DATASET_CLASSES)
+                               and fr[i].shape[-2:] != shape_ref)]
+                for dsName in dsNames:
+                    ds = fr[dsName]
+                    if print_msg:
+                        print('create dataset /{:<{w}} of {:<10} in size of {}'.format(
+                            dsName, str(ds.dtype), str(ds.shape), w=maxDigit))
+                    f.create_dataset(dsName,
+                                     data=ds[:],
+                                     chunks=True,
+                                     compression=compression)
+
+        # 3. metadata
+        for key, value in meta.items():
+            f.attrs[key] = str(value)
+
+    readfile.clear_metadata_cache(fname)
+    return fname
+
+
 def remove_hdf5_dataset(fname, datasetNames, print_msg=True):
     """Remove an existing dataset from an HDF5 file.
     Parameters: fname : str, HDF5 file name/path
@@ -175,6 +250,18 @@ def remove_hdf5_dataset(fname, datasetNames, print_msg=True):
         datasetNames = list(datasetNames)
     if print_msg:
         print('delete {} from file {}'.format(datasetNames, fname))
+
+    # Zarr store: remove the dataset directories in place, no need to re-write the file
+    if is_zarr_file(fname):
+        with open_store(fname, 'a') as f:
+            rm_list = []
+            f.visititems(lambda name, obj: rm_list.append(name) if (
+                isinstance(obj, DATASET_CLASSES) and name.split('/')[-1] in datasetNames) else None)
+            for name in rm_list:
+                del f[name]
+        readfile.clear_metadata_cache(fname)
+        return fname
+
     # 1. rename the file to a temporary file
     temp_file = os.path.join(os.path.dirname(fname), 'tmp_{}'.format(os.path.basename(fname)))
     cmd = 'mv {} {}'.format(fname, temp_file)
@@ -193,6 +280,15 @@ def remove_hdf5_dataset(fname, datasetNames, print_msg=True):
     maxDigit = max([len(i) for i in list(fi.keys())])
     for dsName in [i for i in fi.keys() if i not in datasetNames]:
         ds = fi[dsName]
+        # groups, e.g. overview, are copied as they are except for the removed datasets
+        if isinstance(ds, h5py.Group):
+            fi.copy(ds, fo, name=dsName)
+            rm_list = []
+            fo[dsName].visititems(lambda name, obj: rm_list.append(name) if (
+                isinstance(obj, h5py.Dataset) and name.split('/')[-1] in datasetNames) else None)
+            for name in rm_list:
+                del fo[dsName][name]
+            continue
         if print_msg:
             print('create dataset /{d:<{w}} of {t:<10} in size of {s:<20} with compression={c}'.format(
                 d=dsName, w=maxDigit, t=str(ds.dtype), s=str(ds.shape), c=compression))
@@ -203,12 +299,269 @@ def remove_hdf5_dataset(fname, datasetNames, print_msg=True):
         fo.attrs[key] = str(value)
     fi.close()
     fo.close()
+    readfile.clear_metadata_cache(fname)
     if print_msg:
         print('finished writing to {}'.format(fname))
         print('old file is now saved as: {}. Use rm command to delete it.'.format(temp_file))
     return fname
 
 
+def write_overview(fname, factors=None, datasetNames=None, print_msg=True):
+    """Write multi-resolution overviews of the 2D/3D datasets into an existing HDF5 file.
+    Overviews are downsampled by averaging (as in multilook.multilook_data) and saved with
+    the statistics of the full resolution data, for a fast display via view.py / tsview.py.
+
+    File structure:
+        /overview/{factor}/{datasetName} : 2D/3D np.float32 in size of (num, length//factor, width//factor)
+        /overview/stats/{datasetName}    : 2D np.float32 in size of (num, 4) for min, max,
+                                           2nd and 98th percentiles of non-zero values of each slice
+
+    Parameters: fname   : str, path of HDF5 file
+                factors : list of int, downsampling factors,
+                          default is 2, 4, 8, ... until the overview is smaller than 64 pixels.
+                datasetNames : list of str, datasets to write overviews for, default is all 2D/3D datasets
+    Returns:    fname   : str
+    Example:    write_overview('ifgramStack.h5')
+                write_overview('timeseries.h5', factors=[4, 16])
+    """
+    from mintpy.multilook import multilook_data
+
+    atr = readfile.read_attribute(fname)
+    length, width = int(atr['LENGTH']), int(atr['WIDTH'])
+    if not factors:
+        factors = []
+        factor = 2
+        while min(length, width) // factor >= 64:
+            factors.append(factor)
+            factor *= 2
+    factors = sorted(set(int(i) for i in factors if int(i) > 1))
+    if not factors:
+        print('WARNING: file is too small to write overviews, skip.')
+        return fname
+
+    ds_list = readfile.get_dataset_list(fname)
+    if datasetNames:
+        ds_list = [i for i in ds_list if i in datasetNames or i.split('/')[-1] in datasetNames]
+
+    if print_msg:
+        print('write overviews with downsampling factors of {} into file: {}'.format(factors, fname))
+    with open_store(fname, 'a') as f:
+        # remove existing overviews
+        if 'overview' in f.keys():
+            del f['overview']
+
+        for dsName in ds_list:
+            ds = f[dsName]
+            if ds.dtype.kind == 'c':
+                if print_msg:
+                    print('skip complex dataset /{}'.format(dsName))
+                continue
+
+            num_slice = ds.shape[0] if ds.ndim == 3 else 1
+            # create datasets
+            ds_ovs = []
+            for factor in factors:
+                shape = (length // factor, width // factor)
+                if ds.ndim == 3:
+                    shape = (num_slice,) + shape
+                if print_msg:
+                    print('create dataset /overview/{}/{} in size of {}'.format(factor, dsName, shape))
+                ds_ovs.append(f.create_dataset('overview/{}/{}'.format(factor, dsName),
+                                               shape=shape,
+                                               dtype=np.float32,
+                                               chunks=True))
+            ds_stats = f.create_dataset('overview/stats/{}'.format(dsName),
+                                        shape=(num_slice, 4),
+                                        dtype=np.float32)
+            ds_stats.attrs['COLUMNS'] = 'min,max,p02,p98'
+
+            # read and downsample slice by slice
+            prog_bar = ptime.progressBar(maxValue=num_slice, print_msg=print_msg)
+            for i in range(num_slice):
+                data = ds[i, :, :] if ds.ndim == 3 else ds[:]
+                data = np.array(data, dtype=np.float32)
+
+                for factor, ds_ov in zip(factors, ds_ovs):
+                    data_ov = multilook_data(data, factor, factor)
+                    if ds.ndim == 3:
+                        ds_ov[i, :, :] = data_ov
+                    else:
+                        ds_ov[:] = data_ov
+
+                values = data[np.isfinite(data) * (data != 0.)]
+                if values.size > 0:
+                    ds_stats[i, :] = [np.min(values), np.max(values)] + list(np.percentile(values, [2, 98]))
+                else:
+                    ds_stats[i, :] = np.nan
+                prog_bar.update(i+1, suffix='{}/{}'.format(i+1, num_slice))
+            prog_bar.close()
+
+        f['overview'].attrs['FACTORS'] = ','.join(str(i) for i in factors)
+
+    readfile.clear_metadata_cache(fname)
+    if print_msg:
+        print('finished writing to {}'.format(fname))
+    return fname
+
+
+def write_pixel_major(fname, datasetNames=None, tile_size=16, print_msg=True):
+    """Write pixel-major (time-contiguous) companion of the 3D datasets into an existing HDF5 file.
+    The companion is detected and preferred by readfile.read() and the stack objects for
+    point / small box reading, so that the history of a pixel is one contiguous read.
+
+    File structure:
+        /pixel_major/{datasetName} : 3D array in size of (length, width, num),
+                                     chunked in (tile_size, tile_size, num)
+
+    Parameters: fname        : str, path of HDF5 file
+                datasetNames : list of str, 3D datasets to write the companion for, default is all
+                tile_size    : int, size of the chunk in space
+    Returns:    fname        : str
+    Example:    write_pixel_major('timeseries.h5')
+                write_pixel_major('ifgramStack.h5', datasetNames=['unwrapPhase', 'coherence'])
+    """
+    from mintpy.objects.stack import PIXEL_MAJOR_GROUP
+
+    atr = readfile.read_attribute(fname)
+    length, width = int(atr['LENGTH']), int(atr['WIDTH'])
+
+    with open_store(fname, 'a') as f:
+        ds_list = [i for i in readfile.get_dataset_list(fname) if f[i].ndim == 3]
+        if datasetNames:
+            ds_list = [i for i in ds_list if i in datasetNames or i.split('/')[-1] in datasetNames]
+        if not ds_list:
+            print('WARNING: no 3D dataset found in file {}, skip.'.format(fname))
+            return fname
+
+        for dsName in ds_list:
+            ds = f[dsName]
+            num = ds.shape[0]
+            pm_name = '{}/{}'.format(PIXEL_MAJOR_GROUP, dsName)
+            if pm_name in f:
+                del f[pm_name]
+
+            if print_msg:
+                print('create dataset /{} of {} in size of {}'.format(pm_name, ds.dtype, (length, width, num)))
+            ds_pm = f.create_dataset(pm_name,
+                                     shape=(length, width, num),
+                                     dtype=ds.dtype,
+                                     chunks=(min(tile_size, length), min(tile_size, width), num),
+                                     compression=ds.compression)
+
+            # transpose block by block, with one row of tiles each
+            num_block = int(np.ceil(length / tile_size))
+            prog_bar = ptime.progressBar(maxValue=num_block, print_msg=print_msg)
+            for i in range(num_block):
+                y0 = i * tile_size
+                y1 = min(y0 + tile_size, length)
+                ds_pm[y0:y1, :, :] = np.moveaxis(ds[:, y0:y1, :], 0, -1)
+                prog_bar.update(i+1, suffix='line {}/{}'.format(y1, length))
+            prog_bar.close()
+
+    readfile.clear_metadata_cache(fname)
+    if print_msg:
+        print('finished writing to {}'.format(fname))
+    return fname
+
+
+def remove_derived_datasets(f, dsName, print_msg=True):
+    """Remove the datasets derived from a dataset, i.e. its pixel-major companion, overviews and
+    their statistics, which are out of date once the dataset is re-written in place, e.g. by
+    reference_date.py. Readers fall back to the dataset itself; re-run write_overview() to
+    re-generate the overviews.
+
+    Parameters: f      : h5py.File / ZarrFile object, opened in r+ / a mode
+                dsName : str, name of the dataset re-written in place
+    Example:    with h5py.File('timeseries.h5', 'r+') as f:
+                    remove_derived_datasets(f, 'timeseries')
+                    f['timeseries'][:] = ts_data
+    """
+    from mintpy.objects.stack import PIXEL_MAJOR_GROUP
+
+    dsName = dsName.strip('/')
+    names = ['{}/{}'.format(PIXEL_MAJOR_GROUP, dsName)]
+    if 'overview' in f:
+        names += ['overview/{}/{}'.format(i, dsName) for i in f['overview'].keys()]
+
+    for name in names:
+        if name in f:
+            if print_msg:
+                print('remove out-of-date dataset /{}'.format(name))
+            del f[name]
+
+    # remove the overview groups left empty
+    if 'overview' in f:
+        for key in [i for i in f['overview'].keys() if len(f['overview'][i].keys()) == 0]:
+            del f['overview'][key]
+        if len(f['overview'].keys()) == 0:
+            del f['overview']
+    readfile.clear_metadata_cache(f.filename)
+    return
+
+
+def convert_store(src_file, dst_file, compression='auto', max_memory=2, print_msg=True):
+    """Convert between HDF5 file and Zarr directory store, e.g. timeseries.h5 <--> timeseries.zarr.
+    All groups, datasets and attributes are copied, dataset by dataset and block by block in the
+    1st dimension, so that the memory usage is bounded by max_memory.
+
+    Parameters: src_file    : str, input HDF5 file or Zarr store
+                dst_file    : str, output HDF5 file or Zarr store
+                compression : str, compression of the output datasets, None / lzf / gzip,
+                              auto for the same as the input datasets
+                max_memory  : float, maximum memory in GB for each block of data
+    Returns:    dst_file    : str
+    Example:    convert_store('timeseries.h5', 'timeseries.zarr')
+                convert_store('timeseries.zarr', 'timeseries.h5', compression='lzf')
+    """
+    if os.path.isfile(dst_file):
+        if print_msg:
+            print('delete exsited file: {}'.format(dst_file))
+        os.remove(dst_file)
+
+    if print_msg:
+        print('copy {} to {}'.format(src_file, dst_file))
+    with open_store(src_file, 'r') as fi, open_store(dst_file, 'w') as fo:
+        # list of groups and datasets
+        obj_list = []
+        fi.visititems(lambda name, obj: obj_list.append((name, obj)))
+
+        for name, obj in obj_list:
+            # groups, created in the visiting order, i.e. parent group first
+            if not isinstance(obj, DATASET_CLASSES):
+                fo.require_group(name)
+                fo[name].attrs.update(dict(obj.attrs))
+                continue
+
+            ds_comp = obj.compression if compression == 'auto' else compression
+            if print_msg:
+                print('create dataset /{:<30} of {:<10} in size of {:<20} with compression={}'.format(
+                    name, str(obj.dtype), str(obj.shape), ds_comp))
+            ds = fo.create_dataset(name,
+                                   shape=obj.shape,
+                                   dtype=obj.dtype,
+                                   chunks=obj.chunks if obj.chunks else True,
+                                   compression=ds_comp)
+
+            # copy block by block in the 1st dimension
+            if obj.ndim == 0:
+                ds[()] = obj[()]
+            else:
+                row_size = max(1, obj.size // max(obj.shape[0], 1)) * obj.dtype.itemsize
+                step = max(1, int(max_memory * 1024**3 / row_size))
+                for i0 in range(0, obj.shape[0], step):
+                    i1 = min(i0 + step, obj.shape[0])
+                    ds[i0:i1] = obj[i0:i1]
+            ds.attrs.update(dict(obj.attrs))
+
+        # root level metadata
+        fo.attrs.update(dict(fi.attrs))
+
+    readfile.clear_metadata_cache(dst_file)
+    if print_msg:
+        print('finished writing to {}'.format(dst_file))
+    return dst_file
+
+
 def write_roipac_rsc(metadata, out_file, update_mode=False, print_msg=False):
     """Write attribute dict into ROI_PAC .rsc file
     Inputs:
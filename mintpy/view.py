@@ -18,7 +18,6 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 # suppress UserWarning from matplotlib
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="matplotlib")
-import cartopy.crs as ccrs
 
 from mintpy.objects import (
     geometryDatasetNames,
@@ -35,10 +34,14 @@ from mintpy import subset, version
 
 
 ##################################################################################################
-PROJECTION_NAME2OBJ = {
-    'PlateCarree': ccrs.PlateCarree(),
-    'LambertConformal': ccrs.LambertConformal(),
-}
+def get_map_projection(name='PlateCarree'):
+    """Get the cartopy.crs projection object from its name, e.g. PlateCarree, LambertConformal.
+    cartopy is imported here instead of at the module level, because it is slow to import
+    and only needed for plotting in geo-coordinates.
+    """
+    import cartopy.crs as ccrs
+    return getattr(ccrs, name)()
+
 
 EXAMPLE = """example:
   view.py velocity.h5
@@ -195,17 +198,27 @@ def run_or_skip(inps):
 
 
 ##################################################################################################
-def check_multilook_input(pixel_box, row_num, col_num):
+def check_multilook_input(pixel_box, row_num, col_num, fig_size=None, fig_dpi=None, overview_factors=None):
     # Estimate multilook_num
     multilook_num=1
+    box_size = (pixel_box[2] - pixel_box[0]) * (pixel_box[3] - pixel_box[1])
+    pixel_num_per_figure = box_size * row_num * col_num
     if row_num * col_num > 10:
-        box_size = (pixel_box[2] - pixel_box[0]) * (pixel_box[3] - pixel_box[1])
-        pixel_num_per_figure = box_size * row_num * col_num
         if   pixel_num_per_figure > (8e6*160):   multilook_num=16;      ## 2k * 2k image with 120 subplots
         elif pixel_num_per_figure > (4e6*80) :   multilook_num=8;       ## 2k * 2k image with 80  subplots
         elif pixel_num_per_figure > (4e6*20) :   multilook_num=4;       ## 2k * 2k image with 40  subplots
         elif pixel_num_per_figure > (1e6*20) :   multilook_num=2;       ## 2k * 2k image with 40  subplots
 
+    # With overviews available, multilook to the screen resolution of each subplot
+    # in power of 2, as there is no gain in reading more pixels than could be displayed.
+    if overview_factors and fig_size and fig_dpi and row_num * col_num > 1:
+        num_pixel_x = fig_size[0] * fig_dpi / col_num
+        num_pixel_y = fig_size[1] * fig_dpi / row_num
+        ratio = min((pixel_box[2] - pixel_box[0]) / num_pixel_x,
+                    (pixel_box[3] - pixel_box[1]) / num_pixel_y)
+        if ratio >= 2:
+            multilook_num = max(multilook_num, 2 ** int(np.log2(ratio)))
+
     # Update multilook based on multilook_num
     if multilook_num > 1:
         multilook = True
@@ -472,7 +485,7 @@ def plot_slice(ax, data, metadata, inps=None):
                                    lalo_max_num=inps.lalo_max_num,
                                    font_size=inps.font_size,
                                    yrotate=inps.lat_label_direction,
-                                   projection=PROJECTION_NAME2OBJ[inps.map_projection],
+                                   projection=get_map_projection(inps.map_projection),
                                    print_msg=inps.print_msg)
             else:
                 ax.tick_params(which='both', direction='out', labelsize=inps.font_size,
@@ -883,6 +896,26 @@ def update_figure_setting(inps):
     return inps
 
 
+def read_overview_stats4figure(inps, metadata, dset_list):
+    """Read the statistics of the datasets to display, as saved along with the overviews,
+    to get the data / display range without going through the full resolution data.
+    Parameters: inps      : Namespace of input arguments
+                metadata  : dict, attributes of the file to display
+                dset_list : list of str, slice names to display
+    Returns:    stats     : 2D np.ndarray in size of (num_dset, 4) for min, max, p02, p98 in file unit,
+                            None if not available or not applicable, i.e. with subset, re-wrapping,
+                            or re-referencing in space / time for display.
+    """
+    box = (0, 0, int(metadata['WIDTH']), int(metadata['LENGTH']))
+    file_ref_yx = [int(metadata['REF_Y']), int(metadata['REF_X'])] if 'REF_Y' in metadata.keys() else None
+    if (inps.wrap or inps.ref_date
+            or tuple(inps.pix_box) != box
+            or (inps.ref_yx and list(inps.ref_yx) != file_ref_yx)
+            or (inps.key == 'ifgramStack' and inps.dsetFamilyList[0] == 'unwrapPhase' and inps.file_ref_yx)):
+        return None
+    return readfile.read_overview_stats(inps.file, dset_list)
+
+
 def read_data4figure(i_start, i_end, inps, metadata):
     """Read multiple datasets for one figure into 3D matrix based on i_start/end"""
     data = np.zeros((i_end - i_start,
@@ -890,11 +923,26 @@ def read_data4figure(i_start, i_end, inps, metadata):
                      inps.pix_box[2] - inps.pix_box[0]))
 
     # fast reading for single dataset type
+    ov_factor = 1
+    ov_stats = None
     if (len(inps.dsetFamilyList) == 1
             and inps.key in ['timeseries', 'giantTimeseries', 'ifgramStack', 'HDFEOS', 'geometry']):
         vprint('reading data as a 3D matrix ...')
         dset_list = [inps.dset[i] for i in range(i_start, i_end)]
-        data[:] = readfile.read(inps.file, datasetName=dset_list, box=inps.pix_box)[0]
+
+        # read from the overview with the largest factor that divides multilook_num
+        ov_factors = [i for i in inps.overview_factors if inps.multilook_num % i == 0]
+        if inps.multilook and ov_factors and not inps.wrap:
+            ov_factor = max(ov_factors)
+            vprint('reading from overview downsampled by {}'.format(ov_factor))
+            data = readfile.read_overview(inps.file, ov_factor, datasetName=dset_list, box=inps.pix_box)
+            data = data.reshape(-1, data.shape[-2], data.shape[-1]).astype(np.float64)
+        else:
+            data[:] = readfile.read(inps.file, datasetName=dset_list, box=inps.pix_box)[0]
+
+        # data statistics of the full resolution, as saved along with the overviews
+        if inps.overview_factors:
+            ov_stats = read_overview_stats4figure(inps, metadata, dset_list)
 
         if inps.key == 'ifgramStack':
             # reference pixel info in unwrapPhase
@@ -922,10 +970,15 @@ def read_data4figure(i_start, i_end, inps, metadata):
     # ref_date for timeseries
     if inps.ref_date:
         vprint('consider input reference date: '+inps.ref_date)
-        ref_data = readfile.read(inps.file,
-                                 datasetName=inps.ref_date,
-                                 box=inps.pix_box,
-                                 print_msg=False)[0]
+        if ov_factor > 1:
+            ref_data = readfile.read_overview(inps.file, ov_factor,
+                                              datasetName=inps.ref_date,
+                                              box=inps.pix_box)
+        else:
+            ref_data = readfile.read(inps.file,
+                                     datasetName=inps.ref_date,
+                                     box=inps.pix_box,
+                                     print_msg=False)[0]
         data -= ref_data
 
     # v/dlim, adjust data if all subplots share the same unit
@@ -938,18 +991,35 @@ def read_data4figure(i_start, i_end, inps, metadata):
             or all(d in inps.dsetFamilyList for d in ['horizontal', 'vertical'])
             or inps.dsetFamilyList == ['data','model','residual']
             or inps.key in ['velocity', 'timeseries', 'inversion']):
+        vlim = inps.vlim
         data, inps = update_data_with_plot_inps(data, metadata, inps)
-        if (not inps.vlim 
-                and not (inps.dsetFamilyList[0].startswith('unwrap') and not inps.file_ref_yx)
-                and inps.dsetFamilyList[0] not in ['bperp']):
-            data_mli = multilook_data(data, 10, 10)
-            inps.vlim = [np.nanmin(data_mli), np.nanmax(data_mli)]
-            del data_mli
-    inps.dlim = [np.nanmin(data), np.nanmax(data)]
+        robust_vlim = (not (inps.dsetFamilyList[0].startswith('unwrap') and not inps.file_ref_yx)
+                       and inps.dsetFamilyList[0] not in ['bperp'])
+        if ov_stats is not None and not inps.wrap:
+            # min / max and 2nd / 98th percentiles of the full resolution data
+            inps.dlim = sorted([np.nanmin(ov_stats[:, 0]) * inps.disp_scale,
+                                np.nanmax(ov_stats[:, 1]) * inps.disp_scale])
+            if not vlim:
+                cols = [2, 3] if robust_vlim else [0, 1]
+                inps.vlim = sorted([np.nanmin(ov_stats[:, cols[0]]) * inps.disp_scale,
+                                    np.nanmax(ov_stats[:, cols[1]]) * inps.disp_scale])
+            vprint('data    range from overview statistics: {} {}'.format(inps.dlim, inps.disp_unit))
+            vprint('display range from overview statistics: {} {}'.format(inps.vlim, inps.disp_unit))
+        else:
+            ov_stats = None
+            if not inps.vlim and robust_vlim:
+                data_mli = multilook_data(data, 10, 10)
+                inps.vlim = [np.nanmin(data_mli), np.nanmax(data_mli)]
+                del data_mli
+    else:
+        ov_stats = None
+    if ov_stats is None:
+        inps.dlim = [np.nanmin(data), np.nanmax(data)]
 
     # multilook
-    if inps.multilook:
-        data = multilook_data(data, inps.multilook_num, inps.multilook_num)
+    if inps.multilook and inps.multilook_num > ov_factor:
+        num = inps.multilook_num // ov_factor
+        data = multilook_data(data, num, num)
 
     # mask
     if inps.msk is not None:
@@ -1142,6 +1212,9 @@ def prepare4multi_subplots(inps, metadata):
     4) read and prepare DEM for background
     """
     inps.dsetFamilyList = sorted(list(set(i.split('-')[0] for i in inps.dset)))
+    inps.overview_factors = []
+    if len(inps.dsetFamilyList) == 1:
+        inps.overview_factors = readfile.get_overview_factors(inps.file, inps.dsetFamilyList[0])
 
     # Update multilook parameters with new num and col number
     if inps.multilook and inps.multilook_num == 1:
@@ -1153,7 +1226,10 @@ def prepare4multi_subplots(inps, metadata):
         if auto_multilook:
             inps.multilook, inps.multilook_num = check_multilook_input(inps.pix_box,
                                                                        inps.fig_row_num,
-                                                                       inps.fig_col_num)
+                                                                       inps.fig_col_num,
+                                                                       fig_size=inps.fig_size,
+                                                                       fig_dpi=inps.fig_dpi,
+                                                                       overview_factors=inps.overview_factors)
         if inps.msk is not None:
             inps.msk = multilook_data(inps.msk, inps.multilook_num, inps.multilook_num)
 
@@ -1356,7 +1432,7 @@ class viewer():
                     and self.fig_coord == 'geo' 
                     and coord_unit.startswith('deg') 
                     and self.lalo_label):
-                subplot_kw = dict(projection=PROJECTION_NAME2OBJ[self.map_projection])
+                subplot_kw = dict(projection=get_map_projection(self.map_projection))
             else:
                 subplot_kw = {}
 
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+# Test the robust (L1 / Huber) network inversion via IRLS in ifgram_inversion.py:
+#   on a weighted network of interferograms with coherence-consistent noise and
+#   injected 2*pi unwrapping errors, L1 / Huber should beat the weighted least squares (L2).
+
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+MINTPY_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MINTPY_HOME)
+from mintpy.objects import ifgramStack
+from mintpy import ifgram_inversion as ifginv
+
+
+#####################################################################################
+EXAMPLE = """example:
+  $MINTPY_HOME/test/test_ifgram_inversion_irls.py
+  $MINTPY_HOME/test/test_ifgram_inversion_irls.py  --num-pixel 5000 --seed 1
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Test the robust network inversion via IRLS.',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+    parser.add_argument('--num-date', dest='num_date', type=int, default=15,
+                        help='number of acquisitions (default: %(default)s).')
+    parser.add_argument('--num-pixel', dest='num_pixel', type=int, default=2000,
+                        help='number of pixels (default: %(default)s).')
+    parser.add_argument('--seed', dest='seed', type=int, default=0,
+                        help='seed of the random number generator (default: %(default)s).')
+    return parser
+
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+    return inps
+
+
+#####################################################################################
+def simulate_network(num_date=15, num_pixel=2000, num_look=20, num_conn=3, unw_err_ratio=0.05, seed=0):
+    """Simulate interferograms of a sequential network with coherence-consistent decorrelation noise
+    and 2*pi unwrapping errors.
+    Returns:    A / B / tbase_diff - design matrices and temporal baseline, as in ifgram_inversion.py
+                ifgram      - 2D np.ndarray in size of (num_ifgram, num_pixel)
+                weight_sqrt - 2D np.ndarray in size of (num_ifgram, num_pixel), from the 'var' weight function
+                ts_true     - 2D np.ndarray in size of (num_date - 1, num_pixel), phase time-series
+    """
+    rng = np.random.RandomState(seed)
+    date_list = ['2020{:02d}{:02d}'.format(i // 28 + 1, i % 28 + 1) for i in range(0, num_date * 12, 12)]
+    date12_list = ['{}_{}'.format(date_list[i], date_list[j])
+                   for i in range(num_date) for j in range(i + 1, min(i + 1 + num_conn, num_date))]
+    A, B = ifgramStack.get_design_matrix4timeseries(date12_list)[0:2]
+    tbase_diff = np.full((num_date - 1, 1), 12. / 365.25, dtype=np.float32)
+    num_ifgram = len(date12_list)
+
+    ts_true = np.cumsum(rng.randn(num_date - 1, num_pixel), axis=0)
+    coh = rng.uniform(0.2, 0.95, (num_ifgram, num_pixel))
+    noise_std = np.sqrt(ifginv.coherence2phase_variance(coh.copy(), num_look))
+    ifgram = np.dot(A, ts_true) + noise_std * rng.randn(num_ifgram, num_pixel)
+    unw_err = rng.choice([-1., 1.], ifgram.shape) * (rng.rand(*ifgram.shape) < unw_err_ratio)
+    ifgram += 2. * np.pi * unw_err
+
+    weight = ifginv.coherence2weight(coh.copy(), weight_func='var', L=num_look, print_msg=False)
+    return A, B, tbase_diff, ifgram, np.sqrt(weight), ts_true
+
+
+def test_robust_inversion(num_date=15, num_pixel=2000, seed=0):
+    """L1 / Huber inversion vs. weighted least squares on a network with unwrapping errors"""
+    A, B, tbase_diff, ifgram, weight_sqrt, ts_true = simulate_network(num_date, num_pixel, seed=seed)
+    rms = lambda ts: np.sqrt(np.mean(np.square(ts[1:, :] - ts_true)))
+
+    # L2 - weighted least squares
+    ts = np.zeros((num_date, num_pixel), np.float32)
+    for i in range(num_pixel):
+        ts[:, i] = ifginv.estimate_timeseries(A, B, tbase_diff,
+                                              ifgram=ifgram[:, i],
+                                              weight_sqrt=weight_sqrt[:, i],
+                                              min_norm_velocity=False)[0].flatten()
+    rms_l2 = rms(ts)
+    print('RMS of L2    solution: {:.3f} radian'.format(rms_l2))
+
+    # L1 / Huber - IRLS starting from the L2 solution
+    for residual_norm in ['L1', 'Huber']:
+        ts_rb = ifginv.estimate_timeseries_irls(A, B, tbase_diff,
+                                                ifgram=ifgram,
+                                                ts=ts.copy(),
+                                                weight_sqrt=weight_sqrt,
+                                                min_norm_velocity=False,
+                                                residual_norm=residual_norm,
+                                                print_msg=False)[0]
+        rms_rb = rms(ts_rb)
+        print('RMS of {:<5} solution: {:.3f} radian'.format(residual_norm, rms_rb))
+        if not rms_rb < rms_l2:
+            raise RuntimeError('{} inversion is NOT better than L2: RMS of {:.3f} vs {:.3f} radian'.format(
+                residual_norm, rms_rb, rms_l2))
+    return
+
+
+#####################################################################################
+def main(iargs=None):
+    start_time = time.time()
+    inps = cmd_line_parse(iargs)
+
+    test_robust_inversion(num_date=inps.num_date, num_pixel=inps.num_pixel, seed=inps.seed)
+    print('PASS testing L1 / Huber inversion beats L2 on weighted network with unwrapping errors')
+
+    print('Total time used: {:.1f} secs'.format(time.time() - start_time))
+    return
+
+
+#####################################################################################
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+# Test the start-up time of light-weight MintPy commands
+# using python -X importtime
+
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+
+MINTPY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mintpy')
+
+# command, time budget in seconds, modules that should NOT be imported
+TEST_LIST = [
+    ['info.py --help', 1.0, ['matplotlib', 'scipy', 'cartopy', 'pyproj', 'skimage', 'pyresample', 'cvxopt', 'dask']],
+    ['view.py --help', 3.0, ['cartopy', 'pyproj', 'skimage', 'pyresample', 'cvxopt', 'dask']],
+]
+
+
+#####################################################################################
+EXAMPLE = """example:
+  $MINTPY_HOME/test/test_import_time.py
+  $MINTPY_HOME/test/test_import_time.py  --scale 2
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Test the import time of MintPy commands.',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+    parser.add_argument('--scale', dest='scale', type=float, default=1.0,
+                        help='scale factor applied to the time budget of all commands, '
+                             'e.g. for slow file systems. Default: 1.0')
+    return parser
+
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+    return inps
+
+
+#####################################################################################
+def read_import_time(cmd):
+    """Run command with python -X importtime and return the total import time in seconds
+    and the list of imported top level packages.
+    """
+    cmd = cmd.split()
+    cmd = [sys.executable, '-X', 'importtime', os.path.join(MINTPY_DIR, cmd[0])] + cmd[1:]
+    # run with the mintpy package of this repo, as installed or not
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(MINTPY_DIR)] +
+                                        [i for i in env.get('PYTHONPATH', '').split(os.pathsep) if i])
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True, env=env)
+    out = proc.stderr
+    if proc.returncode != 0:
+        raise RuntimeError('command failed with exit code {}: {}\n{}'.format(
+            proc.returncode, ' '.join(cmd), out[-2000:]))
+
+    # line format: "import time: self [us] | cumulative | imported package"
+    total_time = 0.
+    pkg_list = []
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        cum_time, name = line.split('|')[1:3]
+        # top level entries only, to avoid double counting
+        if not name.startswith('  '):
+            total_time += float(cum_time) / 1e6
+        pkg = name.strip().split('.')[0]
+        if pkg not in pkg_list:
+            pkg_list.append(pkg)
+    if not pkg_list:
+        raise RuntimeError('no import time found in the output of: {}'.format(' '.join(cmd)))
+    return total_time, pkg_list
+
+
+def test_import_time(cmd, budget, skip_pkgs=[]):
+    total_time, pkg_list = read_import_time(cmd)
+    print('{:<20} import time: {:.3f} secs (budget: {:.3f} secs)'.format(cmd, total_time, budget))
+
+    heavy_pkgs = [i for i in skip_pkgs if i in pkg_list]
+    if heavy_pkgs:
+        raise RuntimeError('{} imports heavy package(s) at start-up: {}'.format(cmd, heavy_pkgs))
+    if total_time > budget:
+        raise RuntimeError('{} import time exceeds budget: {:.3f} > {:.3f} secs'.format(cmd, total_time, budget))
+    return
+
+
+#####################################################################################
+def main(iargs=None):
+    start_time = time.time()
+    inps = cmd_line_parse(iargs)
+
+    for cmd, budget, skip_pkgs in TEST_LIST:
+        test_import_time(cmd, budget * inps.scale, skip_pkgs)
+        print('PASS testing import time of: {}'.format(cmd))
+
+    print('Total time used: {:.1f} secs'.format(time.time() - start_time))
+    return
+
+
+#####################################################################################
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+# Author: Zhang Yunjun, 2020                               #
+############################################################
+# Test the Zarr directory store backend:
+#   1. HDF5 --> Zarr --> HDF5 round trip via convert_zarr.py
+#   2. blockwise.process_file() with parallel workers writing into a Zarr store
+
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+MINTPY_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MINTPY_HOME)
+from mintpy.objects import timeseries, open_store
+from mintpy.utils import readfile, blockwise
+from mintpy import convert_zarr
+
+
+#####################################################################################
+EXAMPLE = """example:
+  $MINTPY_HOME/test/test_zarr_store.py
+  $MINTPY_HOME/test/test_zarr_store.py  --dir ./zarr_test
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Test the Zarr store backend of MintPy (requires zarr>=2.11,<3).',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+    parser.add_argument('--dir', dest='work_dir',
+                        help='working directory for the test files, default is a temporary directory.')
+    return parser
+
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+    return inps
+
+
+#####################################################################################
+def write_test_timeseries(fname, num_date=12, length=90, width=70):
+    """Write a small time-series file with random data."""
+    date_list = ['2020{:02d}{:02d}'.format(i // 28 + 1, i % 28 + 1) for i in range(0, num_date * 12, 12)]
+    data = np.random.RandomState(0).randn(num_date, length, width).astype(np.float32)
+    data[:, 10:20, 30:40] = np.nan
+    meta = {'FILE_TYPE' : 'timeseries',
+            'UNIT'      : 'm',
+            'LENGTH'    : str(length),
+            'WIDTH'     : str(width),
+            'REF_DATE'  : date_list[0],
+            'REF_Y'     : '0',
+            'REF_X'     : '0'}
+    timeseries(fname).write2hdf5(data,
+                                 dates=np.array(date_list, dtype=np.string_),
+                                 bperp=np.linspace(-100, 100, num_date, dtype=np.float32),
+                                 metadata=meta)
+    return fname
+
+
+def compare_files(file1, file2):
+    """Check that all datasets and the root-level metadata of two files are the same."""
+    with open_store(file1, 'r') as f1, open_store(file2, 'r') as f2:
+        if sorted(f1.keys()) != sorted(f2.keys()):
+            raise RuntimeError('different datasets: {} vs {}'.format(list(f1.keys()), list(f2.keys())))
+        for key in f1.keys():
+            data1, data2 = f1[key][:], f2[key][:]
+            equal_nan = np.issubdtype(data1.dtype, np.floating)
+            if data1.dtype != data2.dtype or not np.array_equal(data1, data2, equal_nan=equal_nan):
+                raise RuntimeError('different dataset /{} in {} and {}'.format(key, file1, file2))
+
+    atr1 = readfile.read_attribute(file1)
+    atr2 = readfile.read_attribute(file2)
+    diff_keys = [i for i in atr1.keys() if i != 'FILE_PATH' and atr1[i] != atr2.get(i)]
+    if diff_keys:
+        raise RuntimeError('different metadata {} in {} and {}'.format(diff_keys, file1, file2))
+    return
+
+
+def test_round_trip(work_dir):
+    """HDF5 --> Zarr --> HDF5 via convert_zarr.py"""
+    h5_file = write_test_timeseries(os.path.join(work_dir, 'timeseries.h5'))
+    zarr_file = convert_zarr.main([h5_file])
+    out_file = convert_zarr.main([zarr_file, '-o', os.path.join(work_dir, 'timeseries_rt.h5')])
+
+    compare_files(h5_file, zarr_file)
+    compare_files(h5_file, out_file)
+    data = readfile.read(zarr_file, datasetName='20200113', box=(5, 6, 25, 36))[0]
+    if not np.array_equal(data, readfile.read(h5_file, datasetName='20200113', box=(5, 6, 25, 36))[0]):
+        raise RuntimeError('different block read from {} and {}'.format(zarr_file, h5_file))
+    return
+
+
+def test_parallel_write(work_dir):
+    """blockwise.process_file() with 2 workers writing into a Zarr store directly"""
+    h5_file = os.path.join(work_dir, 'timeseries.h5')
+    zarr_file = os.path.join(work_dir, 'timeseries_copy.zarr')
+    # small max_memory to have multiple blocks per worker
+    blockwise.process_file(h5_file, zarr_file, blockwise.run_copy,
+                           ref_file=h5_file, max_memory=1e-4, num_worker=2)
+    compare_files(h5_file, zarr_file)
+    return
+
+
+#####################################################################################
+def main(iargs=None):
+    start_time = time.time()
+    inps = cmd_line_parse(iargs)
+
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError('Cannot import zarr, which is required by this test!')
+
+    work_dir = inps.work_dir if inps.work_dir else tempfile.mkdtemp(prefix='mintpy_zarr_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        test_round_trip(work_dir)
+        print('PASS testing HDF5 --> Zarr --> HDF5 round trip')
+        test_parallel_write(work_dir)
+        print('PASS testing blockwise.process_file() with 2 workers writing into Zarr store')
+    finally:
+        if not inps.work_dir:
+            shutil.rmtree(work_dir)
+
+    print('Total time used: {:.1f} secs'.format(time.time() - start_time))
+    return
+
+
+#####################################################################################
+if __name__ == '__main__':
+    main()